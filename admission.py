@@ -0,0 +1,73 @@
+import threading
+import time
+
+
+class Admission:
+    """Admission control for kiosk requests (OTP submits, locker opens)
+
+    Work is keyed, e.g. ("otp", "123456") or ("locker", "3"). A key that is
+    already in flight is not started again, and its outcome is remembered
+    for ``recent_ttl`` seconds so a double tap after a fast completion is
+    answered without a second backend call or relay pulse. At most
+    ``max_pending`` items run at once; the rest are turned away rather than
+    queued behind a slow backend.
+
+    Work may carry an ``origin`` (the front-end that asked for it), so each
+    front-end can be shown only its own pending work. ``on_change(origin)``
+    is called whenever an origin's pending work changes.
+    """
+
+    def __init__(self, max_pending: int = 8, recent_ttl: float = 10, on_change=None):
+        self.max_pending = max_pending
+        self.recent_ttl = recent_ttl
+        self.on_change = on_change
+        self.lock = threading.Lock()
+        self.in_flight = {}   # key -> (label, started monotonic time, origin)
+        self.recent = {}      # key -> (result, expires monotonic time)
+
+    def begin(self, key, label: str, origin=None):
+        """Try to admit work; returns ("admitted" | "in_flight" | "recent" | "full", recent result or None)"""
+        now = time.monotonic()
+        with self.lock:
+            self.recent = {k: entry for k, entry in self.recent.items() if entry[1] > now}
+            if key in self.in_flight:
+                return "in_flight", None
+            if key in self.recent:
+                return "recent", self.recent[key][0]
+            if len(self.in_flight) >= self.max_pending:
+                return "full", None
+            self.in_flight[key] = (label, now, origin)
+        self.notify(origin)
+        return "admitted", None
+
+    def end(self, key, result: dict = None, remember: bool = False):
+        with self.lock:
+            entry = self.in_flight.pop(key, None)
+            if remember and result is not None:
+                self.recent[key] = (result, time.monotonic() + self.recent_ttl)
+        if entry is not None:
+            self.notify(entry[2])
+
+    def remember(self, key, result: dict, ttl: float = None):
+        """Record an outcome for a key that was never in flight (e.g. a locker opened)"""
+        with self.lock:
+            self.recent[key] = (result, time.monotonic() + (ttl or self.recent_ttl))
+
+    def state(self, origin=None):
+        """Pending work for display: {"pending": 2, "limit": 8, "items": ["Verifying code", ...]}
+
+        With an origin, only that origin's work is listed.
+        """
+        with self.lock:
+            items = sorted(
+                (item for item in self.in_flight.values() if origin is None or item[2] == origin),
+                key=lambda item: item[1]
+            )
+            return {"pending": len(items), "limit": self.max_pending, "items": [label for label, _, _ in items]}
+
+    def notify(self, origin=None):
+        if self.on_change:
+            try:
+                self.on_change(origin)
+            except Exception as e:
+                print(f"Admission state callback error: {str(e)}")
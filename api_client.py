@@ -0,0 +1,217 @@
+from concurrent.futures import ThreadPoolExecutor
+import socket
+import time
+from urllib.parse import urlsplit
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+# Per-endpoint timeouts in seconds
+DEFAULT_TIMEOUTS = {
+    "test": 5,
+    "otp_lookup": 5,
+    "otp_clear": 5,
+    "login": 5,
+    "access_history": 5,
+    "otp_sync": 10,
+    "replica_sync": 10,  # plus the long-poll wait
+    "probe": 3,
+}
+
+
+class PreloadedTlsAdapter(HTTPAdapter):
+    """HTTPAdapter whose TLS connections share one SSLContext
+
+    urllib3 otherwise builds a context and re-reads the CA bundle for every
+    new connection. Requests verified against ``cafile`` (the bundle the
+    context was loaded from) use the shared context instead; anything else
+    is verified as usual. Needs requests 2.32 or later, which builds pools
+    through build_connection_pool_key_attributes.
+    """
+
+    def __init__(self, ssl_context, cafile: str, **kwargs):
+        self.ssl_context = ssl_context
+        self.cafile = cafile
+        super().__init__(**kwargs)
+
+    def uses_context(self, url: str, verify):
+        return url.lower().startswith("https") and verify == self.cafile
+
+    def build_connection_pool_key_attributes(self, request, verify, cert=None):
+        host_params, pool_kwargs = super().build_connection_pool_key_attributes(request, verify, cert)
+        if self.uses_context(request.url, verify):
+            pool_kwargs.pop("ca_certs", None)
+            pool_kwargs.pop("ca_cert_dir", None)
+            pool_kwargs["ssl_context"] = self.ssl_context
+        return host_params, pool_kwargs
+
+    def cert_verify(self, conn, url, verify, cert):
+        super().cert_verify(conn, url, verify, cert)
+        if self.uses_context(url, verify) and getattr(conn, "conn_kw", {}).get("ssl_context") is self.ssl_context:
+            # The CA bundle is already loaded into the shared context
+            conn.ca_certs = None
+            conn.ca_cert_dir = None
+
+
+class KioskApiClient:
+    """Smart Palms backend client backed by a pooled keep-alive session
+
+    All calls share one requests.Session, so the TCP/TLS connection to the
+    backend is reused instead of re-handshaking per request. Use submit()
+    to run a call on the worker pool and get the result back through
+    ``dispatch`` (the kiosk passes a callable that runs on the Tk thread).
+    ``observe(endpoint, ok, elapsed)``, if set, is told the outcome of every
+    request; the connectivity monitor uses these as passive health checks.
+    """
+
+    def __init__(self, base_url: str, verify=True, timeouts=None, retries: int = 2,
+                 backoff_factor: float = 0.3, pool_size: int = 4, dispatch=None, observe=None):
+        self.base_url = base_url.rstrip("/")
+        self.observe = observe
+        self.last_success = None  # monotonic time of the last request the backend answered
+        self.pool_size = pool_size
+        self.verify = verify
+        self.timeouts = dict(DEFAULT_TIMEOUTS)
+        if timeouts:
+            self.timeouts.update(timeouts)
+        self.dispatch = dispatch or (lambda func, *args: func(*args))
+
+        # Connect failures are retried for every method because the request
+        # never reached the server; read/status retries are limited to
+        # idempotent methods so access-history POSTs are never duplicated.
+        self.retry = Retry(
+            total=retries,
+            connect=retries,
+            read=retries,
+            status=retries,
+            backoff_factor=backoff_factor,
+            status_forcelist=(502, 503, 504),
+            allowed_methods=frozenset({"GET", "HEAD", "PATCH"}),
+            raise_on_status=False,
+        )
+        adapter = HTTPAdapter(pool_connections=2, pool_maxsize=pool_size, max_retries=self.retry)
+
+        self.session = requests.Session()
+        self.session.headers.update({"Connection": "keep-alive"})
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+
+        self.executor = ThreadPoolExecutor(max_workers=pool_size, thread_name_prefix="api")
+
+    def use_tls_context(self, ssl_context):
+        """Open new HTTPS connections with a context already loaded with the verify bundle
+
+        Call before the first HTTPS request; connections pooled so far stay
+        with the previous adapter.
+        """
+        self.session.mount("https://", PreloadedTlsAdapter(
+            ssl_context, self.verify, pool_connections=2, pool_maxsize=self.pool_size, max_retries=self.retry
+        ))
+
+    def request(self, method: str, path: str, endpoint: str, **kwargs):
+        kwargs.setdefault("timeout", self.timeouts[endpoint])
+        kwargs.setdefault("verify", self.verify)
+        start = time.monotonic()
+        try:
+            response = self.session.request(method, f"{self.base_url}/{path.lstrip('/')}", **kwargs)
+        except (requests.exceptions.ConnectionError, requests.exceptions.Timeout):
+            self.report(endpoint, False, time.monotonic() - start)
+            raise
+        # A 5xx means the backend (or its gateway) is in trouble; 4xx are ours
+        self.report(endpoint, response.status_code < 500, time.monotonic() - start)
+        return response
+
+    def report(self, endpoint: str, ok: bool, elapsed: float):
+        if ok:
+            self.last_success = time.monotonic()
+        if self.observe:
+            try:
+                self.observe(endpoint, ok, elapsed)
+            except Exception as e:
+                print(f"Request observer error: {str(e)}")
+
+    def check_api(self):
+        return self.request("GET", "test", "test")
+
+    def head_check(self):
+        """HEAD /test: backend health without a response body"""
+        return self.request("HEAD", "test", "test")
+
+    def connect_check(self):
+        """Open and close a TCP connection to the backend; raises OSError if unreachable"""
+        parts = urlsplit(self.base_url)
+        port = parts.port or (443 if parts.scheme == "https" else 80)
+        socket.create_connection((parts.hostname, port), timeout=self.timeouts["probe"]).close()
+
+    def lookup_otp(self, otp: str):
+        return self.request("GET", otp, "otp_lookup")
+
+    def clear_otp(self, otp: str):
+        return self.request("PATCH", otp, "otp_clear")
+
+    def login(self, email: str, password: str):
+        return self.request("POST", "lockers/external", "login",
+                            json={"email": email, "password": password})
+
+    def login_with_token(self, token: str):
+        """Re-fetch an owner's lockers with the token issued at login"""
+        return self.request("POST", "lockers/external", "login",
+                            headers={"Authorization": f"Bearer {token}"}, json={})
+
+    def create_access_history(self, data: dict, idempotency_key: str = None):
+        # The key lets the backend drop duplicates when the outbox retries
+        headers = {"Idempotency-Key": idempotency_key} if idempotency_key else None
+        return self.request("POST", "access-history", "access_history", json=data, headers=headers)
+
+    def fetch_active_otps(self, kiosk_id: str):
+        """Active OTP -> locker assignments for this kiosk (offline cache sync)"""
+        return self.request("GET", "otps/active", "otp_sync", params={"kioskId": kiosk_id})
+
+    def fetch_kiosk_state(self, kiosk_id: str, since: str = None, etag: str = None, wait: int = None):
+        """Changes to this kiosk's lockers, subscriptions and OTPs since a cursor
+
+        A server that supports long-polling holds the request for up to
+        ``wait`` seconds until something changes (RFC 7240 Prefer: wait).
+        """
+        headers = {}
+        if etag:
+            headers["If-None-Match"] = etag
+        if wait:
+            headers["Prefer"] = f"wait={wait}"
+        return self.request(
+            "GET", f"kiosks/{kiosk_id}/state", "replica_sync",
+            params={"since": since} if since else None,
+            headers=headers,
+            timeout=self.timeouts["replica_sync"] + (wait or 0)
+        )
+
+    def probe(self, url: str, verify=None):
+        """GET an arbitrary URL (used for internet reachability checks)"""
+        return self.session.get(
+            url,
+            timeout=self.timeouts["probe"],
+            verify=self.verify if verify is None else verify,
+        )
+
+    def submit(self, func, *args, on_success=None, on_error=None):
+        """Run func(*args) on the worker pool and dispatch the outcome"""
+        def deliver(future):
+            try:
+                result = future.result()
+            except Exception as e:
+                if on_error:
+                    self.dispatch(on_error, e)
+                else:
+                    print(f"Background request error: {str(e)}")
+                return
+            if on_success:
+                self.dispatch(on_success, result)
+
+        future = self.executor.submit(func, *args)
+        future.add_done_callback(deliver)
+        return future
+
+    def close(self, wait: bool = False):
+        """Shut down the pool; wait=True lets queued background calls finish"""
+        self.executor.shutdown(wait=wait, cancel_futures=not wait)
+        self.session.close()
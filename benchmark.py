@@ -0,0 +1,390 @@
+"""Replayable benchmarks for the kiosk transaction paths
+
+Runs each scenario a fixed number of rounds against a stub API (with
+configurable latency and loss) and simulated relay banks, then compares
+the median and p90 of every scenario with recorded baselines:
+
+    python3 benchmark.py --save                  # record baselines
+    python3 benchmark.py                         # compare; exits 1 on a regression
+    python3 benchmark.py --latency 0.05 --loss 0.02 --only submit_api,login_50
+
+Scenarios go through the same KioskCore the front-end drives:
+
+    submit_cached     OTP found in the local cache, relay pulsed
+    submit_api        OTP verified with the backend, relay pulsed
+    submit_rejected   unknown OTP, rejected by the backend
+    login_<N>         owner login with N lockers (cold; login_cached is a repeat)
+    render_<screen>   screen transitions of the Tk front-end (needs a display)
+    connectivity_probe  one link read plus backend probe
+    uv_burst          a burst of UV cycles through the lamp limit, until all are off
+
+Baselines are machine-specific; record them on the device (or CI runner)
+the comparison will run on.
+"""
+import argparse
+import contextlib
+import io
+import json
+import math
+import os
+import platform
+import sys
+import tempfile
+import threading
+import time
+
+from stub_server import StubServer
+
+# Sim bank size; codes are spread over the lockers so back-to-back opens
+# never land on a relay that is still pulsing
+LOCKERS = 64
+
+
+def percentile(sorted_values, fraction: float):
+    if not sorted_values:
+        return float("nan")
+    index = min(len(sorted_values) - 1, int(round(fraction * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+def build_stub_data(rounds: int, locker_counts):
+    """Unique OTPs for both submit scenarios and one owner per (locker count, round)"""
+    numbers = [str(number) for number in range(1, LOCKERS + 1)]
+    otps = {f"{100000 + i}": numbers[i % LOCKERS] for i in range(rounds * 2)}
+    users = {}
+    for count in locker_counts:
+        lockers = [{
+            "id": f"locker-{number}",
+            "number": number,
+            "size": "small",
+            "subscription": {"status": "active", "expiresAt": "2030-01-01T00:00:00.000Z"},
+        } for number in (numbers * (count // LOCKERS + 1))[:count]]
+        for i in range(rounds):
+            users[f"bench{count}-{i}@example.com"] = {
+                "password": "password",
+                "name": f"Bench Owner {i}",
+                "lockers": lockers,
+            }
+    return {"otps": otps, "otp_expiry": "2030-01-01T00:00:00.000Z", "users": users}
+
+
+def write_topology(path: str):
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(f'[[bank]]\nname = "bench"\ndriver = "sim"\nchannels = {LOCKERS * 2}\n'
+                f'first_locker = 1\ncount = {LOCKERS}\n')
+
+
+def call(operation, *args, timeout: float = 30, **kwargs):
+    """Run a core operation and wait for its on_done; returns (seconds, result)"""
+    done = threading.Event()
+    results = []
+
+    def on_done(result):
+        results.append(result)
+        done.set()
+
+    started = time.perf_counter()
+    operation(*args, on_done=on_done, **kwargs)
+    if not done.wait(timeout):
+        return time.perf_counter() - started, {"status": "timeout"}
+    return time.perf_counter() - started, results[0]
+
+
+class Benchmark:
+    def __init__(self, server: StubServer, work_dir: str, rounds: int, warmup: int, locker_counts):
+        self.server = server
+        self.work_dir = work_dir
+        self.rounds = rounds
+        self.warmup = warmup
+        self.locker_counts = locker_counts
+        self.topology_path = os.path.join(work_dir, "topology.toml")
+        write_topology(self.topology_path)
+        self.core = None
+        self.errors = {}   # scenario -> unexpected outcomes
+        self.skipped = {}  # scenario -> reason
+
+    def start_core(self):
+        from kiosk_core import KioskCore
+
+        core = KioskCore(base_url=self.server.base_url, data_dir=os.path.join(self.work_dir, "core"),
+                         topology_path=self.topology_path)
+        os.makedirs(core.data_dir, exist_ok=True)
+        # Short pulses so rounds don't wait on relays or queue UV cycles
+        core.lock_pulse_duration = 0.001
+        core.uv_light_duration = 0.001
+        core.uv_scheduler.duration = 0.001
+
+        ready = threading.Event()
+        core.subscribe(lambda event, data: ready.set() if event in ("ready", "fatal") else None)
+        core.start()
+        if not ready.wait(30) or not core.ready:
+            raise RuntimeError(f"Kiosk core failed to start: {core.error}")
+
+        # The benchmark decides what is in the OTP cache, not the sync worker
+        core.replica_sync.stop()
+        core.connectivity.stop()
+        self.core = core
+
+    def repeat(self, name: str, run_round, expected: str):
+        """Time run_round(i) for warmup + rounds iterations; returns the timed samples"""
+        samples = []
+        for i in range(self.warmup + self.rounds):
+            elapsed, result = run_round(i)
+            if result.get("status") != expected:
+                self.errors[name] = self.errors.get(name, 0) + 1
+            elif i >= self.warmup:
+                samples.append(elapsed)
+        return samples
+
+    def submit_scenarios(self):
+        from otp_cache import parse_assignments
+
+        core = self.core
+        codes = list(self.server.data["otps"])
+        cached, remote = codes[:len(codes) // 2], codes[len(codes) // 2:]
+        with self.server.lock:
+            items = [{"code": code, "locker": {"number": self.server.data["otps"][code]}} for code in cached]
+        core.otp_cache.replace_all(parse_assignments(items))
+
+        return {
+            "submit_cached": self.repeat("submit_cached", lambda i: call(core.submit_otp, cached[i]), "opened"),
+            "submit_api": self.repeat("submit_api", lambda i: call(core.submit_otp, remote[i]), "opened"),
+            "submit_rejected": self.repeat(
+                "submit_rejected", lambda i: call(core.submit_otp, f"9{i:05d}"), "rejected"
+            ),
+        }
+
+    def login_scenarios(self):
+        core = self.core
+        results = {}
+        for count in self.locker_counts:
+            results[f"login_{count}"] = self.repeat(
+                f"login_{count}",
+                lambda i: call(core.login, f"bench{count}-{i}@example.com", "password"),
+                "ok"
+            )
+        # One owner logging in again and again; all but the first come from
+        # the session cache
+        count = self.locker_counts[-1]
+        results["login_cached"] = self.repeat(
+            "login_cached",
+            lambda i: call(core.login, f"bench{count}-0@example.com", "password"),
+            "ok"
+        )
+        return results
+
+    def connectivity_scenarios(self):
+        from connectivity import ConnectivityMonitor
+
+        monitor = ConnectivityMonitor(self.core.api, interface="lo")
+
+        def probe(_i):
+            started = time.perf_counter()
+            snapshot = monitor.probe()
+            return time.perf_counter() - started, {"status": "ok" if snapshot.online else "offline"}
+
+        return {"connectivity_probe": self.repeat("connectivity_probe", probe, "ok")}
+
+    def uv_scenarios(self, burst: int = 32, duration: float = 0.02, max_concurrent: int = 3):
+        from uv_scheduler import UVScheduler
+
+        idle = threading.Event()
+        scheduler = UVScheduler(
+            lambda channel, active: None,
+            {str(number): number for number in range(1, burst + 1)},
+            duration,
+            max_concurrent=max_concurrent,
+            on_change=lambda state: idle.set() if not state else None
+        )
+        # Lower bound: the lamp limit turns the burst into waves of cycles
+        ideal = math.ceil(burst / max_concurrent) * duration
+
+        def run_burst(_i):
+            idle.clear()
+            started = time.perf_counter()
+            for number in range(1, burst + 1):
+                scheduler.start(str(number))
+            if not idle.wait(ideal * 10 + 5):
+                return time.perf_counter() - started, {"status": "timeout"}
+            # Report the scheduling overhead on top of the lamp time itself
+            return time.perf_counter() - started - ideal, {"status": "done"}
+
+        try:
+            return {"uv_burst": self.repeat("uv_burst", run_burst, "done")}
+        finally:
+            scheduler.shutdown()
+
+    def render_scenarios(self):
+        try:
+            import tkinter as tk
+            root = tk.Tk()
+        except Exception as e:
+            self.skipped["render"] = f"no Tk display ({str(e).splitlines()[0]})"
+            return {}
+
+        # The front-end builds its own in-process core from the environment
+        os.environ.update({
+            "SMARTPALMS_API_URL": self.server.base_url,
+            "SMARTPALMS_DATA_DIR": os.path.join(self.work_dir, "ui"),
+            "SMARTPALMS_TOPOLOGY": self.topology_path,
+            "SMARTPALMS_METRICS_PORT": "",
+        })
+        os.environ.pop("SMARTPALMS_CORE_SOCKET", None)
+        os.makedirs(os.environ["SMARTPALMS_DATA_DIR"], exist_ok=True)
+        from main import LockerKioskApplication
+
+        app = LockerKioskApplication(root)
+        count = self.locker_counts[-1]
+        user_data = {
+            "user": {"name": "Bench Owner"},
+            "lockers": self.server.data["users"][f"bench{count}-0@example.com"]["lockers"],
+        }
+
+        def transition(show, *args):
+            def run_round(_i):
+                started = time.perf_counter()
+                show(*args)
+                return time.perf_counter() - started, {"status": "ok"}
+            return run_round
+
+        try:
+            results = {}
+            for name, show, args in (
+                ("render_login", app.show_login_screen, ()),
+                (f"render_lockers_{count}", app.show_lockers_screen, (user_data,)),
+                ("render_otp", app.show_otp_screen, ()),
+            ):
+                results[name] = self.repeat(name, transition(show, *args), "ok")
+            return results
+        finally:
+            app.watchdog.stop()
+            app.core.shutdown()
+            root.destroy()
+
+    def run(self, only=None):
+        groups = (
+            ("submit", self.submit_scenarios),
+            ("login", self.login_scenarios),
+            ("connectivity", self.connectivity_scenarios),
+            ("uv", self.uv_scenarios),
+            ("render", self.render_scenarios),
+        )
+        results = {}
+        self.start_core()
+        try:
+            for group, run_group in groups:
+                if only and not any(name.startswith(group) for name in only):
+                    continue
+                for name, samples in run_group().items():
+                    if not only or name in only or group in only:
+                        results[name] = samples
+        finally:
+            self.core.shutdown()
+        return results
+
+
+def summarize(samples):
+    values = sorted(samples)
+    return {
+        "rounds": len(values),
+        "median_ms": round(percentile(values, 0.5) * 1000, 3),
+        "p90_ms": round(percentile(values, 0.9) * 1000, 3),
+    }
+
+
+def load_baselines(path: str):
+    try:
+        with open(path, encoding="utf-8") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+
+def compare(summary: dict, baselines: dict, tolerance: float, min_delta_ms: float):
+    """Print each scenario against its baseline; returns the names that regressed"""
+    regressions = []
+    recorded = (baselines or {}).get("results", {})
+    print(f"{'scenario':24} {'rounds':>6} {'median':>10} {'p90':>10} {'baseline':>10} {'change':>8}")
+    for name, result in summary.items():
+        line = f"{name:24} {result['rounds']:>6} {result['median_ms']:>8.2f}ms {result['p90_ms']:>8.2f}ms"
+        baseline = recorded.get(name)
+        if baseline and result["rounds"]:
+            delta = result["median_ms"] - baseline["median_ms"]
+            change = delta / baseline["median_ms"] if baseline["median_ms"] else 0.0
+            line += f" {baseline['median_ms']:>8.2f}ms {change:>+7.0%}"
+            # Sub-millisecond wobble on fast paths is noise, not a regression
+            if change > tolerance and delta > min_delta_ms:
+                line += "  REGRESSION"
+                regressions.append(name)
+            elif change < -tolerance and -delta > min_delta_ms:
+                line += "  faster"
+        print(line)
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark kiosk transaction paths against recorded baselines")
+    parser.add_argument("--rounds", type=int, default=50)
+    parser.add_argument("--warmup", type=int, default=3, help="untimed rounds before each scenario")
+    parser.add_argument("--lockers", default="1,10,50", help="locker counts for the login scenarios")
+    parser.add_argument("--latency", type=float, default=0.0, help="stub API latency per request (s)")
+    parser.add_argument("--jitter", type=float, default=0.0)
+    parser.add_argument("--loss", type=float, default=0.0)
+    parser.add_argument("--only", default="", help="comma-separated scenarios or groups (submit, login, ...)")
+    parser.add_argument("--baseline", default="benchmarks.json")
+    parser.add_argument("--save", action="store_true", help="record this run as the new baseline")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="allowed median slowdown (0.2 = 20%%)")
+    parser.add_argument("--min-delta-ms", type=float, default=1.0, help="ignore slowdowns smaller than this")
+    parser.add_argument("--verbose", action="store_true", help="show the kiosk's own log output")
+    args = parser.parse_args()
+
+    locker_counts = [int(count) for count in args.lockers.split(",")]
+    only = {name.strip() for name in args.only.split(",") if name.strip()}
+    settings = {"rounds": args.rounds, "latency": args.latency, "jitter": args.jitter, "loss": args.loss,
+                "lockers": locker_counts}
+
+    # The metrics endpoint would clash with a kiosk running on the same machine
+    os.environ["SMARTPALMS_METRICS_PORT"] = ""
+    data = build_stub_data(args.warmup + args.rounds, locker_counts)
+    server = StubServer(data=data, latency=args.latency, jitter=args.jitter, loss=args.loss).start()
+    try:
+        with tempfile.TemporaryDirectory(prefix="smartpalms-bench-") as work_dir:
+            bench = Benchmark(server, work_dir, args.rounds, args.warmup, locker_counts)
+            log = contextlib.nullcontext() if args.verbose else contextlib.redirect_stdout(io.StringIO())
+            with log:
+                results = bench.run(only)
+    finally:
+        server.stop()
+
+    summary = {name: summarize(samples) for name, samples in results.items()}
+    baselines = load_baselines(args.baseline)
+    if baselines and baselines.get("settings") != settings:
+        print(f"Warning: baseline was recorded with {baselines.get('settings')}, this run uses {settings}")
+    regressions = compare(summary, None if args.save else baselines, args.tolerance, args.min_delta_ms)
+
+    for name, count in sorted(bench.errors.items()):
+        if name not in results:
+            continue  # ran as part of its group but not selected
+        print(f"{name}: {count} rounds with an unexpected outcome (not timed)")
+    for name, reason in bench.skipped.items():
+        print(f"{name}: skipped, {reason}")
+
+    if args.save:
+        with open(args.baseline, "w", encoding="utf-8") as f:
+            json.dump({
+                "recorded_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+                "machine": f"{platform.node()} {platform.machine()}",
+                "python": platform.python_version(),
+                "settings": settings,
+                "results": summary,
+            }, f, indent=2)
+        print(f"Baseline saved to {args.baseline}")
+    elif regressions:
+        print(f"Regressions: {', '.join(regressions)}")
+        sys.exit(1)
+    elif baselines is None:
+        print(f"No baseline at {args.baseline}; run with --save to record one")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,217 @@
+import threading
+import time
+from dataclasses import dataclass, replace
+from typing import Optional
+
+from metrics import CONNECTIVITY_PROBE, REGISTRY
+
+PASSIVE_SIGNALS = REGISTRY.counter(
+    "kiosk_connectivity_passive_signals_total", "Backend request outcomes used as health signals", ("result",)
+)
+
+
+@dataclass(frozen=True)
+class HealthSnapshot:
+    """Point-in-time view of the kiosk's connectivity"""
+
+    link_up: bool = True
+    backend_ok: bool = True
+    last_link_up: Optional[float] = None      # wall-clock time of last successful link read
+    last_backend_ok: Optional[float] = None   # wall-clock time of last successful backend probe
+    rtt: Optional[float] = None               # last backend probe round-trip in seconds
+    checked_at: Optional[float] = None
+
+    @property
+    def online(self):
+        return self.link_up and self.backend_ok
+
+    @property
+    def message(self):
+        """User-facing error for the status bar, or "" when healthy"""
+        if not self.link_up:
+            return "No internet connection. Please check your WiFi settings."
+        if not self.backend_ok:
+            return "Cannot connect to server. Please try again later."
+        return ""
+
+
+def read_link_state(interface: str):
+    """Read the interface state from sysfs instead of forking iwconfig"""
+    base = f"/sys/class/net/{interface}"
+    try:
+        with open(f"{base}/operstate") as f:
+            state = f.read().strip()
+    except OSError:
+        return False  # interface not present
+
+    if state == "up":
+        return True
+    if state == "unknown":
+        # Some drivers never report operstate; fall back to carrier
+        try:
+            with open(f"{base}/carrier") as f:
+                return f.read().strip() == "1"
+        except OSError:
+            return False
+    return False
+
+
+class ConnectivityMonitor:
+    """Background thread that keeps a cached HealthSnapshot up to date
+
+    Readers call snapshot() and never block on the network. on_change is
+    called from the monitor thread only when link or backend state flips,
+    not on every probe.
+
+    Probing is adaptive. While healthy, the interval doubles after each good
+    probe, from ``min_interval`` up to ``max_interval``. A failure drops it
+    back to ``min_interval`` so an outage is confirmed quickly. During a
+    long outage it backs off again, up to ``outage_interval``. Real backend
+    requests reported through observe() count as health signals: a success
+    postpones the next probe (and ends an outage at once), and a failure
+    triggers a probe right away.
+
+    The probe itself is a HEAD request on the API client's keep-alive
+    session, or a bare TCP connect to the backend with ``probe_mode="tcp"``.
+    Either way no response body is transferred.
+    """
+
+    def __init__(self, api, interface: str = "wlan0", min_interval: float = 5, max_interval: float = 300,
+                 outage_interval: float = 60, probe_mode: str = "head", on_change=None):
+        if probe_mode not in ("head", "tcp"):
+            raise ValueError(f"Unknown probe mode: {probe_mode}")
+        self.api = api
+        self.interface = interface
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.outage_interval = outage_interval
+        self.probe_mode = probe_mode
+        self.on_change = on_change
+
+        self.lock = threading.Lock()
+        self.current = HealthSnapshot()
+        self.interval = min_interval
+        self.next_probe = 0.0  # monotonic deadline of the next active probe
+        self.wake = threading.Event()
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self.run, name="connectivity-monitor", daemon=True)
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.stopped.set()
+        self.wake.set()
+
+    def snapshot(self):
+        with self.lock:
+            return self.current
+
+    def check_now(self):
+        """Ask the monitor to re-probe immediately instead of waiting for the interval"""
+        self.wake.set()
+
+    def observe(self, endpoint: str, ok: bool, elapsed: float):
+        """Passive health signal from a real backend request; called on any thread"""
+        if endpoint in ("test", "probe"):
+            return  # our own probes
+        PASSIVE_SIGNALS.inc(result="ok" if ok else "failed")
+        if not ok:
+            # Something went wrong on a real request: find out now
+            with self.lock:
+                self.interval = self.min_interval
+            self.check_now()
+            return
+
+        with self.lock:
+            previous = self.current
+            self.next_probe = time.monotonic() + self.interval
+        if not previous.online:
+            # Traffic is getting through again; don't wait for the next probe
+            now = time.time()
+            self.update(replace(previous, link_up=True, backend_ok=True, last_link_up=now,
+                                last_backend_ok=now, checked_at=now))
+
+    def run(self):
+        while not self.stopped.is_set():
+            self.wake.clear()
+            try:
+                with CONNECTIVITY_PROBE.time():
+                    snapshot = self.probe()
+                self.adapt(snapshot)
+                self.update(snapshot)
+            except Exception as e:
+                print(f"Connectivity monitor error: {str(e)}")
+                REGISTRY.error("connectivity", e)
+            self.wait_for_next_probe()
+
+    def wait_for_next_probe(self):
+        # observe() may push the deadline out while we wait
+        while not self.stopped.is_set():
+            with self.lock:
+                remaining = self.next_probe - time.monotonic()
+            if remaining <= 0 or self.wake.wait(remaining):
+                return
+
+    def adapt(self, snapshot: HealthSnapshot):
+        """Pick the interval to the next probe from this probe's outcome"""
+        with self.lock:
+            was_online = self.current.online
+            if snapshot.online:
+                # Back off while healthy; start from the bottom after an outage
+                self.interval = min(self.interval * 2, self.max_interval) if was_online else self.min_interval
+            else:
+                # Probe again soon to confirm, then back off through a long outage
+                self.interval = min(self.interval * 2, self.outage_interval) if not was_online else self.min_interval
+            self.next_probe = time.monotonic() + self.interval
+
+    def probe(self):
+        previous = self.snapshot()
+        now = time.time()
+
+        link_up = read_link_state(self.interface)
+        backend_ok = False
+        rtt = previous.rtt
+        if link_up:
+            start = time.monotonic()
+            try:
+                backend_ok = self.probe_backend()
+            except Exception as e:
+                print(f"API check error: {str(e)}")
+                REGISTRY.error("connectivity", e)
+            if backend_ok:
+                rtt = time.monotonic() - start
+
+        return HealthSnapshot(
+            link_up=link_up,
+            backend_ok=backend_ok,
+            last_link_up=now if link_up else previous.last_link_up,
+            last_backend_ok=now if backend_ok else previous.last_backend_ok,
+            rtt=rtt,
+            checked_at=now,
+        )
+
+    def probe_backend(self):
+        if self.probe_mode == "tcp":
+            self.api.connect_check()
+            return True
+        status = self.api.head_check().status_code
+        if status in (405, 501):
+            # Backend doesn't answer HEAD; any response still proves it is up
+            print("Backend does not support HEAD probes; using TCP connect probes")
+            self.probe_mode = "tcp"
+            return True
+        return status == 200
+
+    def update(self, snapshot: HealthSnapshot):
+        with self.lock:
+            previous = self.current
+            self.current = snapshot
+
+        changed = (previous.link_up, previous.backend_ok) != (snapshot.link_up, snapshot.backend_ok)
+        if changed:
+            print(f"Connectivity changed: link={'up' if snapshot.link_up else 'down'}, "
+                  f"backend={'ok' if snapshot.backend_ok else 'unreachable'}")
+            if self.on_change:
+                self.on_change(snapshot)
@@ -0,0 +1,496 @@
+"""Local control-plane API for operators
+
+An asyncio HTTP and WebSocket server on localhost, run by the KioskCore,
+so operators can open a stuck locker or check relay and UV state over an
+SSH tunnel instead of phoning the site. Opens go through the same
+non-blocking relay path as the touch screen:
+
+    GET  /health               connectivity snapshot
+    GET  /state                relay state per locker, UV lamps, pending work
+    GET  /metrics              Prometheus text (same as the metrics exporter)
+    POST /lockers/<n>/open     pulse a locker's lock relay
+    POST /uv/<n>/start         start a UV cycle ({"duration": seconds} optional)
+    POST /uv/<n>/stop          turn a lamp off or drop its queued cycle
+    GET  /events               WebSocket: current state, then every change
+
+Every request needs ``Authorization: Bearer <token>``. Only the /events
+upgrade also takes ``?token=``, for WebSocket clients that can't set
+headers; elsewhere it would end up in shell history and logs. The token is
+SMARTPALMS_CONTROL_TOKEN, or one generated on first start and kept in
+``control_token`` in the data directory. The module doubles as a client:
+
+    python3 control_api.py state
+    python3 control_api.py open 3
+    python3 control_api.py watch
+"""
+import asyncio
+import base64
+import hashlib
+import hmac
+import json
+import os
+import secrets
+import socket
+import threading
+from urllib.parse import parse_qs, urlsplit
+
+from metrics import REGISTRY
+
+WEBSOCKET_GUID = "258EAFA5-E914-47DA-95CA-C5AB0DC85B11"
+MAX_BODY = 64 * 1024
+MAX_FRAME = 64 * 1024
+
+# Core events forwarded to WebSocket subscribers ("session" carries owner data)
+STREAMED_EVENTS = ("ready", "connectivity", "fatal", "uv", "admission", "locker")
+
+# Operation outcome -> HTTP status
+RESULT_STATUS = {
+    "opened": 200,
+    "already_open": 409,
+    "invalid_locker": 404,
+    "busy": 429,
+    "starting": 503,
+    "error": 500,
+}
+
+REASONS = {200: "OK", 101: "Switching Protocols", 400: "Bad Request", 401: "Unauthorized",
+           404: "Not Found", 405: "Method Not Allowed", 409: "Conflict", 413: "Payload Too Large",
+           429: "Too Many Requests", 500: "Internal Server Error", 503: "Service Unavailable"}
+
+
+def load_or_create_token(path: str):
+    """Read the control token, creating a random one (mode 0600) on first use"""
+    try:
+        with open(path, encoding="utf-8") as f:
+            token = f.read().strip()
+        if token:
+            return token
+    except FileNotFoundError:
+        pass
+    token = secrets.token_urlsafe(24)
+    fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+    with os.fdopen(fd, "w", encoding="utf-8") as f:
+        f.write(token + "\n")
+    return token
+
+
+def encode_frame(payload: bytes, opcode: int = 0x1, mask: bool = False):
+    """One final WebSocket frame; clients must mask, servers must not"""
+    length = len(payload)
+    header = bytes([0x80 | opcode])
+    mask_bit = 0x80 if mask else 0
+    if length < 126:
+        header += bytes([mask_bit | length])
+    elif length < 65536:
+        header += bytes([mask_bit | 126]) + length.to_bytes(2, "big")
+    else:
+        header += bytes([mask_bit | 127]) + length.to_bytes(8, "big")
+    if mask:
+        key = os.urandom(4)
+        payload = bytes(byte ^ key[i % 4] for i, byte in enumerate(payload))
+        header += key
+    return header + payload
+
+
+def unmask(payload: bytes, key: bytes):
+    return bytes(byte ^ key[i % 4] for i, byte in enumerate(payload))
+
+
+def websocket_accept(key: str):
+    return base64.b64encode(hashlib.sha1((key + WEBSOCKET_GUID).encode()).digest()).decode()
+
+
+class HttpError(Exception):
+    def __init__(self, status: int, message: str):
+        super().__init__(message)
+        self.status = status
+
+
+class ControlApi:
+    """Serves the control API from its own asyncio loop thread
+
+    Core callbacks and events arrive on core threads and are handed to
+    the loop with call_soon_threadsafe.
+    """
+
+    def __init__(self, core, token: str, host: str = "127.0.0.1", port: int = 9110,
+                 max_subscribers: int = 8, queue_size: int = 256):
+        self.core = core
+        self.token = token
+        self.host = host
+        self.port = port
+        self.max_subscribers = max_subscribers
+        self.queue_size = queue_size
+        self.subscribers = set()
+        self.loop = None
+        self.server = None
+        self.started = threading.Event()
+        self.thread = threading.Thread(target=self.run, name="control-api", daemon=True)
+
+    def start(self):
+        self.thread.start()
+        self.started.wait(5)
+        return self
+
+    def stop(self):
+        if self.loop and self.loop.is_running():
+            self.loop.call_soon_threadsafe(self.loop.stop)
+        if self.thread.is_alive():
+            self.thread.join(timeout=2)
+
+    def run(self):
+        self.loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self.loop)
+        try:
+            self.server = self.loop.run_until_complete(
+                asyncio.start_server(self.handle, self.host, self.port, limit=MAX_BODY)
+            )
+        except OSError as e:
+            print(f"Control API unavailable: {str(e)}")
+            self.started.set()
+            return
+        self.port = self.server.sockets[0].getsockname()[1]
+        self.started.set()
+        unsubscribe = self.core.subscribe(self.forward)
+        try:
+            self.loop.run_forever()
+        finally:
+            unsubscribe()
+            self.server.close()
+            # Let event streams send their close frame and requests finish
+            for subscriber in list(self.subscribers):
+                self.drop(subscriber)
+            pending = asyncio.all_tasks(self.loop)
+            if pending:
+                _, still_running = self.loop.run_until_complete(asyncio.wait(pending, timeout=1))
+                for task in still_running:
+                    task.cancel()
+                if still_running:
+                    self.loop.run_until_complete(asyncio.wait(still_running, timeout=1))
+            self.loop.close()
+
+    # Core events -> WebSocket subscribers
+
+    def forward(self, event: str, data):
+        if event in STREAMED_EVENTS and self.subscribers:
+            if event == "admission":
+                data = self.core.admission.state()  # kiosk-wide, not one front-end's share
+            self.loop.call_soon_threadsafe(self.broadcast, {"event": event, "data": data})
+
+    def broadcast(self, message: dict):
+        for subscriber in list(self.subscribers):
+            try:
+                subscriber.put_nowait(message)
+            except asyncio.QueueFull:
+                # A client that can't keep up is dropped rather than buffered
+                self.drop(subscriber)
+
+    def drop(self, subscriber):
+        """End a subscriber's stream: None tells it to close"""
+        self.subscribers.discard(subscriber)
+        while not subscriber.empty():
+            subscriber.get_nowait()
+        subscriber.put_nowait(None)
+
+    def state(self):
+        return {
+            "health": self.core.health(),
+            "lockers": self.core.relay_state(),
+            "uv": self.core.uv_state(),
+            "admission": self.core.admission.state(),
+        }
+
+    # HTTP
+
+    async def handle(self, reader, writer):
+        try:
+            method, path, query, headers, body = await self.read_request(reader)
+            upgrade = path == "/events" and headers.get("upgrade", "").lower() == "websocket"
+            if not self.authorized(headers, query if upgrade else {}):
+                raise HttpError(401, "Missing or invalid token")
+            if upgrade:
+                await self.stream(reader, writer, headers)
+                return
+            status, payload = await self.route(method, path, body)
+            self.respond(writer, status, payload)
+        except HttpError as e:
+            self.respond(writer, e.status, {"status": "error", "message": str(e)})
+        except (asyncio.IncompleteReadError, asyncio.LimitOverrunError, asyncio.TimeoutError, ConnectionError):
+            pass
+        except Exception as e:
+            print(f"Control API error: {str(e)}")
+            REGISTRY.error("control_api", e)
+            self.respond(writer, 500, {"status": "error", "message": "Internal error"})
+        finally:
+            try:
+                await writer.drain()
+                writer.close()
+            except (ConnectionError, RuntimeError):
+                pass
+
+    async def read_request(self, reader):
+        head = await asyncio.wait_for(reader.readuntil(b"\r\n\r\n"), timeout=10)
+        lines = head.decode("latin-1").split("\r\n")
+        try:
+            method, target, _version = lines[0].split(" ", 2)
+        except ValueError:
+            raise HttpError(400, "Malformed request line")
+        headers = {}
+        for line in lines[1:]:
+            if ":" in line:
+                name, value = line.split(":", 1)
+                headers[name.strip().lower()] = value.strip()
+
+        try:
+            length = int(headers.get("content-length") or 0)
+        except ValueError:
+            raise HttpError(400, "Invalid Content-Length")
+        if length < 0:
+            raise HttpError(400, "Invalid Content-Length")
+        if length > MAX_BODY:
+            raise HttpError(413, "Request body too large")
+        body = await asyncio.wait_for(reader.readexactly(length), timeout=10) if length else b""
+        url = urlsplit(target)
+        return method.upper(), url.path.rstrip("/") or "/", parse_qs(url.query), headers, body
+
+    def authorized(self, headers: dict, query: dict):
+        supplied = headers.get("authorization", "")
+        supplied = supplied[len("Bearer "):] if supplied.startswith("Bearer ") else query.get("token", [""])[0]
+        return bool(supplied) and hmac.compare_digest(supplied.encode(), self.token.encode())
+
+    def respond(self, writer, status: int, payload):
+        if isinstance(payload, str):
+            data, content_type = payload.encode(), "text/plain; version=0.0.4"
+        else:
+            data, content_type = json.dumps(payload).encode(), "application/json"
+        writer.write(
+            f"HTTP/1.1 {status} {REASONS.get(status, '')}\r\n"
+            f"Content-Type: {content_type}\r\nContent-Length: {len(data)}\r\nConnection: close\r\n\r\n".encode()
+            + data
+        )
+
+    async def route(self, method: str, path: str, body: bytes):
+        parts = path.strip("/").split("/")
+        if method == "GET" and path == "/health":
+            return 200, self.core.health()
+        if method == "GET" and path == "/state":
+            return 200, self.state()
+        if method == "GET" and path == "/metrics":
+            return 200, REGISTRY.render_prometheus()
+
+        if len(parts) == 3 and parts[0] == "lockers" and parts[2] == "open":
+            self.require_post(method)
+            result = await self.call(self.core.open_remote_locker, parts[1])
+            return RESULT_STATUS.get(result["status"], 200), result
+
+        if len(parts) == 3 and parts[0] == "uv" and parts[2] in ("start", "stop"):
+            self.require_post(method)
+            locker_number = parts[1]
+            if parts[2] == "start":
+                duration = self.parse_body(body).get("duration")
+                valid = isinstance(duration, (int, float)) and not isinstance(duration, bool)
+                if duration is not None and not (valid and 0 < duration <= 3600):
+                    raise HttpError(400, "duration must be between 0 and 3600 seconds")
+                result = self.core.start_uv_light(locker_number, duration)
+                if result is None:
+                    raise HttpError(404, f"Locker {locker_number} has no UV lamp")
+                return 200, {"status": result, "locker": locker_number}
+            stopped = self.core.stop_uv_light(locker_number)
+            return 200, {"status": "stopped" if stopped else "idle", "locker": locker_number}
+
+        raise HttpError(404, f"No route for {method} {path}")
+
+    def require_post(self, method: str):
+        if method != "POST":
+            raise HttpError(405, "Use POST")
+
+    def parse_body(self, body: bytes):
+        if not body:
+            return {}
+        try:
+            data = json.loads(body)
+        except ValueError:
+            raise HttpError(400, "Body must be JSON")
+        if not isinstance(data, dict):
+            raise HttpError(400, "Body must be a JSON object")
+        return data
+
+    async def call(self, operation, *args):
+        """Run a core operation and await its on_done callback"""
+        future = self.loop.create_future()
+
+        def on_done(result):
+            self.loop.call_soon_threadsafe(lambda: future.done() or future.set_result(result))
+
+        operation(*args, on_done=on_done)
+        return await asyncio.wait_for(future, timeout=30)
+
+    # WebSocket
+
+    async def stream(self, reader, writer, headers: dict):
+        key = headers.get("sec-websocket-key")
+        if not key:
+            raise HttpError(400, "Missing Sec-WebSocket-Key")
+        if len(self.subscribers) >= self.max_subscribers:
+            raise HttpError(429, "Too many subscribers")
+        writer.write(
+            "HTTP/1.1 101 Switching Protocols\r\nUpgrade: websocket\r\nConnection: Upgrade\r\n"
+            f"Sec-WebSocket-Accept: {websocket_accept(key)}\r\n\r\n".encode()
+        )
+
+        queue = asyncio.Queue(maxsize=self.queue_size)
+        queue.put_nowait({"event": "state", "data": self.state()})
+        self.subscribers.add(queue)
+        receiver = asyncio.ensure_future(self.receive(reader, writer))
+        try:
+            while not receiver.done():
+                getter = asyncio.ensure_future(queue.get())
+                await asyncio.wait({getter, receiver}, return_when=asyncio.FIRST_COMPLETED)
+                if not getter.done():
+                    getter.cancel()
+                    break
+                message = getter.result()
+                if message is None:
+                    break  # dropped for falling behind
+                writer.write(encode_frame(json.dumps(message, separators=(",", ":")).encode()))
+                await writer.drain()
+            writer.write(encode_frame(b"", opcode=0x8))
+        finally:
+            self.subscribers.discard(queue)
+            receiver.cancel()
+
+    async def receive(self, reader, writer):
+        """Answer pings and return when the client closes"""
+        while True:
+            first, second = await reader.readexactly(2)
+            opcode, length = first & 0x0F, second & 0x7F
+            if length == 126:
+                length = int.from_bytes(await reader.readexactly(2), "big")
+            elif length == 127:
+                length = int.from_bytes(await reader.readexactly(8), "big")
+            if length > MAX_FRAME:
+                return
+            key = await reader.readexactly(4) if second & 0x80 else None
+            payload = await reader.readexactly(length)
+            if key:
+                payload = unmask(payload, key)
+            if opcode == 0x8:
+                return
+            if opcode == 0x9:
+                writer.write(encode_frame(payload, opcode=0xA))
+
+
+class ControlClient:
+    """Loopback client for scripts, checks and the command line"""
+
+    def __init__(self, token: str, host: str = "127.0.0.1", port: int = 9110, timeout: float = 35):
+        self.token = token
+        self.host = host
+        self.port = port
+        self.timeout = timeout
+
+    def request(self, method: str, path: str, body: dict = None):
+        """Returns (HTTP status, decoded body)"""
+        import http.client
+
+        connection = http.client.HTTPConnection(self.host, self.port, timeout=self.timeout)
+        try:
+            headers = {"Authorization": f"Bearer {self.token}"}
+            payload = None
+            if body is not None:
+                payload = json.dumps(body)
+                headers["Content-Type"] = "application/json"
+            connection.request(method, path, body=payload, headers=headers)
+            response = connection.getresponse()
+            data = response.read().decode()
+            if response.getheader("Content-Type", "").startswith("application/json"):
+                data = json.loads(data)
+            return response.status, data
+        finally:
+            connection.close()
+
+    def watch(self):
+        """Yield event messages from /events until the server closes the stream"""
+        sock = socket.create_connection((self.host, self.port), timeout=self.timeout)
+        try:
+            key = base64.b64encode(os.urandom(16)).decode()
+            sock.sendall(
+                f"GET /events HTTP/1.1\r\nHost: {self.host}:{self.port}\r\nUpgrade: websocket\r\n"
+                f"Connection: Upgrade\r\nSec-WebSocket-Key: {key}\r\nSec-WebSocket-Version: 13\r\n"
+                f"Authorization: Bearer {self.token}\r\n\r\n".encode()
+            )
+            stream = sock.makefile("rb")
+            status_line = stream.readline().decode("latin-1")
+            while stream.readline() not in (b"\r\n", b""):
+                pass
+            if " 101 " not in status_line:
+                raise ConnectionError(f"Event stream refused: {status_line.strip()}")
+            sock.settimeout(None)
+
+            while True:
+                header = stream.read(2)
+                if len(header) < 2:
+                    return
+                opcode, length = header[0] & 0x0F, header[1] & 0x7F
+                if length == 126:
+                    length = int.from_bytes(stream.read(2), "big")
+                elif length == 127:
+                    length = int.from_bytes(stream.read(8), "big")
+                payload = stream.read(length)
+                if opcode == 0x8:
+                    return
+                if opcode == 0x1:
+                    yield json.loads(payload)
+        finally:
+            try:
+                sock.sendall(encode_frame(b"", opcode=0x8, mask=True))
+            except OSError:
+                pass
+            sock.close()
+
+
+def default_token():
+    token = os.environ.get("SMARTPALMS_CONTROL_TOKEN")
+    if token:
+        return token
+    data_dir = os.environ.get("SMARTPALMS_DATA_DIR", os.path.dirname(os.path.abspath(__file__)))
+    with open(os.path.join(data_dir, "control_token"), encoding="utf-8") as f:
+        return f.read().strip()
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Operate a kiosk through its local control API")
+    parser.add_argument("command", choices=("health", "state", "open", "uv-start", "uv-stop", "watch"))
+    parser.add_argument("locker", nargs="?")
+    parser.add_argument("--duration", type=float, help="UV cycle length for uv-start (s)")
+    parser.add_argument("--port", type=int, default=int(os.environ.get("SMARTPALMS_CONTROL_PORT") or 9110))
+    parser.add_argument("--token", help="defaults to SMARTPALMS_CONTROL_TOKEN or the control_token file")
+    args = parser.parse_args()
+
+    client = ControlClient(args.token or default_token(), port=args.port)
+    if args.command == "watch":
+        try:
+            for message in client.watch():
+                print(json.dumps(message))
+        except KeyboardInterrupt:
+            pass
+        return
+    if args.command in ("open", "uv-start", "uv-stop") and not args.locker:
+        parser.error(f"{args.command} needs a locker number")
+
+    if args.command in ("health", "state"):
+        status, data = client.request("GET", f"/{args.command}")
+    elif args.command == "open":
+        status, data = client.request("POST", f"/lockers/{args.locker}/open")
+    else:
+        body = {"duration": args.duration} if args.duration else None
+        status, data = client.request("POST", f"/uv/{args.locker}/{args.command[3:]}", body)
+    print(json.dumps(data, indent=2))
+    if status >= 400:
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,321 @@
+"""Local-socket link between a KioskCore and its front-ends
+
+The protocol is newline-delimited JSON over a Unix stream socket.
+Front-ends send requests and get one response per request id; the core
+also pushes events to every connected front-end:
+
+    -> {"id": 7, "op": "submit_otp", "args": {"otp": "123456", "wall": "east"}}
+    <- {"id": 7, "result": {"status": "opened", "locker": "12", "message": "..."}}
+    <- {"event": "connectivity", "data": {"online": false, "message": "..."}}
+
+A front-end receives a "hello" event with the core's health on connect.
+"admission" events only go to the front-end whose submit they describe.
+Access is controlled by the socket file's permissions (group-writable
+only), so the core is never reachable from the network.
+"""
+import itertools
+import json
+import os
+import queue
+import socket
+import socketserver
+import threading
+
+# Operations a front-end may call, with the arguments each accepts
+OPERATIONS = {
+    "submit_otp": ("otp", "wall"),
+    "prefetch_otp": ("otp",),
+    "login": ("email", "password"),
+    "open_owner_locker": ("locker_number", "locker_id", "wall"),
+}
+
+UNAVAILABLE = {"status": "error", "message": "Kiosk core unavailable. Please try again."}
+
+
+class FrontEndConnection(socketserver.StreamRequestHandler):
+    """One front-end; its responses and events are written by a writer thread
+
+    send() only queues, so core threads that publish events (the relay
+    and UV schedulers among them) never block on a front-end's socket. A
+    front-end that lets its queue fill up is disconnected; it reconnects
+    and gets a fresh "hello".
+    """
+
+    def setup(self):
+        super().setup()
+        self.outgoing = queue.Queue(maxsize=self.server.queue_size)
+        self.dropped = False
+        self.origin = next(self.server.origins)  # tags the work this front-end submits
+        self.writer = threading.Thread(target=self.write_loop, name="core-writer", daemon=True)
+        self.writer.start()
+
+    def send(self, message: dict):
+        try:
+            self.outgoing.put_nowait(message)
+        except queue.Full:
+            if not self.dropped:
+                self.dropped = True
+                print("Front-end is not reading its events; disconnecting it")
+                self.disconnect()
+
+    def write_loop(self):
+        while True:
+            message = self.outgoing.get()
+            if message is None:
+                return
+            try:
+                self.wfile.write((json.dumps(message, separators=(",", ":")) + "\n").encode())
+                self.wfile.flush()
+            except (OSError, ValueError):
+                self.disconnect()  # front-end went away; ends the read loop too
+                return
+
+    def disconnect(self):
+        try:
+            self.connection.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+
+    def finish(self):
+        # None tells the writer to stop once whatever is still queued is written
+        try:
+            self.outgoing.put_nowait(None)
+        except queue.Full:
+            self.disconnect()
+        self.writer.join(timeout=2)
+        if self.writer.is_alive():
+            self.disconnect()  # stuck writing to a front-end that stopped reading
+        super().finish()
+
+    def handle(self):
+        core = self.server.core
+        self.server.track(self.connection, True)
+        unsubscribe = core.subscribe(self.forward)
+        self.send({"event": "hello", "data": core.health()})
+        try:
+            for line in self.rfile:
+                request = None
+                try:
+                    request = json.loads(line)
+                    self.dispatch(core, request)
+                except Exception as e:
+                    print(f"Front-end request error: {str(e)}")
+                    if isinstance(request, dict) and "id" in request:
+                        self.send({"id": request["id"], "result": {"status": "error", "message": "Invalid request"}})
+        finally:
+            unsubscribe()
+            self.server.track(self.connection, False)
+
+    def forward(self, event: str, data):
+        if event == "admission":
+            if data.get("origin") != self.origin:
+                return  # another front-end's pending work
+            data = {name: value for name, value in data.items() if name != "origin"}
+        self.send({"event": event, "data": data})
+
+    def dispatch(self, core, request: dict):
+        request_id, op = request["id"], request["op"]
+        if op == "health":
+            return self.send({"id": request_id, "result": core.health()})
+        if op == "uv_state":
+            return self.send({"id": request_id, "result": core.uv_state()})
+        if op not in OPERATIONS:
+            return self.send({"id": request_id, "result": {"status": "error", "message": f"Unknown operation {op}"}})
+        args = {name: value for name, value in request.get("args", {}).items() if name in OPERATIONS[op]}
+        if op == "submit_otp":
+            args["origin"] = self.origin
+        getattr(core, op)(on_done=lambda result: self.send({"id": request_id, "result": result}), **args)
+
+
+class CoreServer(socketserver.ThreadingUnixStreamServer):
+    """Serves one KioskCore to any number of front-end processes"""
+
+    daemon_threads = True
+
+    def __init__(self, core, path: str, mode: int = 0o660, queue_size: int = 256):
+        if os.path.exists(path):
+            os.unlink(path)  # left over from a previous run
+        super().__init__(path, FrontEndConnection)
+        os.chmod(path, mode)
+        self.core = core
+        self.path = path
+        self.queue_size = queue_size  # messages buffered per front-end
+        self.connections_lock = threading.Lock()
+        self.connections = set()
+        self.origins = itertools.count(1)
+
+    def track(self, connection, connected: bool):
+        with self.connections_lock:
+            if connected:
+                self.connections.add(connection)
+            else:
+                self.connections.discard(connection)
+
+    def start(self):
+        threading.Thread(target=self.serve_forever, name="core-server", daemon=True).start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+        # Connected front-ends would otherwise keep being served by their threads
+        with self.connections_lock:
+            connections = list(self.connections)
+        for connection in connections:
+            try:
+                connection.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+        try:
+            os.unlink(self.path)
+        except OSError:
+            pass
+
+
+class CoreClient:
+    """Front-end side of the link, with the same interface as KioskCore
+
+    Callbacks and events run on the client's reader thread. The client
+    reconnects on its own; requests made while the core is unreachable
+    fail at once, and pending ones fail when the connection drops.
+    """
+
+    def __init__(self, path: str, retry_interval: float = 2.0):
+        self.path = path
+        self.retry_interval = retry_interval
+        self.ready = False
+        self.error = None
+        self.current_health = {"ready": False, "online": False, "message": ""}
+        self.current_uv = {}
+        self.ids = itertools.count(1)
+        self.lock = threading.Lock()
+        self.pending = {}   # request id -> on_done
+        self.sock = None
+        self.listeners = []
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self.run, name="core-client", daemon=True)
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def subscribe(self, callback):
+        self.listeners.append(callback)
+        return lambda: self.listeners.remove(callback)
+
+    def publish(self, event: str, data):
+        for callback in list(self.listeners):
+            try:
+                callback(event, data)
+            except Exception as e:
+                print(f"Core event listener error: {str(e)}")
+
+    def health(self):
+        return self.current_health
+
+    def uv_state(self):
+        """Lamp state as of the core's last "uv" event (fetched on connect)"""
+        return self.current_uv
+
+    def update_uv(self, state):
+        if "status" not in state:  # not an UNAVAILABLE answer
+            self.current_uv = state
+
+    def run(self):
+        announced_down = False
+        while not self.stopped.is_set():
+            try:
+                sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+                sock.connect(self.path)
+            except OSError as e:
+                if not announced_down:
+                    print(f"Kiosk core unreachable at {self.path}: {str(e)}")
+                    self.publish("unavailable", dict(UNAVAILABLE))
+                    announced_down = True
+                self.stopped.wait(self.retry_interval)
+                continue
+
+            announced_down = False
+            with self.lock:
+                self.sock = sock
+            self.request("uv_state", self.update_uv)
+            try:
+                for line in sock.makefile("r", encoding="utf-8"):
+                    self.receive(json.loads(line))
+            except (OSError, ValueError) as e:
+                print(f"Kiosk core connection error: {str(e)}")
+            finally:
+                self.disconnected(sock)
+                announced_down = True
+
+    def disconnected(self, sock):
+        with self.lock:
+            self.sock = None
+            pending, self.pending = self.pending, {}
+        sock.close()
+        self.ready = False
+        for on_done in pending.values():
+            on_done(dict(UNAVAILABLE))
+        if not self.stopped.is_set():
+            self.publish("unavailable", dict(UNAVAILABLE))
+
+    def receive(self, message: dict):
+        if "event" in message:
+            event, data = message["event"], message["data"]
+            if event in ("hello", "ready", "connectivity"):
+                self.current_health = data
+                self.ready = data.get("ready", False)
+                if event == "hello":
+                    # A core that failed to start reports its error in the greeting
+                    event = "ready" if self.ready else ("fatal" if data.get("error") else "connectivity")
+            if event == "uv":
+                self.current_uv = data
+            if event == "fatal":
+                self.error = data["message"]
+            self.publish(event, data)
+            return
+        with self.lock:
+            on_done = self.pending.pop(message.get("id"), None)
+        if on_done:
+            on_done(message["result"])
+
+    def request(self, op: str, on_done, **args):
+        request_id = next(self.ids)
+        data = (json.dumps({"id": request_id, "op": op, "args": args}, separators=(",", ":")) + "\n").encode()
+        with self.lock:
+            sock = self.sock
+            if sock is not None:
+                self.pending[request_id] = on_done
+        if sock is None:
+            on_done(dict(UNAVAILABLE))
+            return
+        try:
+            sock.sendall(data)
+        except OSError:
+            with self.lock:
+                on_done = self.pending.pop(request_id, None)
+            if on_done:
+                on_done(dict(UNAVAILABLE))
+
+    def submit_otp(self, otp: str, on_done, wall: str = None):
+        self.request("submit_otp", on_done, otp=otp, wall=wall)
+
+    def prefetch_otp(self, otp: str, on_done=None):
+        self.request("prefetch_otp", on_done or (lambda result: None), otp=otp)
+
+    def login(self, email: str, password: str, on_done):
+        self.request("login", on_done, email=email, password=password)
+
+    def open_owner_locker(self, locker_number: str, locker_id: str, on_done, wall: str = None):
+        self.request("open_owner_locker", on_done, locker_number=locker_number, locker_id=locker_id, wall=wall)
+
+    def shutdown(self):
+        """Disconnect from the core (the core itself keeps running)"""
+        self.stopped.set()
+        with self.lock:
+            sock = self.sock
+        if sock:
+            try:
+                sock.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
@@ -0,0 +1,305 @@
+"""Compact on-device log of kiosk events for access auditing
+
+OTP attempts, locker opens, UV cycles and connectivity transitions are
+stored as fixed-size binary records instead of log lines:
+
+    time (float64) | kind (u8) | outcome (u8) | locker (8 bytes) | value (u32) | source (u16)
+
+Records are 24 bytes and go into one segment file per time bucket (a day
+by default), named after the bucket start, e.g. ``events-1760659200-000.seg``.
+A segment that outgrows ``max_segment_bytes`` continues in the next part.
+When the directory exceeds ``max_bytes``, the oldest segments are deleted.
+Events are buffered and appended in batches, so the SD card sees a few
+small appends a minute rather than a write per event.
+
+Queries only open the segments whose bucket overlaps the requested time
+range, and filter records with struct.iter_unpack:
+
+    python3 event_log.py events --locker 3 --since 2h
+    python3 event_log.py events --kind otp --outcome rejected --since "2026-10-17 08:00"
+    python3 event_log.py events --summary --since 1d
+"""
+import json
+import os
+import queue
+import re
+import struct
+import threading
+import time
+from collections import Counter, deque
+
+RECORD = struct.Struct("<dBB8sIH")
+HEADER = struct.Struct("<4sBB18x")  # magic, format version, record size; padded to one record
+MAGIC = b"SPEV"
+VERSION = 1
+
+# Codes are stored by position: only ever append to these tuples
+KINDS = ("other", "otp", "open", "uv", "connectivity", "relay")
+OUTCOMES = (
+    "other",
+    # OTP submits and opens
+    "opened", "rejected", "error", "already_open", "in_progress", "busy", "starting",
+    "invalid_locker", "wrong_wall",
+    # UV cycles
+    "started", "restarted", "extended", "queued", "on", "off",
+    # Connectivity
+    "online", "link_down", "backend_down",
+    # Relay reconciliation after an unclean stop
+    "forced_off", "resumed", "cancelled",
+)
+SOURCES = ("", "cache", "api", "owner", "remote")
+
+MAX_VALUE = 2 ** 32 - 1
+
+
+def code_of(table, name: str):
+    try:
+        return table.index(name or "")
+    except ValueError:
+        return 0  # recorded as "other" (or no source)
+
+
+def name_of(table, index: int):
+    return table[index] if index < len(table) else table[0]
+
+
+def segment_name(prefix: str, bucket_start: int, part: int):
+    return f"{prefix}-{bucket_start:010d}-{part:03d}.seg"
+
+
+SEGMENT_PATTERN = re.compile(r"^(?P<prefix>.+)-(?P<bucket>\d{10})-(?P<part>\d{3})\.seg$")
+
+
+class EventLog:
+    """Buffered writer of fixed-size event records into rotating segments
+
+    record() only queues the event; a background thread appends batches
+    every ``flush_interval`` seconds (or once ``batch_size`` are pending).
+    """
+
+    def __init__(self, directory: str, prefix: str = "events", bucket: int = 86400,
+                 max_bytes: int = 4_000_000, max_segment_bytes: int = 512_000,
+                 flush_interval: float = 5.0, batch_size: int = 256):
+        self.directory = directory
+        self.prefix = prefix
+        self.bucket = bucket
+        self.max_bytes = max_bytes
+        self.max_segment_bytes = max_segment_bytes
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+        self.pending = queue.Queue()
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self.run, name="event-log", daemon=True)
+
+    def start(self):
+        os.makedirs(self.directory, exist_ok=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.stopped.set()
+        if self.thread.is_alive():
+            self.thread.join(timeout=2)
+
+    def record(self, kind: str, outcome: str, locker: str = None, value: float = 0, source: str = None):
+        """Queue one event; value is a duration or RTT in milliseconds"""
+        self.pending.put(RECORD.pack(
+            time.time(),
+            code_of(KINDS, kind),
+            code_of(OUTCOMES, outcome),
+            str(locker or "").encode("ascii", "replace")[:8],
+            min(MAX_VALUE, max(0, int(value or 0))),
+            code_of(SOURCES, source),
+        ))
+
+    def run(self):
+        while not self.stopped.is_set():
+            self.stopped.wait(self.flush_interval)
+            self.flush()
+        self.flush()
+
+    def flush(self):
+        batch = []
+        while True:
+            try:
+                batch.append(self.pending.get_nowait())
+            except queue.Empty:
+                break
+        # Records go to the segment of their own time bucket
+        for start in range(0, len(batch), self.batch_size):
+            try:
+                self.append(batch[start:start + self.batch_size])
+            except OSError as e:
+                print(f"Event log write error: {str(e)}")
+                return
+        if batch:
+            self.enforce_limit()
+
+    def append(self, records):
+        by_bucket = {}
+        for record in records:
+            bucket_start = int(RECORD.unpack(record)[0] // self.bucket * self.bucket)
+            by_bucket.setdefault(bucket_start, []).append(record)
+        for bucket_start, chunk in by_bucket.items():
+            path = self.segment_for(bucket_start)
+            size = os.path.getsize(path) if os.path.exists(path) else 0
+            aligned = 0 if size < HEADER.size else size - (size - HEADER.size) % RECORD.size
+            if aligned != size:
+                # Drop a record torn by a power cut so later ones stay aligned
+                os.truncate(path, aligned)
+            with open(path, "ab") as f:
+                if not aligned:
+                    f.write(HEADER.pack(MAGIC, VERSION, RECORD.size))
+                f.write(b"".join(chunk))
+
+    def segment_for(self, bucket_start: int):
+        """Latest part of the bucket's segment, or a new part once it is full"""
+        parts = [segment for segment in self.segments() if segment[0] == bucket_start]
+        part = parts[-1][1] if parts else 0
+        path = os.path.join(self.directory, segment_name(self.prefix, bucket_start, part))
+        if os.path.exists(path) and os.path.getsize(path) >= self.max_segment_bytes:
+            path = os.path.join(self.directory, segment_name(self.prefix, bucket_start, part + 1))
+        return path
+
+    def segments(self):
+        return list_segments(self.directory, self.prefix)
+
+    def enforce_limit(self):
+        """Delete the oldest segments while the log is over max_bytes"""
+        segments = self.segments()
+        sizes = [os.path.getsize(path) for _, _, path in segments]
+        total = sum(sizes)
+        for (_, _, path), size in zip(segments[:-1], sizes):
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except OSError as e:
+                print(f"Event log rotation error: {str(e)}")
+                break
+            total -= size
+
+
+def list_segments(directory: str, prefix: str = "events"):
+    """(bucket start, part, path) of every segment, oldest first"""
+    try:
+        names = os.listdir(directory)
+    except FileNotFoundError:
+        return []
+    segments = []
+    for filename in names:
+        match = SEGMENT_PATTERN.match(filename)
+        if match and match["prefix"] == prefix:
+            segments.append((int(match["bucket"]), int(match["part"]), os.path.join(directory, filename)))
+    return sorted(segments)
+
+
+def read_segment(path: str):
+    with open(path, "rb") as f:
+        data = f.read()
+    if len(data) < HEADER.size:
+        return
+    magic, version, size = HEADER.unpack_from(data)
+    if magic != MAGIC or size != RECORD.size:
+        print(f"Skipping {path}: not a version {VERSION} event segment")
+        return
+    # A torn final record (power cut mid-append) is ignored
+    end = HEADER.size + (len(data) - HEADER.size) // RECORD.size * RECORD.size
+    yield from RECORD.iter_unpack(memoryview(data)[HEADER.size:end])
+
+
+def query(directory: str, since: float = None, until: float = None, locker: str = None,
+          kind: str = None, outcome: str = None, prefix: str = "events", bucket: int = 86400):
+    """Events matching every given filter, oldest first, as dicts"""
+    kind_code = KINDS.index(kind) if kind else None
+    outcome_code = OUTCOMES.index(outcome) if outcome else None
+    locker_bytes = locker.encode("ascii") if locker else None
+
+    for bucket_start, _, path in list_segments(directory, prefix):
+        # Segments outside the time range are never opened
+        if since is not None and bucket_start + bucket <= since:
+            continue
+        if until is not None and bucket_start > until:
+            continue
+        for at, kind_index, outcome_index, locker_field, value, source in read_segment(path):
+            if since is not None and at < since:
+                continue
+            if until is not None and at > until:
+                continue
+            if kind_code is not None and kind_index != kind_code:
+                continue
+            if outcome_code is not None and outcome_index != outcome_code:
+                continue
+            locker_field = locker_field.rstrip(b"\0")
+            if locker_bytes is not None and locker_field != locker_bytes:
+                continue
+            yield {
+                "at": at,
+                "kind": name_of(KINDS, kind_index),
+                "outcome": name_of(OUTCOMES, outcome_index),
+                "locker": locker_field.decode("ascii", "replace") or None,
+                "value": value,
+                "source": name_of(SOURCES, source) or None,
+            }
+
+
+def parse_time(text: str, now: float = None):
+    """Absolute "YYYY-MM-DD[ HH:MM[:SS]]" or relative "90s", "30m", "2h", "1d" (ago)"""
+    now = time.time() if now is None else now
+    match = re.fullmatch(r"(\d+(?:\.\d+)?)([smhd])", text.strip())
+    if match:
+        return now - float(match[1]) * {"s": 1, "m": 60, "h": 3600, "d": 86400}[match[2]]
+    for pattern in ("%Y-%m-%d %H:%M:%S", "%Y-%m-%d %H:%M", "%Y-%m-%dT%H:%M:%S", "%Y-%m-%d"):
+        try:
+            return time.mktime(time.strptime(text.strip(), pattern))
+        except ValueError:
+            continue
+    raise ValueError(f"Unrecognized time: {text}")
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Query the kiosk's local event log")
+    parser.add_argument("directory", nargs="?", default="events")
+    parser.add_argument("--since", help='start time, e.g. "2026-10-17 08:00" or 2h (ago)')
+    parser.add_argument("--until", help="end time, same formats as --since")
+    parser.add_argument("--locker")
+    parser.add_argument("--kind", choices=KINDS[1:])
+    parser.add_argument("--outcome", choices=OUTCOMES[1:])
+    parser.add_argument("--last", type=int, help="only the most recent N matches")
+    parser.add_argument("--summary", action="store_true", help="count matches by kind and outcome")
+    parser.add_argument("--json", action="store_true", help="one JSON object per line")
+    args = parser.parse_args()
+
+    events = query(
+        args.directory,
+        since=parse_time(args.since) if args.since else None,
+        until=parse_time(args.until) if args.until else None,
+        locker=args.locker,
+        kind=args.kind,
+        outcome=args.outcome,
+    )
+    if args.summary:
+        counts = Counter((event["kind"], event["outcome"]) for event in events)
+        for (kind, outcome), count in sorted(counts.items()):
+            print(f"{kind:14} {outcome:14} {count:>8}")
+        return
+    if args.last:
+        events = deque(events, maxlen=args.last)
+
+    for event in events:
+        if args.json:
+            print(json.dumps(event, separators=(",", ":")))
+            continue
+        at = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(event["at"]))
+        line = f"{at}  {event['kind']:12} {event['outcome']:14} locker={event['locker'] or '-':6}"
+        if event["source"]:
+            line += f" source={event['source']}"
+        if event["value"]:
+            line += f" {event['value']}ms"
+        print(line)
+
+
+if __name__ == "__main__":
+    main()
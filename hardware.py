@@ -0,0 +1,183 @@
+"""Relay driver backends
+
+The kiosk's relay boards are active LOW: driving a pin LOW energizes the
+relay. Drivers hide that detail; callers only say whether a relay should be
+active. Pick a backend with SMARTPALMS_GPIO_BACKEND (rpi, gpiozero, gpiod, sim).
+"""
+import os
+import threading
+import time
+from collections import deque
+
+
+class RelayDriver:
+    """Interface every relay backend implements"""
+
+    name = "base"
+
+    def setup(self, pins):
+        """Configure pins as outputs with every relay inactive"""
+        raise NotImplementedError
+
+    def write(self, pin: int, active: bool):
+        raise NotImplementedError
+
+    def cleanup(self):
+        pass
+
+
+class RPiGPIODriver(RelayDriver):
+    """RPi.GPIO backend (the original kiosk wiring)"""
+
+    name = "rpi"
+
+    def __init__(self):
+        import RPi.GPIO as GPIO
+        self.GPIO = GPIO
+
+    def setup(self, pins):
+        GPIO = self.GPIO
+        GPIO.setmode(GPIO.BCM)
+        GPIO.setwarnings(False)  # Disable warnings about channel in use
+
+        # One bulk call; initial=HIGH drives the latch before the pin becomes
+        # an output, so relays never glitch on and no settling delays are needed
+        GPIO.setup(list(pins), GPIO.OUT, initial=GPIO.HIGH)
+
+    def write(self, pin: int, active: bool):
+        self.GPIO.output(pin, self.GPIO.LOW if active else self.GPIO.HIGH)
+
+    def cleanup(self):
+        self.GPIO.cleanup()
+
+
+class GpiozeroDriver(RelayDriver):
+    """gpiozero backend; works with any pin factory gpiozero supports (lgpio, pigpio, native)"""
+
+    name = "gpiozero"
+
+    def __init__(self):
+        from gpiozero import DigitalOutputDevice
+        self.DigitalOutputDevice = DigitalOutputDevice
+        self.devices = {}
+
+    def setup(self, pins):
+        for pin in pins:
+            # active_high=False maps "on" to a LOW pin, matching the relay board
+            self.devices[pin] = self.DigitalOutputDevice(pin, active_high=False, initial_value=False)
+
+    def write(self, pin: int, active: bool):
+        device = self.devices[pin]
+        if active:
+            device.on()
+        else:
+            device.off()
+
+    def cleanup(self):
+        for device in self.devices.values():
+            device.close()
+        self.devices.clear()
+
+
+class GpiodDriver(RelayDriver):
+    """libgpiod v2 backend: every relay line is claimed in a single line request
+
+    The request carries the initial (inactive) output values, so the whole
+    board is configured in one kernel call. Set SMARTPALMS_GPIOCHIP if the
+    header isn't on /dev/gpiochip0.
+    """
+
+    name = "gpiod"
+
+    def __init__(self, chip: str = None):
+        import gpiod
+        from gpiod.line import Direction, Value
+        self.gpiod = gpiod
+        self.Value = Value
+        self.Direction = Direction
+        self.chip = chip or os.environ.get("SMARTPALMS_GPIOCHIP", "/dev/gpiochip0")
+        self.request = None
+
+    def setup(self, pins):
+        settings = self.gpiod.LineSettings(
+            direction=self.Direction.OUTPUT,
+            active_low=True,  # ACTIVE drives the line LOW, energizing the relay
+            output_value=self.Value.INACTIVE,
+        )
+        self.request = self.gpiod.request_lines(
+            self.chip,
+            consumer="smartpalms-kiosk",
+            config={tuple(pins): settings},
+        )
+
+    def write(self, pin: int, active: bool):
+        self.request.set_value(pin, self.Value.ACTIVE if active else self.Value.INACTIVE)
+
+    def cleanup(self):
+        if self.request:
+            self.request.release()
+            self.request = None
+
+
+class SimulatedDriver(RelayDriver):
+    """In-memory backend that records a timestamped pin timeline
+
+    Used for running the kiosk off a Pi, load tests and benchmarks.
+    ``write_latency`` adds an artificial delay to every write. Only the
+    last ``history`` transitions are kept, so soak runs stay bounded.
+    """
+
+    name = "sim"
+
+    def __init__(self, write_latency: float = 0.0, history: int = 10_000):
+        self.write_latency = write_latency
+        self.condition = threading.Condition()
+        self.state = {}       # pin -> active
+        self.timeline = deque(maxlen=history)  # (monotonic time, pin, active)
+        self.transitions = 0
+
+    def setup(self, pins):
+        with self.condition:
+            for pin in pins:
+                self.state[pin] = False
+                self.timeline.append((time.monotonic(), pin, False))
+
+    def write(self, pin: int, active: bool):
+        if pin not in self.state:
+            raise ValueError(f"Pin {pin} was not set up")
+        if self.write_latency:
+            time.sleep(self.write_latency)
+        with self.condition:
+            self.state[pin] = active
+            self.timeline.append((time.monotonic(), pin, active))
+            self.transitions += 1
+            self.condition.notify_all()
+
+    def is_active(self, pin: int):
+        with self.condition:
+            return self.state.get(pin, False)
+
+    def wait_active(self, pin: int, timeout: float = None):
+        """Block until a pin is active; returns False on timeout"""
+        with self.condition:
+            return self.condition.wait_for(lambda: self.state.get(pin, False), timeout)
+
+    def cleanup(self):
+        with self.condition:
+            for pin in self.state:
+                self.state[pin] = False
+
+
+BACKENDS = {
+    RPiGPIODriver.name: RPiGPIODriver,
+    GpiozeroDriver.name: GpiozeroDriver,
+    GpiodDriver.name: GpiodDriver,
+    SimulatedDriver.name: SimulatedDriver,
+}
+
+
+def create_driver(name: str = "rpi"):
+    try:
+        return BACKENDS[name]()
+    except KeyError:
+        raise ValueError(f"Unknown GPIO backend '{name}' (choose from {', '.join(BACKENDS)})")
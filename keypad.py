@@ -0,0 +1,110 @@
+"""On-screen numeric keypad and local OTP format checks
+
+Riders enter codes on the touch screen instead of a USB keyboard. The
+keypad is built once with the OTP screen and types into its entry, so a
+physical keyboard keeps working alongside it.
+
+When the site configures its OTP format, codes are checked locally
+before anything is sent: a code of the wrong length, with non-digits or
+with a bad check digit is rejected at once instead of costing a backend
+lookup. Without a configured format every code goes to the backend.
+"""
+import os
+import tkinter as tk
+from tkinter import ttk
+
+
+def luhn_valid(code: str):
+    """True if the last digit is the Luhn check digit of the ones before it"""
+    total = 0
+    for position, char in enumerate(reversed(code)):
+        digit = int(char)
+        if position % 2:
+            digit *= 2
+            if digit > 9:
+                digit -= 9
+        total += digit
+    return total % 10 == 0
+
+
+class OtpFormat:
+    """Length, digits-only and optional check-digit rules for OTP codes
+
+    ``length`` is None when the backend's code length isn't known; codes
+    are then only checked if ``checksum`` is set. ``checksum`` is None
+    (codes carry no check digit) or "luhn".
+    """
+
+    def __init__(self, length: int = None, checksum: str = None):
+        if checksum not in (None, "luhn"):
+            raise ValueError(f"Unknown OTP checksum: {checksum}")
+        self.length = length
+        self.checksum = checksum
+
+    @classmethod
+    def from_env(cls):
+        """SMARTPALMS_OTP_LENGTH (unset: any length) and SMARTPALMS_OTP_CHECKSUM ("luhn" or empty)"""
+        length = os.environ.get("SMARTPALMS_OTP_LENGTH")
+        return cls(
+            length=int(length) if length else None,
+            checksum=os.environ.get("SMARTPALMS_OTP_CHECKSUM") or None
+        )
+
+    def check(self, code: str):
+        """User-facing reason the code can't be valid, or None"""
+        if self.length is None and self.checksum is None:
+            return None
+        if not code.isdigit():
+            return "OTP codes contain digits only"
+        if self.length is not None and len(code) != self.length:
+            return f"OTP codes are {self.length} digits long"
+        if self.checksum == "luhn" and not luhn_valid(code):
+            return "Invalid OTP code. Please check the digits."
+        return None
+
+    def complete(self, code: str):
+        """True once a full, well-formed code has been entered
+
+        Without a known length no code counts as complete, so nothing is
+        looked up while it may still be typed.
+        """
+        return self.length is not None and self.check(code) is None
+
+
+class NumericKeypad:
+    """Touch keypad (1-9, Clear, 0, backspace) typing into an Entry
+
+    Digits past ``max_length`` (None: no limit) are ignored. Keys edit the entry itself, so
+    its textvariable traces see keypad and keyboard input alike.
+    """
+
+    def __init__(self, parent, entry, max_length: int = None):
+        self.entry = entry
+        self.max_length = max_length
+
+        ttk.Style().configure("Keypad.TButton", font=('Arial', 20), padding=(8, 8))
+        self.frame = ttk.Frame(parent)
+        keys = ["1", "2", "3", "4", "5", "6", "7", "8", "9", "Clear", "0", "⌫"]
+        for index, key in enumerate(keys):
+            ttk.Button(
+                self.frame,
+                text=key,
+                style="Keypad.TButton",
+                width=5,
+                takefocus=False,
+                command=lambda key=key: self.press(key)
+            ).grid(row=index // 3, column=index % 3, padx=4, pady=4)
+
+    def press(self, key: str):
+        text = self.entry.get()
+        if key == "Clear":
+            self.entry.delete(0, tk.END)
+        elif key == "⌫":
+            self.entry.delete(max(0, len(text) - 1), tk.END)
+        elif self.max_length is None or len(text) < self.max_length:
+            self.entry.insert(tk.END, key)
+        self.entry.icursor(tk.END)
+        self.entry.focus()
+
+    def grid(self, **kwargs):
+        self.frame.grid(**kwargs)
@@ -0,0 +1,826 @@
+"""Headless locker-control core
+
+KioskCore owns everything that is not UI: the locker topology and relay
+schedulers with their crash-safe state journal, the backend connection
+pool, connectivity monitor, OTP cache, outbox, locker replica, owner
+session cache and local event log. The Tk front-end in main.py drives an
+in-process core by default. Sites with several walls or displays can run
+one core and attach thin front-ends to it over a local socket instead:
+
+    python3 kiosk_core.py --socket /run/smartpalms/core.sock
+    SMARTPALMS_CORE_SOCKET=/run/smartpalms/core.sock SMARTPALMS_WALL=east python3 main.py
+
+Operations report back through an ``on_done(result)`` callback that runs
+on a core thread (or inline, for results that need no network); front-ends
+hop to their own UI thread. Results are plain dicts with a "status" and a
+user-facing "message" so they can cross the socket unchanged. Changes the
+front-ends should know about (readiness, connectivity, session refreshes,
+UV lamps) are published to subscribers as (event, data) pairs.
+"""
+import os
+import threading
+import time
+
+from startup import StartupTimer
+from relay_scheduler import RelayScheduler
+from uv_scheduler import UVScheduler
+from connectivity import ConnectivityMonitor
+from otp_cache import OtpCache
+from replica import LockerReplica, ReplicaSync
+from outbox import Outbox
+from topology import LockerTopology, load_topology
+from session_cache import SessionCache
+from admission import Admission
+from event_log import EventLog
+from resources import ResourceGuard, load_profile
+from relay_state import RelayJournal, reconcile
+from metrics import REGISTRY, OTP_LOOKUP, RELAY_PULSE, MetricsExporter
+
+APP_DIR = os.path.dirname(os.path.abspath(__file__))
+
+OTP_PREFETCHES = REGISTRY.counter(
+    "kiosk_otp_prefetches_total", "Speculative OTP lookups by what became of them", ("result",)
+)
+
+
+def health_from_snapshot(snapshot, ready: bool = True):
+    """Connectivity snapshot as a plain dict for front-ends"""
+    return {
+        "ready": ready,
+        "online": snapshot.online,
+        "message": snapshot.message,
+        "link_up": snapshot.link_up,
+        "backend_ok": snapshot.backend_ok,
+        "rtt": snapshot.rtt,
+        "checked_at": snapshot.checked_at,
+    }
+
+
+class KioskCore:
+    def __init__(self, base_url: str = None, kiosk_id: str = None, data_dir: str = None,
+                 topology_path: str = None, timer: StartupTimer = None):
+        self.timer = timer or StartupTimer()
+        self.base_url = base_url or os.environ.get("SMARTPALMS_API_URL", "https://smartpalms.vercel.app/api")
+        self.kiosk_id = kiosk_id or os.environ.get("SMARTPALMS_KIOSK_ID", "default")
+
+        # Local databases live next to the app unless overridden
+        self.data_dir = data_dir or os.environ.get("SMARTPALMS_DATA_DIR", APP_DIR)
+
+        # Locker -> relay bank/channel index for the lock and UV relays of
+        # every locker this core drives (see topology.toml)
+        self.topology_path = topology_path or os.environ.get(
+            "SMARTPALMS_TOPOLOGY", os.path.join(APP_DIR, "topology.toml")
+        )
+        self.error = None
+
+        # Pool, cache and memory limits; the lowmem profile suits 512 MB boards
+        self.resource_profile = load_profile()
+
+        try:
+            self.topology = load_topology(self.topology_path)
+        except Exception as e:
+            print(f"Topology Error: {str(e)}")
+            self.error = "Invalid locker topology configuration. Please check topology.toml."
+            self.topology = LockerTopology({}, {})
+
+        # How long a locker relay stays energized per open, in seconds
+        self.lock_pulse_duration = 10
+
+        # shutdown() may be called more than once; only the first call runs
+        self.shutdown_lock = threading.Lock()
+        self.shut_down = False
+
+        # Intended and actual relay state survive a crash in a memory-mapped
+        # journal; the previous run's state is reconciled once the banks are up
+        self.relay_journal = None
+        if not self.error:
+            try:
+                self.relay_journal = RelayJournal(os.path.join(self.data_dir, "relay_state.bin"), self.topology)
+            except (OSError, ValueError) as e:
+                print(f"Relay state journal unavailable: {str(e)}")
+
+        # Relay pulses run on one scheduler thread so several lockers (on any
+        # wall) can open at once; completion callbacks run on that thread
+        self.relay_scheduler = RelayScheduler(
+            self.write_relay,
+            flush=self.topology.flush,
+            observe=RELAY_PULSE.observe,
+            on_deadline=self.record_relay_deadline
+        )
+
+        # OTP attempts, opens, UV cycles and connectivity changes are kept
+        # on the device as compact binary records (python3 event_log.py)
+        self.events = EventLog(os.path.join(self.data_dir, "events"))
+
+        # UV light duration in seconds (30 seconds)
+        self.uv_light_duration = 30
+
+        # Most UV lamps allowed on at once, so a burst of openings doesn't
+        # overload the relay board supply; extra cycles queue (0 = no limit)
+        self.uv_max_concurrent = 3
+
+        # One scheduler thread runs every UV cycle; re-opening a locker while
+        # its lamp is on restarts the cycle ("restart") or adds to it ("extend")
+        self.uv_scheduler = UVScheduler(
+            self.write_relay,
+            self.topology.uv_channels(),
+            self.uv_light_duration,
+            max_concurrent=self.uv_max_concurrent,
+            reopen_mode="restart",
+            on_change=self.handle_uv_change,
+            flush=self.topology.flush,
+            on_deadline=self.record_relay_deadline
+        )
+        self.uv_lamps_lock = threading.Lock()
+        self.uv_lamps = {}  # locker -> "on" | "queued", as of the last change
+
+        # Double taps and repeated codes are coalesced instead of re-running
+        # the lookup and relay pulse; pending work is capped and shown to users
+        self.admission = Admission(
+            max_pending=8,
+            recent_ttl=self.lock_pulse_duration,
+            on_change=lambda origin: self.publish("admission", {**self.admission.state(origin), "origin": origin})
+        )
+
+        # The backend lookup for a code starts as soon as its last digit is
+        # typed; a submit within otp_prefetch_ttl seconds reuses it
+        self.otp_prefetch_ttl = 10
+        self.prefetch_lock = threading.Lock()
+        self.prefetched = None  # (otp, future, started) of the latest typed code
+
+        # Recent owner logins: a repeat login returns the cached locker list
+        # at once and is revalidated in the background
+        self.session_cache = SessionCache(
+            fresh_ttl=60, max_age=600, max_entries=self.resource_profile.session_cache_entries
+        )
+
+        # Backend services are created on the startup thread so front-ends
+        # can show their first screen before requests/certifi are imported
+        self.ready = False
+        self.relays_ready = False
+        self.cert_path = None
+        self.api = None
+        self.connectivity = None
+        self.otp_cache = None
+        self.replica = None
+        self.replica_sync = None
+        self.outbox = None
+        self.metrics_exporter = None
+        self.control_api = None
+        self.warmup = None
+        self.resource_guard = None
+
+        self.listeners_lock = threading.Lock()
+        self.listeners = []
+
+    def start(self):
+        """Bring up GPIO and services on a background thread"""
+        if self.error:
+            self.publish("fatal", {"message": self.error})
+            return self
+        threading.Thread(target=self.initialize_services, name="startup", daemon=True).start()
+        return self
+
+    def initialize_services(self):
+        # Setup every relay bank (GPIO header, I2C expanders, shift registers)
+        try:
+            with self.timer.phase("gpio"):
+                # Each bank is configured in one bulk operation, inactive from the start
+                self.topology.setup()
+                self.relays_ready = True
+                self.reconcile_relays()
+        except Exception as e:
+            print(f"GPIO Setup Error: {str(e)}")
+            self.fail("Failed to initialize GPIO. Please check permissions and hardware.")
+            return
+
+        try:
+            with self.timer.phase("imports"):
+                # Deferred: requests and certifi are the slowest imports we have
+                import certifi
+                from api_client import KioskApiClient
+
+            with self.timer.phase("services"):
+                # Use certifi for certificate verification
+                self.cert_path = certifi.where()
+
+                # Shared keep-alive session for every backend call of every
+                # front-end; results are delivered on the pool's threads
+                self.api = KioskApiClient(self.base_url, verify=self.cert_path,
+                                          pool_size=self.resource_profile.api_pool_size)
+
+                # Link and backend health are probed on a background thread; the
+                # submit path and front-ends read its cached snapshot. Probes
+                # back off to every 5 minutes while healthy and every real
+                # backend request counts as a health signal
+                self.connectivity = ConnectivityMonitor(
+                    self.api,
+                    interface="wlan0",
+                    min_interval=5,
+                    max_interval=300,
+                    outage_interval=60,
+                    probe_mode=os.environ.get("SMARTPALMS_PROBE", "head"),
+                    on_change=self.handle_connectivity_change
+                )
+                self.api.observe = self.connectivity.observe
+
+                # Active OTPs, lockers and subscriptions for this kiosk are replicated
+                # locally by delta sync, so riders can still open lockers while the
+                # backend or WiFi is down and owner screens need no extra requests
+                self.otp_cache = OtpCache(os.path.join(self.data_dir, "otp_cache.db"))
+                self.replica = LockerReplica(os.path.join(self.data_dir, "replica.db"))
+                self.replica_sync = ReplicaSync(
+                    self.replica, self.otp_cache, self.api, self.kiosk_id, self.connectivity, interval=60
+                )
+
+                # Access history and OTP clears are journaled to disk and sent by a
+                # background flusher, so nothing on the actuation path waits on the network
+                self.outbox = Outbox(
+                    os.path.join(self.data_dir, "outbox.db"),
+                    senders={
+                        "access_history": lambda payload, key: self.api.create_access_history(payload, key),
+                        "otp_clear": lambda payload, key: self.api.clear_otp(payload["otp"]),
+                    },
+                    connectivity=self.connectivity
+                )
+
+                # Prometheus text on localhost plus a rotating JSON-lines log
+                # of transaction traces; an empty port disables the endpoint
+                metrics_port = os.environ.get("SMARTPALMS_METRICS_PORT", "9108")
+                self.metrics_exporter = MetricsExporter(
+                    REGISTRY,
+                    path=os.path.join(self.data_dir, "metrics.jsonl"),
+                    port=int(metrics_port) if metrics_port else None
+                )
+
+                # RSS, threads and file descriptors are sampled every minute;
+                # over the memory budget, caches are dropped and freed memory
+                # returned to the OS
+                self.resource_guard = ResourceGuard(
+                    self.resource_profile,
+                    interval=60,
+                    relief=(self.session_cache.clear, self.shrink_databases)
+                )
+                self.shrink_databases(self.resource_profile.sqlite_cache_kib)
+
+            # Start metrics, the event log, background connection monitoring,
+            # OTP sync and the outbox flusher
+            self.metrics_exporter.start()
+            self.resource_guard.start()
+            self.events.start()
+            self.connectivity.start()
+            self.replica_sync.start()
+            self.outbox.start()
+
+            # DNS, the CA bundle, pooled connections and the serverless backend
+            # are warmed in the background so the first customer doesn't pay for
+            # them; the backend is pinged whenever it has been idle for
+            # SMARTPALMS_KEEP_WARM seconds (0 = warm up once, never ping)
+            from warmup import DnsCache, Warmup
+            self.warmup = Warmup(
+                self.api,
+                dns=DnsCache(),
+                keep_warm_interval=float(os.environ.get("SMARTPALMS_KEEP_WARM", "240"))
+            ).start()
+
+            # Operators open lockers and watch relay/UV state through a
+            # token-protected API on localhost; an empty port disables it
+            control_port = os.environ.get("SMARTPALMS_CONTROL_PORT", "9110")
+            if control_port:
+                from control_api import ControlApi, load_or_create_token
+                token = os.environ.get("SMARTPALMS_CONTROL_TOKEN") or load_or_create_token(
+                    os.path.join(self.data_dir, "control_token")
+                )
+                self.control_api = ControlApi(self, token, port=int(control_port)).start()
+        except Exception as e:
+            print(f"Service Startup Error: {str(e)}")
+            self.fail("Failed to start kiosk services. Please restart the kiosk.")
+            return
+
+        self.ready = True
+        self.timer.report()
+        self.publish("ready", self.health())
+
+    def shrink_databases(self, cache_kib: int = None):
+        """Release SQLite page caches, or with cache_kib also cap them at that size"""
+        for store in (self.otp_cache, self.replica, self.outbox):
+            with store.lock:
+                if cache_kib:
+                    store.db.execute(f"PRAGMA cache_size=-{int(cache_kib)}")
+                store.db.execute("PRAGMA shrink_memory")
+
+    def fail(self, message: str):
+        self.error = message
+        self.publish("fatal", {"message": message})
+
+    def subscribe(self, callback):
+        """Register callback(event, data); returns a function that unsubscribes"""
+        with self.listeners_lock:
+            self.listeners.append(callback)
+
+        def unsubscribe():
+            with self.listeners_lock:
+                if callback in self.listeners:
+                    self.listeners.remove(callback)
+        return unsubscribe
+
+    def publish(self, event: str, data):
+        with self.listeners_lock:
+            listeners = list(self.listeners)
+        for callback in listeners:
+            try:
+                callback(event, data)
+            except Exception as e:
+                print(f"Core event listener error: {str(e)}")
+
+    def health(self):
+        if not self.ready:
+            return {"ready": False, "online": False, "message": self.error or "", "error": self.error}
+        return health_from_snapshot(self.connectivity.snapshot())
+
+    def handle_connectivity_change(self, snapshot):
+        if snapshot.online:
+            # Deliver anything journaled while offline as soon as the backend is back
+            self.outbox.flush_now()
+            self.replica_sync.sync_now()
+        outcome = "online" if snapshot.online else ("link_down" if not snapshot.link_up else "backend_down")
+        self.events.record("connectivity", outcome, value=(snapshot.rtt or 0) * 1000)
+        self.publish("connectivity", health_from_snapshot(snapshot, ready=self.ready))
+
+    def write_relay(self, channel, active: bool):
+        # Staged per bank; the schedulers flush once per tick
+        self.topology.write(channel, active)
+        if self.relay_journal:
+            self.relay_journal.set_actual(channel, active)
+
+    def record_relay_deadline(self, channel, deadline):
+        if self.relay_journal:
+            self.relay_journal.set_deadline(channel, deadline)
+
+    def reconcile_relays(self):
+        """Settle relays the previous run left mid-pulse, in one pass
+
+        The banks have just been set up with every relay off. Lock pulses
+        are never resumed; interrupted UV cycles resume for the time left
+        on their deadline, or are cancelled if it has passed.
+        """
+        if not self.relay_journal or self.relay_journal.was_clean:
+            return
+        for action in reconcile(self.relay_journal.previous, max_uv=self.uv_light_duration):
+            locker_number = action["locker"]
+            print(f"Relay reconciliation, locker {locker_number}: {action['detail']}; {action['action']}")
+            if action["action"] == "resumed" and not self.uv_scheduler.start(locker_number, action["remaining"]):
+                action["action"] = "cancelled"  # No longer a UV locker
+            self.events.record("relay", action["action"], locker_number, action.get("remaining", 0) * 1000)
+
+    def open_locker(self, locker_number: str, on_closed=None, wall: str = None):
+        """Pulse the locker relay without blocking the caller
+
+        The relay is released by the scheduler after lock_pulse_duration
+        seconds; the UV cycle starts once the lock has re-engaged and
+        on_closed (if given) is called on the scheduler thread. With a wall
+        given, only lockers on that wall are opened.
+        """
+        if self.topology.on_wall(locker_number, wall):
+            channel = self.topology.lock_channel(locker_number)
+
+            def handle_pulse_complete(_channel):
+                self.publish("locker", {"locker": locker_number, "lock": "closed"})
+                # Start UV light for this locker
+                self.start_uv_light(locker_number)
+                if on_closed:
+                    on_closed(locker_number)
+
+            pulsed = self.relay_scheduler.pulse(channel, self.lock_pulse_duration, handle_pulse_complete)
+            if pulsed:
+                self.publish("locker", {"locker": locker_number, "lock": "open"})
+            return pulsed
+        return False
+
+    def start_uv_light(self, locker_number: str, duration: float = None):
+        """Request a UV cycle for a locker (may queue behind the lamp limit)"""
+        result = self.uv_scheduler.start(locker_number, duration)
+        if result:
+            self.events.record("uv", result, locker_number)
+        return result
+
+    def stop_uv_light(self, locker_number: str):
+        """Turn a lamp off early or drop its queued cycle"""
+        return self.uv_scheduler.cancel(locker_number)
+
+    def relay_state(self):
+        """Lock and UV relay state per locker, e.g. {"3": {"lock": False, "uv": True}}"""
+        return self.topology.relay_states()
+
+    def handle_uv_change(self, state):
+        with self.uv_lamps_lock:
+            # Cycles started by start_uv_light are already recorded; log the
+            # ones promoted from the queue and every lamp that went off
+            for locker_number, lamp in state.items():
+                if lamp["state"] == "on" and self.uv_lamps.get(locker_number) == "queued":
+                    self.events.record("uv", "on", locker_number)
+            for locker_number in self.uv_lamps.keys() - state.keys():
+                self.events.record("uv", "off", locker_number)
+            self.uv_lamps = {locker_number: lamp["state"] for locker_number, lamp in state.items()}
+        self.publish("uv", state)
+
+    def uv_state(self):
+        """Current lamp state per locker, e.g. {"3": {"state": "on", "remaining": 12.5}}"""
+        return self.uv_scheduler.state()
+
+    def not_ready(self):
+        return {"status": "starting", "message": "Kiosk is starting up. Please try again in a moment."}
+
+    def locker_busy(self, locker_number: str):
+        """True while the locker's lock relay is still energized from an earlier open"""
+        return locker_number in self.topology and self.relay_scheduler.is_active(self.topology.lock_channel(locker_number))
+
+    def already_open(self, locker_number: str):
+        return {"status": "already_open", "locker": locker_number,
+                "message": f"Locker {locker_number} is already opening."}
+
+    # Riders: OTP submit
+
+    def submit_otp(self, otp: str, on_done, wall: str = None, origin=None):
+        started = time.monotonic()
+
+        def respond(result):
+            # Every attempt is audited, including repeats answered without a lookup
+            self.events.record("otp", result["status"], result.get("locker"), (time.monotonic() - started) * 1000)
+            on_done(result)
+
+        if not self.ready:
+            respond(self.not_ready())
+            return
+
+        key = ("otp", otp, wall)
+        verdict, recent = self.admission.begin(key, "Verifying code", origin)
+        if verdict == "in_flight":
+            respond({"status": "in_progress", "message": "Already checking this code..."})
+            return
+        if verdict == "recent":
+            # Repeated code: answer from the last outcome instead of asking again
+            respond(self.already_open(recent["locker"]) if recent["status"] == "opened" else recent)
+            return
+        if verdict == "full":
+            respond({"status": "busy", "message": "Kiosk is busy. Please try again in a moment."})
+            return
+
+        def finish(result):
+            self.admission.end(key)
+            if result["status"] in ("opened", "rejected"):
+                # Opened codes are remembered for the pulse, rejections briefly
+                self.admission.remember(key, result, None if result["status"] == "opened" else 2)
+            respond(result)
+
+        trace = REGISTRY.trace("submit")
+
+        # Validate against the locally synced cache first; this works offline
+        with trace.span("cache_lookup"):
+            locker_number = self.otp_cache.lookup(otp)
+        if locker_number is not None:
+            finish(self.open_for_otp(otp, locker_number, wall, trace, source="cache"))
+            return
+
+        lookup = self.take_prefetched(otp)
+        if lookup is not None:
+            def adopt(future):
+                try:
+                    result = future.result()
+                except Exception as e:
+                    finish(self.handle_otp_error(e, trace))
+                    return
+                finish(self.handle_otp_result(otp, result, wall, trace))
+
+            trace.attrs["prefetched"] = True
+            lookup.add_done_callback(adopt)
+            return
+
+        self.api.submit(
+            trace.wrap("api_lookup", self.verify_otp), otp,
+            on_success=lambda result: finish(self.handle_otp_result(otp, result, wall, trace)),
+            on_error=lambda e: finish(self.handle_otp_error(e, trace))
+        )
+
+    def prefetch_otp(self, otp: str, on_done=None):
+        """Start looking up a code the rider has typed but not yet submitted
+
+        Only the lookup runs: nothing is opened or cleared until the code is
+        submitted, and a code that isn't submitted is simply dropped. Codes
+        already in the local cache need no lookup.
+        """
+        on_done = on_done or (lambda result: None)
+        if not self.ready or self.otp_cache.lookup(otp) is not None:
+            on_done({"status": "skipped", "message": ""})
+            return
+        with self.prefetch_lock:
+            if self.prefetched and self.prefetched[0] == otp and self.prefetch_fresh(self.prefetched):
+                on_done({"status": "prefetching", "message": ""})
+                return
+            if self.prefetched:
+                OTP_PREFETCHES.inc(result="unused")
+            self.prefetched = (otp, self.api.submit(self.verify_otp, otp), time.monotonic())
+        OTP_PREFETCHES.inc(result="started")
+        on_done({"status": "prefetching", "message": ""})
+
+    def prefetch_fresh(self, prefetched):
+        return time.monotonic() - prefetched[2] < self.otp_prefetch_ttl
+
+    def take_prefetched(self, otp: str):
+        """The pending or finished prefetch lookup for this code, if still fresh"""
+        with self.prefetch_lock:
+            prefetched = self.prefetched
+            if not prefetched or prefetched[0] != otp:
+                return None
+            self.prefetched = None
+        if not self.prefetch_fresh(prefetched):
+            OTP_PREFETCHES.inc(result="expired")
+            return None
+        OTP_PREFETCHES.inc(result="used")
+        return prefetched[1]
+
+    def verify_otp(self, otp: str):
+        """Look up the OTP (runs on a worker thread)
+
+        This GET is the only request on the critical path: connectivity is
+        not re-probed here, the connectivity monitor's cached snapshot is only
+        used to explain a failed lookup. Returns a (data, error_message)
+        tuple; exactly one of them is set.
+        """
+        import requests  # already loaded by the API client; deferred for fast startup
+
+        try:
+            start = time.perf_counter()
+            response = self.api.lookup_otp(otp)
+            OTP_LOOKUP.observe(time.perf_counter() - start)
+            response.raise_for_status()  # Raise exception for bad status codes
+            return response.json(), None
+        except requests.exceptions.Timeout as e:
+            # The API client has already told the connectivity monitor to re-probe
+            REGISTRY.error("otp_lookup", e)
+            return None, "Server not responding. Please try again."
+        except requests.exceptions.ConnectionError as e:
+            REGISTRY.error("otp_lookup", e)
+            return None, (self.connectivity.snapshot().message
+                          or "Cannot connect to server. Please check your internet connection.")
+        except requests.exceptions.HTTPError:
+            if response.status_code == 404:
+                return None, "Invalid OTP code"
+            REGISTRY.error("otp_lookup", f"HTTP{response.status_code}")
+            return None, f"Server error ({response.status_code}). Please try again later."
+        except ValueError:  # JSON decode error
+            REGISTRY.error("otp_lookup", "InvalidJSON")
+            return None, "Invalid server response. Please try again."
+
+    def handle_otp_result(self, otp: str, result, wall, trace):
+        data, error_message = result
+        if error_message:
+            trace.finish("rejected", source="api", reason=error_message)
+            return {"status": "rejected", "message": error_message}
+
+        try:
+            if data.get("success"):
+                return self.open_for_otp(otp, data["locker"]["number"], wall, trace, source="api")
+            # Try to get error message from either "Error" or "message" field
+            error_message = data.get("Error") or data.get("message", "Invalid OTP code")
+            trace.finish("rejected", source="api", reason=error_message)
+            return {"status": "rejected", "message": error_message}
+        except Exception as e:
+            print(f"Unexpected error: {str(e)}")
+            REGISTRY.error("submit", e)
+            trace.finish("error", source="api", error=type(e).__name__)
+            return {"status": "error", "message": "System error. Please try again."}
+
+    def handle_otp_error(self, error: Exception, trace):
+        print(f"Unexpected error: {str(error)}")
+        REGISTRY.error("submit", error)
+        trace.finish("error", source="api", error=type(error).__name__)
+        return {"status": "error", "message": "System error. Please try again."}
+
+    def open_for_otp(self, otp: str, locker_number: str, wall, trace, source: str):
+        if locker_number in self.topology and not self.topology.on_wall(locker_number, wall):
+            # Valid code, but for a locker on another wall; leave it unused
+            trace.finish("wrong_wall", source=source, locker=locker_number)
+            return {"status": "rejected", "locker": locker_number,
+                    "message": f"Locker {locker_number} is not at this kiosk."}
+        if self.locker_busy(locker_number):
+            # Door is already unlocked; keep the code and spare the relay
+            trace.finish("already_open", source=source, locker=locker_number)
+            return self.already_open(locker_number)
+        try:
+            with trace.span("relay_open"):
+                opened = self.open_locker(locker_number, wall=wall)
+            if not opened:
+                trace.finish("invalid_locker", source=source, locker=locker_number)
+                return {"status": "invalid_locker", "locker": locker_number,
+                        "message": f"Invalid locker number: {locker_number}"}
+
+            # The relay is already energizing; clear the OTP in the background
+            if source == "cache":
+                # Tombstoned until the outbox delivers the PATCH /{otp}
+                self.otp_cache.consume(otp)
+            else:
+                self.otp_cache.discard(otp)
+            self.clear_otp(otp, locker_number)
+            trace.finish("opened", source=source, locker=locker_number)
+            self.events.record("open", "opened", locker_number, source=source)
+            return {"status": "opened", "locker": locker_number, "message": f"Opening locker {locker_number}!"}
+        except Exception as e:
+            print(f"Locker operation error: {str(e)}")
+            REGISTRY.error("relay", e)
+            trace.finish("error", source=source, error=type(e).__name__)
+            return {"status": "error", "message": "Failed to operate locker. Please try again."}
+
+    def clear_otp(self, otp: str, locker_number: str):
+        """Journal the PATCH that clears a used OTP on the backend
+
+        The key is unique per use: a code the backend issues again later
+        must be cleared again, not matched to the earlier delivered clear.
+        """
+        self.outbox.enqueue(
+            "otp_clear", {"otp": otp}, key=f"otp_clear:{otp}:{locker_number}:{time.time_ns()}"
+        )
+
+    # Owners: login and opening their lockers
+
+    def login(self, email: str, password: str, on_done):
+        """Authenticate an owner; on_done gets {"status": "ok", "session", "data", "cached"}
+
+        Cached sessions are returned at once and, once stale, revalidated in
+        the background; the outcome is published as a "session" event
+        ({"session", "status": "refreshed"|"expired", "data"}).
+        """
+        if not self.ready:
+            on_done(self.not_ready())
+            return
+
+        trace = REGISTRY.trace("login")
+        key = self.session_cache.key(email, password)
+        session, stale = self.session_cache.get(key)
+        if session:
+            # Stale-while-revalidate: return what we have, refresh if it's aging
+            trace.finish("cached", stale=stale)
+            on_done({"status": "ok", "session": key, "data": self.replica.merge_owner_data(session.data),
+                     "cached": True})
+            if stale:
+                self.api.submit(
+                    self.refresh_session, key, email, password,
+                    on_success=lambda response: self.handle_session_refresh(key, response),
+                    on_error=lambda e: REGISTRY.error("session_refresh", e)
+                )
+            return
+
+        self.api.submit(
+            trace.wrap("api_login", self.api.login), email, password,
+            on_success=lambda response: on_done(self.handle_login_response(key, response, trace)),
+            on_error=lambda e: on_done(self.handle_login_error(e, trace))
+        )
+
+    def refresh_session(self, key: str, email: str, password: str):
+        """Revalidate a cached session; runs on the API pool
+
+        Uses the server-issued token when there is one, so the password is
+        only re-sent if the token has been revoked or expired.
+        """
+        session, _ = self.session_cache.get(key)
+        if session and session.token:
+            response = self.api.login_with_token(session.token)
+            if response.status_code != 401:
+                return response
+        return self.api.login(email, password)
+
+    def handle_session_refresh(self, key: str, response):
+        if response.ok:
+            try:
+                data = response.json()
+            except ValueError:
+                return
+            self.session_cache.put(key, data, token=data.get("token"))
+            self.publish("session", {"session": key, "status": "refreshed",
+                                     "data": self.replica.merge_owner_data(data)})
+        elif response.status_code == 401:
+            # Password changed or account disabled since it was cached
+            self.session_cache.invalidate(key)
+            self.publish("session", {"session": key, "status": "expired"})
+
+    def handle_login_response(self, key: str, response, trace):
+        if not response.ok:
+            trace.finish("rejected", status=response.status_code)
+            return {"status": "rejected", "message": "Invalid email or password"}
+        try:
+            data = response.json()
+        except ValueError:
+            REGISTRY.error("login", "InvalidJSON")
+            trace.finish("error")
+            return {"status": "error", "message": "Invalid server response. Please try again."}
+        self.session_cache.put(key, data, token=data.get("token"))
+        trace.finish("ok", lockers=len(data.get("lockers", [])))
+        return {"status": "ok", "session": key, "data": self.replica.merge_owner_data(data), "cached": False}
+
+    def handle_login_error(self, error: Exception, trace):
+        print(f"Login error: {str(error)}")
+        REGISTRY.error("login", error)
+        trace.finish("error", error=type(error).__name__)
+        return {"status": "error", "message": "Connection error. Please try again."}
+
+    def open_owner_locker(self, locker_number: str, locker_id: str, on_done, wall: str = None):
+        """Open one of a logged-in owner's lockers and journal the access"""
+        def journal():
+            # Create access history for type "Kiosk Log In"; only sent if we have the locker ID
+            if locker_id:
+                self.outbox.enqueue("access_history", {"type": "Kiosk Log In", "lockerId": locker_id})
+
+        self.open_requested(locker_number, on_done, wall, "owner", on_opened=journal)
+
+    def open_remote_locker(self, locker_number: str, on_done):
+        """Open a locker for an operator (control API), on the same relay path as the front-ends"""
+        if locker_number not in self.topology:
+            on_done({"status": "invalid_locker", "locker": locker_number,
+                     "message": f"Invalid locker number: {locker_number}"})
+            return
+        self.open_requested(locker_number, on_done, None, "remote")
+
+    def open_requested(self, locker_number: str, on_done, wall, source: str, on_opened=None):
+        if not self.ready:
+            on_done(self.not_ready())
+            return
+        if self.locker_busy(locker_number):
+            # Repeated taps on Open while the lock is released
+            self.events.record("open", "already_open", locker_number, source=source)
+            on_done(self.already_open(locker_number))
+            return
+        try:
+            if not self.open_locker(locker_number, wall=wall):
+                self.events.record("open", "error", locker_number, source=source)
+                on_done({"status": "error", "locker": locker_number,
+                         "message": f"Failed to open locker {locker_number}"})
+                return
+            if on_opened:
+                on_opened()
+            self.events.record("open", "opened", locker_number, source=source)
+            on_done({"status": "opened", "locker": locker_number, "message": f"Opening locker {locker_number}!"})
+        except Exception as e:
+            print(f"Locker operation error: {str(e)}")
+            REGISTRY.error("relay", e)
+            on_done({"status": "error", "message": "System error. Please try again."})
+
+    def shutdown(self):
+        """Stop the services and release every relay; later calls do nothing"""
+        with self.shutdown_lock:
+            if self.shut_down:
+                return
+            self.shut_down = True
+
+        # Release any locker relays that are still pulsing
+        self.relay_scheduler.shutdown()
+        for service in (self.control_api, self.warmup, self.resource_guard, self.connectivity, self.replica_sync, self.outbox, self.metrics_exporter):
+            if service:
+                service.stop()
+        if self.api:
+            self.api.close()
+
+        # Turn off all UV lights before exiting
+        self.uv_scheduler.shutdown()
+        if self.relays_ready:
+            self.topology.all_off()  # Ensure all relays are inactive
+            self.topology.cleanup()
+        if self.relay_journal:
+            self.relay_journal.close()
+        self.events.stop()
+
+
+def main():
+    import argparse
+    import signal
+    from core_ipc import CoreServer
+
+    parser = argparse.ArgumentParser(description="Run the kiosk core headless and serve front-ends over a local socket")
+    parser.add_argument("--socket", default=os.environ.get("SMARTPALMS_CORE_SOCKET", "/tmp/smartpalms-core.sock"))
+    args = parser.parse_args()
+
+    core = KioskCore()
+    stopped = threading.Event()
+
+    def handle_event(event, data):
+        if event == "fatal":
+            print(f"Kiosk core failed: {data['message']}")
+            stopped.set()
+
+    core.subscribe(handle_event)
+    server = CoreServer(core, args.socket).start()
+    core.start()
+    print(f"Kiosk core serving front-ends on {args.socket}")
+
+    signal.signal(signal.SIGTERM, lambda *_: stopped.set())
+    try:
+        while not stopped.wait(1):
+            pass
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.stop()
+        core.shutdown()
+
+
+if __name__ == "__main__":
+    main()
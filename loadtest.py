@@ -0,0 +1,185 @@
+"""Headless load generator for the kiosk transaction paths
+
+Replays concurrent OTP and owner-login sessions against a stub (or real)
+API through the same KioskCore the front-ends drive, on simulated relay
+banks, and reports open latency and throughput:
+
+    python loadtest.py --sessions 5000 --concurrency 8 --latency 0.05
+
+By default the replica sync is stopped so every code is verified with the
+backend; --cached lets it fill the OTP cache first, as on a kiosk that has
+been online for a while. Sessions past the core's admission limit are
+turned away and reported as "busy".
+"""
+import argparse
+import contextlib
+import io
+import os
+import random
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from benchmark import LOCKERS, call, percentile, write_topology
+from stub_server import StubServer
+
+
+def build_stub_data(sessions: int):
+    """Unique OTP per OTP session (an open consumes it) plus one owner per locker"""
+    numbers = [str(number) for number in range(1, LOCKERS + 1)]
+    otps = {f"{100000 + i}": numbers[i % LOCKERS] for i in range(sessions)}
+    users = {
+        f"owner{number}@example.com": {
+            "password": "password",
+            "name": f"Owner {number}",
+            "lockers": [{
+                "id": f"locker-{number}",
+                "number": number,
+                "size": "small",
+                "subscription": {"status": "active", "expiresAt": "2030-01-01T00:00:00.000Z"},
+            }],
+        }
+        for number in numbers
+    }
+    return {"otps": otps, "otp_expiry": "2030-01-01T00:00:00.000Z", "users": users}
+
+
+def start_core(base_url: str, work_dir: str, pulse: float, cached: bool, expected_codes: int):
+    from kiosk_core import KioskCore
+
+    topology_path = os.path.join(work_dir, "topology.toml")
+    write_topology(topology_path)
+    core = KioskCore(base_url=base_url, data_dir=os.path.join(work_dir, "core"), topology_path=topology_path)
+    os.makedirs(core.data_dir, exist_ok=True)
+    core.lock_pulse_duration = pulse
+    core.uv_light_duration = pulse
+    core.uv_scheduler.duration = pulse
+
+    ready = threading.Event()
+    core.subscribe(lambda event, data: ready.set() if event in ("ready", "fatal") else None)
+    core.start()
+    if not ready.wait(30) or not core.ready:
+        raise RuntimeError(f"Kiosk core failed to start: {core.error}")
+
+    if cached:
+        deadline = time.monotonic() + 60
+        while len(core.otp_cache) < expected_codes and time.monotonic() < deadline:
+            time.sleep(0.1)
+    else:
+        core.replica_sync.stop()
+    return core
+
+
+class LoadTest:
+    def __init__(self, core, concurrency: int, login_ratio: float):
+        self.core = core
+        self.concurrency = concurrency
+        self.login_ratio = login_ratio
+
+        self.lock = threading.Lock()
+        self.open_latencies = []
+        self.login_latencies = []
+        self.outcomes = {}  # status other than "opened" -> count
+
+        self.opens = 0
+        core.subscribe(self.count_open)
+
+    def count_open(self, event: str, data):
+        if event == "locker" and data.get("lock") == "open":
+            with self.lock:
+                self.opens += 1
+
+    def record(self, result: dict, started: float):
+        status = result.get("status")
+        with self.lock:
+            if status == "opened":
+                self.open_latencies.append(time.perf_counter() - started)
+            else:
+                self.outcomes[status] = self.outcomes.get(status, 0) + 1
+
+    def otp_session(self, otp: str):
+        started = time.perf_counter()
+        _, result = call(self.core.submit_otp, otp)
+        self.record(result, started)
+
+    def login_session(self, email: str):
+        started = time.perf_counter()
+        elapsed, result = call(self.core.login, email, "password")
+        if result.get("status") != "ok":
+            self.record(result, started)
+            return
+        with self.lock:
+            self.login_latencies.append(elapsed)
+        locker = result["data"]["lockers"][0]
+        _, result = call(self.core.open_owner_locker, locker["number"], locker["id"])
+        self.record(result, started)
+
+    def run(self, otps, emails, sessions: int):
+        jobs = []
+        otp_iter = iter(otps)
+        for _ in range(sessions):
+            if emails and random.random() < self.login_ratio:
+                jobs.append((self.login_session, random.choice(emails)))
+            else:
+                jobs.append((self.otp_session, next(otp_iter)))
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix="session") as pool:
+            for func, arg in jobs:
+                pool.submit(func, arg)
+        return time.perf_counter() - started
+
+    def report(self, sessions: int, elapsed: float):
+        completed = len(self.open_latencies)
+        print(f"Sessions: {sessions}  opened: {completed}  elapsed: {elapsed:.2f}s  "
+              f"throughput: {completed / elapsed:.1f} opens/s")
+        for label, values in (("Login", self.login_latencies), ("Open latency", self.open_latencies)):
+            values = sorted(values)
+            print(f"{label:18} p50={percentile(values, 0.5) * 1000:.1f}ms "
+                  f"p90={percentile(values, 0.9) * 1000:.1f}ms "
+                  f"p99={percentile(values, 0.99) * 1000:.1f}ms "
+                  f"max={(values[-1] if values else float('nan')) * 1000:.1f}ms")
+        if self.outcomes:
+            print("Not opened: " + ", ".join(f"{status}={count}" for status, count in sorted(self.outcomes.items())))
+        print(f"Lock relays pulsed: {self.opens}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay concurrent kiosk sessions against a stub API")
+    parser.add_argument("--sessions", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=8,
+                        help="concurrent sessions; the core admits 8 submits at a time")
+    parser.add_argument("--login-ratio", type=float, default=0.2, help="fraction of sessions that are owner logins")
+    parser.add_argument("--pulse", type=float, default=0.05, help="simulated relay pulse length (s)")
+    parser.add_argument("--latency", type=float, default=0.0, help="stub API latency per request (s)")
+    parser.add_argument("--jitter", type=float, default=0.0)
+    parser.add_argument("--loss", type=float, default=0.0)
+    parser.add_argument("--cached", action="store_true", help="sync codes into the OTP cache before the run")
+    parser.add_argument("--verbose", action="store_true", help="show the kiosk's own log output")
+    args = parser.parse_args()
+
+    # The metrics and control endpoints would clash with a kiosk running on
+    # the same machine, and keep-warm pings would add to the measured load
+    os.environ.update({"SMARTPALMS_METRICS_PORT": "", "SMARTPALMS_CONTROL_PORT": "", "SMARTPALMS_KEEP_WARM": "0"})
+    data = build_stub_data(args.sessions)
+    server = StubServer(data=data, latency=args.latency, jitter=args.jitter, loss=args.loss).start()
+    log = contextlib.nullcontext() if args.verbose else contextlib.redirect_stdout(io.StringIO())
+    try:
+        with tempfile.TemporaryDirectory(prefix="smartpalms-load-") as work_dir:
+            with log:
+                core = start_core(server.base_url, work_dir, args.pulse, args.cached, len(data["otps"]))
+            try:
+                test = LoadTest(core, args.concurrency, args.login_ratio)
+                with log:
+                    elapsed = test.run(list(data["otps"]), list(data["users"]), args.sessions)
+            finally:
+                with log:
+                    core.shutdown()
+            test.report(args.sessions, elapsed)
+    finally:
+        server.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,149 +1,139 @@
+from startup import StartupTimer
 import tkinter as tk
 from tkinter import ttk
-import RPi.GPIO as GPIO
-import requests
 import sys
+import os
+import queue
 import time
-import subprocess
-import threading
-import certifi
+from screens import ScreenManager, RowPool
+from keypad import NumericKeypad, OtpFormat
+from metrics import REGISTRY, UI_LOOP_LAG
+from watchdog import UIWatchdog
+from resources import WidgetLeakDetector, count_widgets
 
 class LockerKioskApplication:
+    """Tk front-end: screens and input, with all locker control in a KioskCore
+
+    By default the core runs in this process. With SMARTPALMS_CORE_SOCKET
+    set, the front-end attaches to a shared core process instead (see
+    kiosk_core.py), and SMARTPALMS_WALL limits it to one wall's lockers.
+    """
+
     def __init__(self, root: tk.Tk):
         self.root = root
-        self.base_url = "https://smartpalms.vercel.app/api"
-        
-        # Use certifi for certificate verification
-        self.cert_path = certifi.where()
-        
-        # Map locker numbers to GPIO pins
-        self.locker_pins = {
-            "1": 17,  # GPIO pin for locker 1
-            "2": 27,  # GPIO pin for locker 2
-            "3": 22,  # GPIO pin for locker 3
-            "4": 23,  # GPIO pin for locker 4
-            "5": 24,  # GPIO pin for locker 5
-            "6": 25,  # GPIO pin for locker 6
-            "7": 4,   # GPIO pin for locker 7
-        }
+        self.startup_timer = StartupTimer()
+        self.exiting = False
         
-        # Map locker numbers to UV light GPIO pins
-        self.uv_light_pins = {
-            "1": 5,   # GPIO pin for UV light 1
-            "2": 6,   # GPIO pin for UV light 2
-            "3": 12,  # GPIO pin for UV light 3
-            "4": 13,  # GPIO pin for UV light 4
-            "5": 16,  # GPIO pin for UV light 5
-            "6": 19,  # GPIO pin for UV light 6
-            "7": 20,  # GPIO pin for UV light 7
-        }
+        # Local files (stall reports) live next to the app unless overridden
+        self.data_dir = os.environ.get("SMARTPALMS_DATA_DIR", os.path.dirname(os.path.abspath(__file__)))
         
-        # Track active UV light threads
-        self.active_uv_threads = {}
+        # Callbacks from core threads are queued here and run on the Tk thread
+        self.ui_queue = queue.Queue()
+        self.ui_poll_due = None
+        
+        # The locker wall this display stands at; None means every locker
+        self.wall = os.environ.get("SMARTPALMS_WALL") or None
+        
+        core_socket = os.environ.get("SMARTPALMS_CORE_SOCKET")
+        if core_socket:
+            # Thin front-end: relays, backend pool and health monitor are shared
+            from core_ipc import CoreClient
+            self.core = CoreClient(core_socket)
+        else:
+            from kiosk_core import KioskCore
+            self.core = KioskCore(timer=self.startup_timer)
         
-        # UV light duration in seconds (30 seconds)
-        self.uv_light_duration = 30
+        # Core events arrive on core threads; handle them on the Tk thread
+        self.core.subscribe(lambda event, data: self.call_on_ui(self.handle_core_event, event, data))
+        self.ready = False
         
         # Exit code
         self.exit_code = "9999EXIT"
         
-        # Setup GPIO
-        try:
-            GPIO.setmode(GPIO.BCM)
-            GPIO.setwarnings(False)  # Disable warnings about channel in use
-            
-            # Setup all locker pins as inputs first (default state)
-            for pin in self.locker_pins.values():
-                GPIO.setup(pin, GPIO.IN)  # First set as input (default state)
-                time.sleep(0.1)  # Small delay between operations
-                
-            # Then configure as outputs with proper state
-            for pin in self.locker_pins.values():
-                GPIO.setup(pin, GPIO.OUT, initial=GPIO.HIGH)  # Set as output with initial HIGH
-                time.sleep(0.1)  # Small delay between operations
-                GPIO.output(pin, GPIO.HIGH)  # Ensure relay is inactive (HIGH)
-            
-            # Setup all UV light pins
-            for pin in self.uv_light_pins.values():
-                GPIO.setup(pin, GPIO.IN)  # First set as input (default state)
-                time.sleep(0.1)  # Small delay between operations
-                
-            # Then configure UV light pins as outputs with proper state (initially off)
-            for pin in self.uv_light_pins.values():
-                GPIO.setup(pin, GPIO.OUT, initial=GPIO.HIGH)  # Set as output with initial HIGH (off)
-                time.sleep(0.1)  # Small delay between operations
-                GPIO.output(pin, GPIO.HIGH)  # Ensure relay is inactive (HIGH)
-                
-        except Exception as e:
-            print(f"GPIO Setup Error: {str(e)}")
-            self.show_error_and_exit("Failed to initialize GPIO. Please check permissions and hardware.")
-        
-        self.current_frame = None
-        self.setup_ui()
-        self.setup_keyboard_bindings()
-        # Show OTP screen as the landing page instead of mode selection
-        self.show_otp_screen()
-        
-        # Start periodic connection check
-        self.check_connection_periodically()
-
-    def check_wifi_connection(self):
-        try:
-            # First check if wlan0 exists and is up
-            iwconfig_output = subprocess.check_output(['iwconfig', 'wlan0']).decode()
-            if "ESSID:off/any" in iwconfig_output:
-                print("WiFi not connected")
-                return False
-                
-            # Then try to reach a reliable server
-            requests.get("https://8.8.8.8", timeout=3, verify=self.cert_path)
-            return True
-        except requests.exceptions.Timeout:
-            print("Network timeout - server not reachable")
-            return False
-        except requests.exceptions.SSLError as e:
-            print(f"SSL Error: {str(e)}")
-            # If we get SSL error, try without verification
-            try:
-                requests.get("https://8.8.8.8", timeout=3, verify=False)
-                return True
-            except:
-                return False
-        except subprocess.CalledProcessError:
-            print("WiFi interface not found")
-            return False
-        except Exception as e:
-            print(f"Unexpected network error: {str(e)}")
-            return False
-
-    def check_api_availability(self):
-        try:
-            response = requests.get(f"{self.base_url}/test", timeout=5, verify=self.cert_path)
-            return response.status_code == 200
-        except requests.exceptions.RequestException as e:
-            print(f"API check error: {str(e)}")
-            return False
-
-    def check_connection_periodically(self):
-        """Check connection every 30 seconds and update status"""
-        if not self.check_wifi_connection():
-            self.show_global_status("No internet connection. Please check your WiFi settings.", error=True)
-        elif not self.check_api_availability():
-            self.show_global_status("Cannot connect to server. Please try again later.", error=True)
-        else:
-            self.show_global_status("")
+        # Owner session shown on the lockers screen (a session cache key)
+        self.current_session = None
         
-        # Schedule next check in 30 seconds
-        self.root.after(30000, self.check_connection_periodically)
+        # When the last OTP was sent, to swallow the second tap of a double tap
+        self.last_submit_at = 0.0
+        
+        # Codes are checked locally (length, digits, optional check digit)
+        # before any lookup is sent
+        self.otp_format = OtpFormat.from_env()
+        
+        # Screens are built once and swapped; see screens.ScreenManager
+        self.screens = ScreenManager(root)
+        self.screens.register("otp", self.build_otp_screen, self.reset_otp_screen)
+        self.screens.register("login", self.build_login_screen, self.reset_login_screen)
+        self.screens.register("lockers", self.build_lockers_screen, self.reset_lockers_screen)
+        
+        # Reports Tk callbacks that hold up the mainloop, with the stack of
+        # the offending handler (python3 watchdog.py stalls.jsonl)
+        self.watchdog = UIWatchdog(
+            root,
+            threshold=0.5,
+            report_path=os.path.join(self.data_dir, "stalls.jsonl")
+        )
+        
+        # Screens are built once, so the widget count should level off; one
+        # that keeps setting new highs is reported as a leak
+        self.widget_leaks = WidgetLeakDetector(strikes=5)
+        
+        with self.startup_timer.phase("ui"):
+            self.watchdog.start()
+            self.process_ui_queue()
+            self.root.after(60000, self.check_widgets)
+            self.setup_ui()
+            self.setup_keyboard_bindings()
+            # Show OTP screen as the landing page instead of mode selection
+            self.show_otp_screen()
+        
+        # GPIO and backend services come up in the background
+        self.core.start()
+
+    def handle_core_event(self, event: str, data):
+        if event == "ready":
+            self.ready = True
+            self.update_connection_status(data)
+        elif event == "connectivity":
+            self.update_connection_status(data)
+        elif event == "unavailable":
+            # Only a remote core can go away; requests fail until it's back
+            self.ready = False
+            self.show_global_status(data["message"], error=True)
+        elif event == "fatal":
+            self.show_error_and_exit(data["message"])
+        elif event == "session":
+            self.handle_session_event(data)
+        elif event == "admission":
+            self.show_pending_work(data)
+
+    def show_pending_work(self, state):
+        """Show the work the core is still processing below the current screen"""
+        if not state["pending"]:
+            self.pending_label.config(text="")
+            return
+        items = ", ".join(state["items"][:3])
+        if state["pending"] > 3:
+            items += ", ..."
+        noun = "request" if state["pending"] == 1 else "requests"
+        self.pending_label.config(text=f"{state['pending']} {noun} in progress: {items}")
+
+    def update_connection_status(self, health=None):
+        """Show the core's cached connection state on the current screen"""
+        if not self.ready:
+            return
+        health = health or self.core.health()
+        self.show_global_status(health["message"], error=not health["online"])
 
     def show_global_status(self, message: str, error: bool = False):
         """Show status message on the current screen"""
-        if hasattr(self, 'status_label') and self.status_label.winfo_exists():
-            self.status_label.config(text=message, foreground='red' if error else 'green')
-        elif hasattr(self, 'login_status_label') and self.login_status_label.winfo_exists():
-            self.login_status_label.config(text=message, foreground='red' if error else 'green')
-        elif hasattr(self, 'locker_status_label') and self.locker_status_label.winfo_exists():
-            self.locker_status_label.config(text=message, foreground='red' if error else 'green')
+        label = {
+            "otp": "status_label",
+            "login": "login_status_label",
+            "lockers": "locker_status_label",
+        }.get(self.screens.current)
+        if label and hasattr(self, label):
+            getattr(self, label).config(text=message, foreground='red' if error else 'green')
 
     def show_error_and_exit(self, message: str):
         """Show error message and exit application after delay"""
@@ -171,84 +161,60 @@ class LockerKioskApplication:
         # Configure the window to be fullscreen
         self.root.attributes('-fullscreen', True)
         self.root.configure(bg='black')
+        
+        # Work the core is still processing, shown below every screen
+        self.pending_label = ttk.Label(self.root, text="", font=('Arial', 12))
+        self.pending_label.place(relx=0.5, rely=0.95, anchor="center")
 
     def setup_keyboard_bindings(self):
         # We'll handle specific bindings for each screen separately
         # The global binding is removed
         pass
 
-    def open_locker(self, locker_number: str):
-        if locker_number in self.locker_pins:
-            pin = self.locker_pins[locker_number]
-            GPIO.output(pin, GPIO.LOW)   # Pull LOW to activate relay
-            time.sleep(10)                # Keep it activated for 1 second
-            GPIO.output(pin, GPIO.HIGH)  # Set back to HIGH to deactivate relay
-            
-            # Start UV light for this locker
-            self.start_uv_light(locker_number)
-            
-            return True
-        return False
-    
-    def start_uv_light(self, locker_number: str):
-        """Start UV light for a specific locker in a separate thread"""
-        if locker_number in self.uv_light_pins:
-            # Cancel any existing UV thread for this locker
-            if locker_number in self.active_uv_threads and self.active_uv_threads[locker_number].is_alive():
-                # We don't actually cancel the thread, just let it continue
-                print(f"UV light for locker {locker_number} already running")
-            else:
-                # Create and start a new thread for this UV light
-                uv_thread = threading.Thread(
-                    target=self.run_uv_light,
-                    args=(locker_number,),
-                    daemon=True  # Make thread daemon so it exits when main program exits
-                )
-                self.active_uv_threads[locker_number] = uv_thread
-                uv_thread.start()
-                print(f"Started UV light for locker {locker_number}")
-    
-    def run_uv_light(self, locker_number: str):
-        """Run UV light for the specified duration"""
-        try:
-            pin = self.uv_light_pins[locker_number]
-            
-            # Turn on UV light (LOW activates the relay)
-            GPIO.output(pin, GPIO.LOW)
-            print(f"UV light {locker_number} ON")
-            
-            # Keep UV light on for the specified duration
-            time.sleep(self.uv_light_duration)
-            
-            # Turn off UV light (HIGH deactivates the relay)
-            GPIO.output(pin, GPIO.HIGH)
-            print(f"UV light {locker_number} OFF")
-            
-        except Exception as e:
-            print(f"UV light error for locker {locker_number}: {str(e)}")
-            # Ensure relay is turned off in case of error
+    def call_on_ui(self, func, *args):
+        """Queue a callback from any thread to run on the Tk mainloop"""
+        self.ui_queue.put((func, args))
+
+    def process_ui_queue(self):
+        """Run callbacks queued by worker threads"""
+        # How late this poll ran is a direct measure of UI event-loop lag
+        if self.ui_poll_due is not None:
+            UI_LOOP_LAG.observe(max(0.0, time.perf_counter() - self.ui_poll_due))
+        
+        while True:
             try:
-                GPIO.output(self.uv_light_pins[locker_number], GPIO.HIGH)
-            except:
-                pass
+                func, args = self.ui_queue.get_nowait()
+            except queue.Empty:
+                break
+            try:
+                func(*args)
+            except Exception as e:
+                print(f"UI callback error: {str(e)}")
+                REGISTRY.error("ui", e)
+        
+        self.ui_poll_due = time.perf_counter() + 0.05
+        self.root.after(50, self.process_ui_queue)
 
-    def show_otp_screen(self):
-        if self.current_frame:
-            self.current_frame.destroy()
-            
-        self.current_frame = ttk.Frame(self.root, padding="20")
-        self.current_frame.place(relx=0.5, rely=0.5, anchor="center")
+    def check_widgets(self):
+        count = count_widgets(self.root)
+        if self.widget_leaks.check(count):
+            print(f"Tk widget count keeps growing ({count} now, on the {self.screens.current} screen); "
+                  f"widgets are probably being created instead of reused")
+        self.root.after(60000, self.check_widgets)
+
+    def build_otp_screen(self):
+        frame = ttk.Frame(self.root, padding="20")
         
         # Title label
         ttk.Label(
-            self.current_frame,
+            frame,
             text="Smart Palms Kiosk",
             font=('Arial', 28, 'bold')
         ).grid(row=0, column=0, columnspan=2, pady=(0, 20))
         
         # Instructions label
         ttk.Label(
-            self.current_frame,
+            frame,
             text="Enter your OTP code:",
             font=('Arial', 16)
         ).grid(row=1, column=0, columnspan=2, pady=(0, 10))
@@ -256,7 +222,7 @@ class LockerKioskApplication:
         # Create and configure input
         self.otp_var = tk.StringVar()
         self.otp_entry = ttk.Entry(
-            self.current_frame, 
+            frame, 
             textvariable=self.otp_var,
             font=('Arial', 24),
             width=10,
@@ -267,76 +233,85 @@ class LockerKioskApplication:
         # Bind Enter key to submit
         self.otp_entry.bind('<Return>', lambda e: self.handle_submit())
         
+        # A complete code is looked up while the rider reaches for Submit
+        self.otp_var.trace_add("write", lambda *_: self.handle_otp_input())
+        
+        # Touch keypad typing into the entry; the keyboard still works too
+        NumericKeypad(frame, self.otp_entry, self.otp_format.length).grid(
+            row=3, column=0, columnspan=2, pady=5
+        )
+        
         # Submit button
         submit_button = ttk.Button(
-            self.current_frame,
+            frame,
             text="Submit",
             command=self.handle_submit,
             width=15
         )
-        submit_button.grid(row=3, column=0, columnspan=2, pady=10)
+        submit_button.grid(row=4, column=0, columnspan=2, pady=10)
         
         # Login button
         ttk.Button(
-            self.current_frame,
+            frame,
             text="Locker Owner Login",
             command=self.show_login_screen,
             width=20
-        ).grid(row=4, column=0, columnspan=2, pady=10)
+        ).grid(row=5, column=0, columnspan=2, pady=10)
         
         # Status label
         self.status_label = ttk.Label(
-            self.current_frame,
+            frame,
             text="",
             font=('Arial', 16),
             wraplength=300,
             justify='center'
         )
-        self.status_label.grid(row=5, column=0, columnspan=2, pady=5)
+        self.status_label.grid(row=6, column=0, columnspan=2, pady=5)
         
-        # Focus on entry
+        return frame
+
+    def reset_otp_screen(self):
+        self.otp_var.set("")
+        self.status_label.config(text="")
         self.otp_entry.focus()
+        self.update_connection_status()
 
-    def show_login_screen(self):
-        if self.current_frame:
-            self.current_frame.destroy()
-            
-        self.current_frame = ttk.Frame(self.root, padding="20")
-        self.current_frame.place(relx=0.5, rely=0.5, anchor="center")
+    def build_login_screen(self):
+        frame = ttk.Frame(self.root, padding="20")
         
         # Title
         ttk.Label(
-            self.current_frame,
+            frame,
             text="Locker Owner Login",
             font=('Arial', 28, 'bold')
         ).grid(row=0, column=0, columnspan=2, pady=(0, 40))
         
         # Email field
         ttk.Label(
-            self.current_frame,
+            frame,
             text="Email:",
             font=('Arial', 14)
         ).grid(row=1, column=0, sticky='e', padx=5)
         
         self.email_var = tk.StringVar()
-        email_entry = ttk.Entry(
-            self.current_frame,
+        self.email_entry = ttk.Entry(
+            frame,
             textvariable=self.email_var,
             font=('Arial', 14),
             width=30
         )
-        email_entry.grid(row=1, column=1, padx=5, pady=10)
+        self.email_entry.grid(row=1, column=1, padx=5, pady=10)
         
         # Password field
         ttk.Label(
-            self.current_frame,
+            frame,
             text="Password:",
             font=('Arial', 14)
         ).grid(row=2, column=0, sticky='e', padx=5)
         
         self.password_var = tk.StringVar()
         password_entry = ttk.Entry(
-            self.current_frame,
+            frame,
             textvariable=self.password_var,
             font=('Arial', 14),
             width=30,
@@ -345,11 +320,11 @@ class LockerKioskApplication:
         password_entry.grid(row=2, column=1, padx=5, pady=10)
         
         # Bind Enter key to login for both fields
-        email_entry.bind('<Return>', lambda e: self.handle_login())
+        self.email_entry.bind('<Return>', lambda e: self.handle_login())
         password_entry.bind('<Return>', lambda e: self.handle_login())
         
         # Buttons frame
-        buttons_frame = ttk.Frame(self.current_frame)
+        buttons_frame = ttk.Frame(frame)
         buttons_frame.grid(row=3, column=0, columnspan=2, pady=20)
         
         ttk.Button(
@@ -369,7 +344,7 @@ class LockerKioskApplication:
         
         # Status label
         self.login_status_label = ttk.Label(
-            self.current_frame,
+            frame,
             text="",
             font=('Arial', 14),
             wraplength=400,
@@ -377,95 +352,97 @@ class LockerKioskApplication:
         )
         self.login_status_label.grid(row=4, column=0, columnspan=2, pady=10)
         
+        return frame
+
+    def reset_login_screen(self):
+        self.email_var.set("")
+        self.password_var.set("")
+        self.login_status_label.config(text="")
         # Set focus
-        email_entry.focus()
+        self.email_entry.focus()
+        self.update_connection_status()
 
-    def show_lockers_screen(self, user_data):
-        if self.current_frame:
-            self.current_frame.destroy()
-            
-        self.current_frame = ttk.Frame(self.root, padding="20")
-        self.current_frame.place(relx=0.5, rely=0.5, anchor="center")
+    def build_lockers_screen(self):
+        frame = ttk.Frame(self.root, padding="20")
         
         # Welcome message
-        ttk.Label(
-            self.current_frame,
-            text=f"Welcome, {user_data['user']['name']}!",
+        self.welcome_label = ttk.Label(
+            frame,
+            text="",
             font=('Arial', 24, 'bold')
-        ).grid(row=0, column=0, columnspan=5, pady=(0, 20))
+        )
+        self.welcome_label.grid(row=0, column=0, columnspan=5, pady=(0, 20))
         
         # Headers
         headers = ['Locker #', 'Size', 'Status', 'Expires At', 'Action']
         for i, header in enumerate(headers):
             ttk.Label(
-                self.current_frame,
+                frame,
                 text=header,
                 font=('Arial', 12, 'bold')
             ).grid(row=1, column=i, padx=10, pady=(0, 10))
         
-        # Store locker IDs for access history
-        self.current_user_locker_ids = {}
-        
-        # Lockers list
-        for i, locker in enumerate(user_data['lockers']):
-            row = i + 2
-            
-            # Store locker ID mapped to locker number
-            self.current_user_locker_ids[locker['number']] = locker['id']
-            
-            # Locker number
-            ttk.Label(
-                self.current_frame,
-                text=locker['number'],
-                font=('Arial', 12)
-            ).grid(row=row, column=0, padx=10, pady=5)
-            
-            # Size
-            ttk.Label(
-                self.current_frame,
-                text=locker['size'].capitalize(),
-                font=('Arial', 12)
-            ).grid(row=row, column=1, padx=10, pady=5)
-            
-            # Status
-            ttk.Label(
-                self.current_frame,
-                text=locker['subscription']['status'].capitalize(),
-                font=('Arial', 12)
-            ).grid(row=row, column=2, padx=10, pady=5)
-            
-            # Expiry date
-            expiry = locker['subscription']['expiresAt'].split('T')[0]
-            ttk.Label(
-                self.current_frame,
-                text=expiry,
-                font=('Arial', 12)
-            ).grid(row=row, column=3, padx=10, pady=5)
-            
-            # Open button
-            ttk.Button(
-                self.current_frame,
-                text="Open",
-                command=lambda n=locker['number']: self.open_locker_and_show_status(n)
-            ).grid(row=row, column=4, padx=10, pady=5)
+        # Locker rows are pooled and reused across logins
+        self.locker_rows = RowPool(frame, self.create_locker_row, first_row=2)
         
         # Logout button
-        ttk.Button(
-            self.current_frame,
+        self.logout_button = ttk.Button(
+            frame,
             text="Logout",
             command=self.show_otp_screen,  # Go back to OTP screen instead of mode selection
             width=15
-        ).grid(row=len(user_data['lockers']) + 2, column=0, columnspan=5, pady=20)
+        )
         
         # Status label
         self.locker_status_label = ttk.Label(
-            self.current_frame,
+            frame,
             text="",
             font=('Arial', 14),
             wraplength=400,
             justify='center'
         )
-        self.locker_status_label.grid(row=len(user_data['lockers']) + 3, column=0, columnspan=5, pady=10)
+        return frame
+
+    def create_locker_row(self, parent):
+        # Locker number, size, status, expiry date, Open button
+        labels = [ttk.Label(parent, text="", font=('Arial', 12)) for _ in range(4)]
+        return labels + [ttk.Button(parent, text="Open")]
+
+    def update_locker_row(self, widgets, locker):
+        number_label, size_label, status_label, expiry_label, open_button = widgets
+        number_label.config(text=locker['number'])
+        size_label.config(text=locker['size'].capitalize())
+        status_label.config(text=locker['subscription']['status'].capitalize())
+        expiry_label.config(text=locker['subscription']['expiresAt'].split('T')[0])
+        open_button.config(command=lambda n=locker['number']: self.open_locker_and_show_status(n))
+
+    def reset_lockers_screen(self, user_data):
+        self.render_lockers(user_data)
+        self.locker_status_label.config(text="")
+        self.update_connection_status()
+
+    def render_lockers(self, user_data):
+        self.welcome_label.config(text=f"Welcome, {user_data['user']['name']}!")
+        
+        # Store locker IDs mapped to locker number for access history
+        self.current_user_locker_ids = {
+            locker['number']: locker['id'] for locker in user_data['lockers']
+        }
+        
+        next_row = self.locker_rows.render(user_data['lockers'], self.update_locker_row)
+        self.logout_button.grid(row=next_row, column=0, columnspan=5, pady=20)
+        self.locker_status_label.grid(row=next_row + 1, column=0, columnspan=5, pady=10)
+
+    def show_otp_screen(self):
+        self.current_session = None
+        self.screens.show("otp")
+
+    def show_login_screen(self):
+        self.current_session = None
+        self.screens.show("login")
+
+    def show_lockers_screen(self, user_data):
+        self.screens.show("lockers", user_data)
 
     def handle_login(self):
         email = self.email_var.get().strip()
@@ -474,24 +451,35 @@ class LockerKioskApplication:
         if not email or not password:
             self.show_login_status("Please enter both email and password", error=True)
             return
-            
-        try:
-            response = requests.post(
-                f"{self.base_url}/lockers/external",
-                json={"email": email, "password": password},
-                timeout=5,
-                verify=self.cert_path
-            )
-            
-            if response.ok:
-                data = response.json()
-                self.show_lockers_screen(data)
-            else:
-                self.show_login_status("Invalid email or password", error=True)
-                
-        except requests.exceptions.RequestException as e:
-            self.show_login_status("Connection error. Please try again.", error=True)
-            print(f"Login error: {str(e)}")
+        
+        if not self.ready:
+            self.show_login_status("Kiosk is starting up. Please try again in a moment.", error=True)
+            return
+        
+        self.core.login(email, password, lambda result: self.call_on_ui(self.handle_login_result, result))
+
+    def handle_login_result(self, result):
+        # The user may have left the login screen while the request was in flight
+        if self.screens.current != "login":
+            return
+        
+        if result["status"] == "ok":
+            self.show_lockers_screen(result["data"])
+            self.current_session = result["session"]
+        else:
+            self.show_login_status(result["message"], error=True)
+
+    def handle_session_event(self, data):
+        """A cached owner session was revalidated in the background"""
+        if self.screens.current != "lockers" or self.current_session != data["session"]:
+            return
+        if data["status"] == "refreshed":
+            # Update the rows in place without clearing the status line
+            self.render_lockers(data["data"])
+        elif data["status"] == "expired":
+            # Password changed or account disabled since it was cached
+            self.show_login_screen()
+            self.show_login_status("Session expired. Please log in again.", error=True)
 
     def show_login_status(self, message: str, error: bool = False):
         self.login_status_label.config(
@@ -502,41 +490,23 @@ class LockerKioskApplication:
             self.root.after(5000, lambda: self.login_status_label.config(text=""))
 
     def open_locker_and_show_status(self, locker_number: str):
-        try:
-            if self.open_locker(locker_number):
-                self.locker_status_label.config(
-                    text=f"Opening locker {locker_number}!",
-                    foreground='green'
-                )
-                self.root.after(5000, lambda: self.locker_status_label.config(text=""))
-                
-                # Create access history for type "Kiosk Log In"
-                try:
-                    access_history_data = {
-                        "type": "Kiosk Log In",
-                        "lockerId": self.current_user_locker_ids.get(locker_number, "")
-                    }
-                    # Only send if we have the locker ID
-                    if access_history_data["lockerId"]:
-                        requests.post(
-                            f"{self.base_url}/access-history",
-                            json=access_history_data,
-                            timeout=5,
-                            verify=self.cert_path
-                        )
-                except Exception as e:
-                    print(f"Failed to create access history: {str(e)}")
-            else:
-                self.locker_status_label.config(
-                    text=f"Failed to open locker {locker_number}",
-                    foreground='red'
-                )
-        except Exception as e:
-            self.locker_status_label.config(
-                text="System error. Please try again.",
-                foreground='red'
-            )
-            print(f"Locker operation error: {str(e)}")
+        self.core.open_owner_locker(
+            locker_number,
+            self.current_user_locker_ids.get(locker_number, ""),
+            lambda result: self.call_on_ui(self.show_locker_result, result),
+            wall=self.wall
+        )
+
+    def show_locker_result(self, result):
+        if self.screens.current != "lockers":
+            return
+        opened = result["status"] in ("opened", "already_open")
+        self.locker_status_label.config(
+            text=result["message"],
+            foreground='green' if opened else 'red'
+        )
+        if opened:
+            self.root.after(5000, lambda: self.locker_status_label.config(text=""))
 
     def handle_submit(self):
         otp = self.otp_var.get().strip()
@@ -547,73 +517,42 @@ class LockerKioskApplication:
             return
             
         if not otp:
-            self.show_status("Please enter OTP", error=True)
+            # The input is cleared on submit, so this is usually a double tap
+            if time.monotonic() - self.last_submit_at > 1.0:
+                self.show_status("Please enter OTP", error=True)
             return
         
-        # Check internet connection first
-        if not self.check_wifi_connection():
-            self.show_status("No internet connection. Please check your WiFi settings.", error=True)
+        # With a configured OTP format, malformed codes and typos caught by
+        # the check digit never reach the backend; the input is kept so it
+        # can be corrected
+        problem = self.otp_format.check(otp)
+        if problem:
+            self.show_status(problem, error=True)
             return
-            
-        if not self.check_api_availability():
-            self.show_status("Cannot connect to server. Please try again later.", error=True)
+        
+        if not self.ready:
+            self.show_status("Kiosk is starting up. Please try again in a moment.", error=True)
             return
-            
-        try:
-            # First, verify OTP and get locker number
-            try:
-                response = requests.get(f"{self.base_url}/{otp}", timeout=5, verify=self.cert_path)
-                response.raise_for_status()  # Raise exception for bad status codes
-                data = response.json()
-            except requests.exceptions.Timeout:
-                self.show_status("Server not responding. Please try again.", error=True)
-                return
-            except requests.exceptions.ConnectionError:
-                self.show_status("Cannot connect to server. Please check your internet connection.", error=True)
-                return
-            except requests.exceptions.HTTPError as e:
-                if response.status_code == 404:
-                    self.show_status("Invalid OTP code", error=True)
-                else:
-                    self.show_status(f"Server error ({response.status_code}). Please try again later.", error=True)
-                return
-            except ValueError:  # JSON decode error
-                self.show_status("Invalid server response. Please try again.", error=True)
-                return
-            
-            if data.get("success"):
-                locker_number = data["locker"]["number"]
-                
-                # Open the corresponding locker
-                try:
-                    if self.open_locker(locker_number):
-                        self.show_status(f"Opening locker {locker_number}!", error=False)
-                        
-                        # Clear the OTP by making PATCH request
-                        try:
-                            patch_response = requests.patch(f"{self.base_url}/{otp}", timeout=5, verify=self.cert_path)
-                            if not patch_response.ok:
-                                print(f"Warning: Failed to clear OTP: {patch_response.status_code}")
-                        except requests.exceptions.RequestException as e:
-                            print(f"Warning: Failed to clear OTP: {str(e)}")
-                    else:
-                        self.show_status(f"Invalid locker number: {locker_number}", error=True)
-                except Exception as e:
-                    self.show_status("Failed to operate locker. Please try again.", error=True)
-                    print(f"Locker operation error: {str(e)}")
-            else:
-                # Try to get error message from either "Error" or "message" field
-                error_message = data.get("Error") or data.get("message", "Invalid OTP code")
-                self.show_status(error_message, error=True)
-                
-        except Exception as e:
-            self.show_status("System error. Please try again.", error=True)
-            print(f"Unexpected error: {str(e)}")
+        
+        # Cached codes open at once; others are verified with the backend.
+        # Repeats of a code that is in flight or just opened are answered by
+        # the core's admission control without another lookup or pulse.
+        self.last_submit_at = time.monotonic()
+        self.show_status("Verifying code...", error=False)
+        self.core.submit_otp(otp, lambda result: self.call_on_ui(self.handle_otp_result, result), wall=self.wall)
         
         # Clear input and refocus
         self.otp_var.set("")
         self.otp_entry.focus()
 
+    def handle_otp_input(self):
+        otp = self.otp_var.get().strip()
+        if self.ready and self.otp_format.complete(otp):
+            self.core.prefetch_otp(otp)
+
+    def handle_otp_result(self, result):
+        self.show_status(result["message"], error=result["status"] not in ("opened", "in_progress", "already_open"))
+
     def show_status(self, message: str, error: bool = False):
         self.status_label.config(
             text=message,
@@ -624,15 +563,15 @@ class LockerKioskApplication:
             self.root.after(5000, lambda: self.status_label.config(text=""))
 
     def cleanup_and_exit(self):
-        # Turn off all UV lights before exiting
-        for pin in self.uv_light_pins.values():
-            try:
-                GPIO.output(pin, GPIO.HIGH)  # Ensure all relays are inactive
-            except:
-                pass
-                
-        GPIO.cleanup()
-        self.root.quit()
+        # The SystemExit from an exit button unwinds through run(), whose
+        # finally calls this again; only the first call cleans up
+        if not self.exiting:
+            self.exiting = True
+            self.watchdog.stop()
+            # Releases relays and turns off UV lights (in-process core), or
+            # just disconnects from a shared core
+            self.core.shutdown()
+            self.root.quit()
         sys.exit(0)
 
     def run(self):
@@ -0,0 +1,402 @@
+"""In-process metrics and transaction traces for the kiosk
+
+Instruments are plain objects updated under a short lock, cheap enough to
+leave on permanently. The exporter serves them in Prometheus text format
+on localhost and appends trace records and periodic snapshots to a
+rotating JSON-lines file, both from background threads:
+
+    curl http://127.0.0.1:9108/metrics
+"""
+import bisect
+import json
+import os
+import queue
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Latency buckets in seconds, from sub-millisecond relay writes to slow API calls
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+def format_labels(names, values):
+    if not names:
+        return ""
+    pairs = ",".join(f'{name}="{str(value)}"' for name, value in zip(names, values))
+    return "{" + pairs + "}"
+
+
+class Counter:
+    def __init__(self, name: str, help: str, labels=()):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self.lock = threading.Lock()
+        self.values = {}  # label values tuple -> count
+
+    def inc(self, amount: float = 1, **labels):
+        key = tuple(labels.get(name, "") for name in self.labels)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def collect(self):
+        with self.lock:
+            values = dict(self.values)
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        for key, value in sorted(values.items()):
+            lines.append(f"{self.name}{format_labels(self.labels, key)} {value}")
+        return lines
+
+    def snapshot(self):
+        with self.lock:
+            return {",".join(key) or "total": value for key, value in self.values.items()}
+
+
+class Gauge:
+    def __init__(self, name: str, help: str):
+        self.name = name
+        self.help = help
+        self.value = 0
+
+    def set(self, value: float):
+        self.value = value
+
+    def collect(self):
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} gauge", f"{self.name} {self.value}"]
+
+    def snapshot(self):
+        return self.value
+
+
+class Histogram:
+    def __init__(self, name: str, help: str, buckets=DEFAULT_BUCKETS, labels=()):
+        self.name = name
+        self.help = help
+        self.buckets = tuple(sorted(buckets))
+        self.labels = tuple(labels)
+        self.lock = threading.Lock()
+        # label values tuple -> {"counts": [...] (last slot is +Inf), "sum", "count"}
+        self.series = {} if self.labels else {(): self.empty()}
+
+    def empty(self):
+        return {"counts": [0] * (len(self.buckets) + 1), "sum": 0.0, "count": 0}
+
+    def observe(self, value: float, **labels):
+        key = tuple(labels.get(name, "") for name in self.labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self.lock:
+            series = self.series.get(key)
+            if series is None:
+                series = self.series[key] = self.empty()
+            series["counts"][index] += 1
+            series["sum"] += value
+            series["count"] += 1
+
+    def time(self, **labels):
+        """Context manager that observes the duration of its block"""
+        return Timer(lambda elapsed: self.observe(elapsed, **labels))
+
+    def read(self):
+        with self.lock:
+            return {key: {"counts": list(series["counts"]), "sum": series["sum"], "count": series["count"]}
+                    for key, series in self.series.items()}
+
+    def collect(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        bucket_labels = self.labels + ("le",)
+        for key, series in sorted(self.read().items()):
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, series["counts"]):
+                cumulative += bucket_count
+                lines.append(f"{self.name}_bucket{format_labels(bucket_labels, key + (bound,))} {cumulative}")
+            lines.append(f'{self.name}_bucket{format_labels(bucket_labels, key + ("+Inf",))} {series["count"]}')
+            lines.append(f"{self.name}_sum{format_labels(self.labels, key)} {series['sum']}")
+            lines.append(f"{self.name}_count{format_labels(self.labels, key)} {series['count']}")
+        return lines
+
+    def quantile(self, q: float, **labels):
+        """Approximate quantile: upper bound of the bucket holding it"""
+        key = tuple(labels.get(name, "") for name in self.labels)
+        series = self.read().get(key)
+        return self.bucket_quantile(series, q) if series else None
+
+    def bucket_quantile(self, series, q: float):
+        if not series["count"]:
+            return None
+        target = q * series["count"]
+        cumulative = 0
+        for index, bucket_count in enumerate(series["counts"]):
+            cumulative += bucket_count
+            if cumulative >= target:
+                return self.buckets[index] if index < len(self.buckets) else float("inf")
+        return float("inf")
+
+    def summarize(self, series):
+        count = series["count"]
+        return {
+            "count": count,
+            "avg": round(series["sum"] / count, 4) if count else None,
+            "p50": self.bucket_quantile(series, 0.5),
+            "p95": self.bucket_quantile(series, 0.95),
+        }
+
+    def snapshot(self):
+        series = self.read()
+        if not self.labels:
+            return self.summarize(series[()])
+        return {",".join(key): self.summarize(values) for key, values in series.items()}
+
+
+class Timer:
+    def __init__(self, observe):
+        self.observe = observe
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.elapsed = time.perf_counter() - self.start
+        self.observe(self.elapsed)
+        return False
+
+
+class Trace:
+    """Timeline of one kiosk transaction (a submit or a login)
+
+    Spans may start and end on different threads; the trace is written
+    out once finish() is called with the transaction's outcome.
+    """
+
+    def __init__(self, registry, kind: str, **attrs):
+        self.registry = registry
+        self.kind = kind
+        self.attrs = attrs
+        self.started_at = time.time()
+        self.start = time.perf_counter()
+        self.spans = []
+        self.finished = False
+
+    def span(self, name: str):
+        """Context manager recording one step of the transaction"""
+        return Timer(lambda elapsed: self.add_span(name, elapsed))
+
+    def wrap(self, name: str, func):
+        """Return func wrapped in a span, e.g. for handing to a worker pool"""
+        def traced(*args, **kwargs):
+            with self.span(name):
+                return func(*args, **kwargs)
+        return traced
+
+    def add_span(self, name: str, elapsed: float, offset: float = None):
+        if offset is None:
+            offset = time.perf_counter() - self.start - elapsed
+        self.spans.append({"name": name, "start_ms": round(offset * 1000, 2), "ms": round(elapsed * 1000, 2)})
+
+    def finish(self, outcome: str, **attrs):
+        if self.finished:
+            return
+        self.finished = True
+        elapsed = time.perf_counter() - self.start
+        self.attrs.update(attrs)
+        self.registry.transactions.inc(kind=self.kind, outcome=outcome)
+        self.registry.transaction_seconds.observe(elapsed)
+        self.registry.emit({
+            "type": "trace",
+            "kind": self.kind,
+            "outcome": outcome,
+            "at": round(self.started_at, 3),
+            "ms": round(elapsed * 1000, 2),
+            "spans": self.spans,
+            **self.attrs,
+        })
+
+
+class Registry:
+    def __init__(self, max_pending: int = 1000):
+        self.instruments = {}
+        self.records = queue.Queue(maxsize=max_pending)
+        self.dropped = 0
+
+        self.transactions = self.counter(
+            "kiosk_transactions_total", "Completed kiosk transactions by kind and outcome", ("kind", "outcome"))
+        self.transaction_seconds = self.histogram(
+            "kiosk_transaction_seconds", "End-to-end duration of kiosk transactions")
+        self.errors = self.counter(
+            "kiosk_errors_total", "Failures by source and error class", ("source", "error"))
+
+    def counter(self, name: str, help: str, labels=()):
+        return self.instruments.setdefault(name, Counter(name, help, labels))
+
+    def gauge(self, name: str, help: str):
+        return self.instruments.setdefault(name, Gauge(name, help))
+
+    def histogram(self, name: str, help: str, buckets=DEFAULT_BUCKETS, labels=()):
+        return self.instruments.setdefault(name, Histogram(name, help, buckets, labels))
+
+    def trace(self, kind: str, **attrs):
+        return Trace(self, kind, **attrs)
+
+    def error(self, source: str, error):
+        """Count a failure; error is an exception or a short class name"""
+        name = error if isinstance(error, str) else type(error).__name__
+        self.errors.inc(source=source, error=name)
+
+    def emit(self, record: dict):
+        # Never block a caller on the exporter; drop records if it falls behind
+        try:
+            self.records.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+    def render_prometheus(self):
+        lines = []
+        for instrument in list(self.instruments.values()):
+            lines.extend(instrument.collect())
+        lines.append("# HELP kiosk_metrics_dropped_records_total Trace records dropped by the exporter")
+        lines.append("# TYPE kiosk_metrics_dropped_records_total counter")
+        lines.append(f"kiosk_metrics_dropped_records_total {self.dropped}")
+        return "\n".join(lines) + "\n"
+
+    def snapshot(self):
+        return {name: instrument.snapshot() for name, instrument in list(self.instruments.items())}
+
+
+REGISTRY = Registry()
+
+OTP_LOOKUP = REGISTRY.histogram("kiosk_otp_lookup_seconds", "Round-trip time of OTP lookups against the backend")
+RELAY_PULSE = REGISTRY.histogram("kiosk_relay_pulse_seconds", "Time a relay channel was actually energized")
+UI_LOOP_LAG = REGISTRY.histogram("kiosk_ui_loop_lag_seconds", "Delay of the Tk UI queue poll beyond its interval")
+CONNECTIVITY_PROBE = REGISTRY.histogram("kiosk_connectivity_probe_seconds", "Duration of connectivity probes")
+
+
+class RotatingJsonWriter:
+    """Append-only JSON-lines file rotated by size (path, path.1 ... path.N)"""
+
+    def __init__(self, path: str, max_bytes: int = 1_000_000, backups: int = 3):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.backups = backups
+        self.file = open(path, "a", encoding="utf-8")
+
+    def write(self, record: dict):
+        self.file.write(json.dumps(record, separators=(",", ":")) + "\n")
+        if self.file.tell() >= self.max_bytes:
+            self.rotate()
+
+    def rotate(self):
+        self.file.close()
+        for index in range(self.backups - 1, 0, -1):
+            source = f"{self.path}.{index}"
+            if os.path.exists(source):
+                os.replace(source, f"{self.path}.{index + 1}")
+        if self.backups:
+            os.replace(self.path, f"{self.path}.1")
+        else:
+            os.remove(self.path)
+        self.file = open(self.path, "a", encoding="utf-8")
+
+    def flush(self):
+        self.file.flush()
+
+    def close(self):
+        self.file.close()
+
+
+class MetricsRequestHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?")[0] != "/metrics":
+            self.send_error(404)
+            return
+        payload = self.server.registry.render_prometheus().encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class MetricsExporter:
+    """Serves /metrics on localhost and writes records to a JSON-lines file
+
+    Trace records are written as they arrive; a snapshot of every
+    instrument is appended every ``interval`` seconds.
+    """
+
+    def __init__(self, registry: Registry, path: str = None, port: int = 9108, host: str = "127.0.0.1",
+                 interval: float = 60, max_bytes: int = 1_000_000, backups: int = 3):
+        self.registry = registry
+        self.path = path
+        self.port = port
+        self.host = host
+        self.interval = interval
+        self.max_bytes = max_bytes
+        self.backups = backups
+        self.server = None
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self.run, name="metrics-writer", daemon=True)
+
+    def start(self):
+        if self.port is not None:
+            try:
+                self.server = ThreadingHTTPServer((self.host, self.port), MetricsRequestHandler)
+                self.server.daemon_threads = True
+                self.server.registry = self.registry
+                threading.Thread(target=self.server.serve_forever, name="metrics-http", daemon=True).start()
+            except OSError as e:
+                print(f"Metrics endpoint unavailable: {str(e)}")
+                self.server = None
+        if self.path:
+            self.thread.start()
+        return self
+
+    def stop(self):
+        self.stopped.set()
+        if self.server:
+            self.server.shutdown()
+            self.server.server_close()
+        if self.thread.is_alive():
+            self.thread.join(timeout=2)
+
+    def run(self):
+        try:
+            writer = RotatingJsonWriter(self.path, self.max_bytes, self.backups)
+        except OSError as e:
+            print(f"Metrics log unavailable: {str(e)}")
+            return
+
+        next_snapshot = time.monotonic() + self.interval
+        while not self.stopped.is_set():
+            timeout = max(0.0, next_snapshot - time.monotonic())
+            try:
+                record = self.registry.records.get(timeout=min(timeout, 1.0))
+            except queue.Empty:
+                record = None
+            try:
+                if record is not None:
+                    writer.write(record)
+                    # Drain whatever else queued up before touching the disk again
+                    while True:
+                        try:
+                            writer.write(self.registry.records.get_nowait())
+                        except queue.Empty:
+                            break
+                if time.monotonic() >= next_snapshot:
+                    writer.write({"type": "metrics", "at": round(time.time(), 3), "metrics": self.registry.snapshot()})
+                    next_snapshot = time.monotonic() + self.interval
+                writer.flush()
+            except OSError as e:
+                print(f"Metrics log write error: {str(e)}")
+
+        # Write out anything still queued at shutdown
+        while True:
+            try:
+                writer.write(self.registry.records.get_nowait())
+            except queue.Empty:
+                break
+            except OSError:
+                break
+        writer.close()
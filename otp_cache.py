@@ -0,0 +1,202 @@
+import sqlite3
+import threading
+import time
+from datetime import datetime
+
+from metrics import REGISTRY
+
+
+def parse_expiry(value):
+    """Convert an API ISO timestamp (e.g. 2030-01-01T00:00:00.000Z) to epoch seconds"""
+    if not value:
+        return None
+    try:
+        return datetime.fromisoformat(value.replace("Z", "+00:00")).timestamp()
+    except ValueError:
+        return None
+
+
+def parse_assignments(items):
+    """API OTP objects -> (otp, locker_number, expires_at) tuples"""
+    return [
+        (str(item["code"]), str(item["locker"]["number"]), parse_expiry(item.get("expiresAt")))
+        for item in items
+    ]
+
+
+class OtpCache:
+    """Local copy of this kiosk's active OTP -> locker assignments
+
+    Lookups hit an in-memory dict; SQLite keeps the cache across restarts.
+    Locally consumed OTPs leave a tombstone so a sync that runs before the
+    backend has processed the PATCH /{otp} can't bring them back.
+    """
+
+    def __init__(self, path: str = "otp_cache.db"):
+        self.lock = threading.Lock()
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute(
+            "CREATE TABLE IF NOT EXISTS otps ("
+            " otp TEXT PRIMARY KEY, locker_number TEXT NOT NULL, expires_at REAL)"
+        )
+        self.db.execute(
+            "CREATE TABLE IF NOT EXISTS consumed ("
+            " otp TEXT PRIMARY KEY, locker_number TEXT NOT NULL, consumed_at REAL NOT NULL)"
+        )
+        self.db.commit()
+
+        self.entries = {
+            otp: (locker_number, expires_at)
+            for otp, locker_number, expires_at in self.db.execute("SELECT otp, locker_number, expires_at FROM otps")
+        }
+        self.evict_expired()
+
+    def lookup(self, otp: str):
+        """Return the locker number for a valid cached OTP, or None"""
+        with self.lock:
+            entry = self.entries.get(otp)
+        if entry is None:
+            return None
+        locker_number, expires_at = entry
+        if expires_at is not None and expires_at <= time.time():
+            self.discard(otp)
+            return None
+        return locker_number
+
+    def consume(self, otp: str):
+        """Remove an OTP used locally and tombstone it until the backend drops it"""
+        with self.lock:
+            entry = self.entries.pop(otp, None)
+            if entry is None:
+                return False
+            self.db.execute("DELETE FROM otps WHERE otp = ?", (otp,))
+            self.db.execute(
+                "INSERT OR REPLACE INTO consumed (otp, locker_number, consumed_at) VALUES (?, ?, ?)",
+                (otp, entry[0], time.time())
+            )
+            self.db.commit()
+            return True
+
+    def discard(self, otp: str):
+        """Drop an OTP without queuing a replay (already consumed online, or expired)"""
+        with self.lock:
+            if self.entries.pop(otp, None) is not None:
+                self.db.execute("DELETE FROM otps WHERE otp = ?", (otp,))
+                self.db.commit()
+
+    def replace_all(self, assignments):
+        """Replace the cache with a fresh list of (otp, locker_number, expires_at)"""
+        with self.lock:
+            assignments = list(assignments)
+            pending = {row[0] for row in self.db.execute("SELECT otp FROM consumed")}
+            now = time.time()
+            fresh = {
+                otp: (locker_number, expires_at)
+                for otp, locker_number, expires_at in assignments
+                # Never resurrect OTPs we used locally but the backend still lists
+                if otp not in pending and (expires_at is None or expires_at > now)
+            }
+            # Tombstones for OTPs the backend no longer lists have done their job
+            listed = {otp for otp, _, _ in assignments}
+            self.db.executemany(
+                "DELETE FROM consumed WHERE otp = ?",
+                [(otp,) for otp in pending - listed]
+            )
+            self.entries = fresh
+            self.db.execute("DELETE FROM otps")
+            self.db.executemany(
+                "INSERT INTO otps (otp, locker_number, expires_at) VALUES (?, ?, ?)",
+                [(otp, locker, expires) for otp, (locker, expires) in fresh.items()]
+            )
+            self.db.commit()
+
+    def apply_changes(self, assignments, removed):
+        """Apply a delta: upsert (otp, locker_number, expires_at) and drop removed OTPs"""
+        with self.lock:
+            pending = {row[0] for row in self.db.execute("SELECT otp FROM consumed")}
+            now = time.time()
+            upserts = [
+                (otp, locker_number, expires_at)
+                for otp, locker_number, expires_at in assignments
+                if otp not in pending and (expires_at is None or expires_at > now)
+            ]
+            removed = list(removed)
+            for otp, locker_number, expires_at in upserts:
+                self.entries[otp] = (locker_number, expires_at)
+            for otp in removed:
+                self.entries.pop(otp, None)
+            self.db.executemany(
+                "INSERT OR REPLACE INTO otps (otp, locker_number, expires_at) VALUES (?, ?, ?)", upserts
+            )
+            self.db.executemany("DELETE FROM otps WHERE otp = ?", [(otp,) for otp in removed])
+            # The backend has dropped these, so their tombstones have done their job
+            self.db.executemany("DELETE FROM consumed WHERE otp = ?", [(otp,) for otp in removed])
+            self.db.commit()
+
+    def evict_expired(self):
+        now = time.time()
+        with self.lock:
+            expired = [otp for otp, (_, expires_at) in self.entries.items()
+                       if expires_at is not None and expires_at <= now]
+            for otp in expired:
+                del self.entries[otp]
+            if expired:
+                self.db.execute("DELETE FROM otps WHERE expires_at IS NOT NULL AND expires_at <= ?", (now,))
+                self.db.commit()
+        return len(expired)
+
+    def __len__(self):
+        with self.lock:
+            return len(self.entries)
+
+    def close(self):
+        with self.lock:
+            self.db.close()
+
+
+class OtpSyncWorker:
+    """Periodically pulls this kiosk's active OTPs into the cache"""
+
+    def __init__(self, cache: OtpCache, api, kiosk_id: str, connectivity=None, interval: float = 60):
+        self.cache = cache
+        self.api = api
+        self.kiosk_id = kiosk_id
+        self.connectivity = connectivity
+        self.interval = interval
+        self.wake = threading.Event()
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self.run, name="otp-sync", daemon=True)
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.stopped.set()
+        self.wake.set()
+
+    def sync_now(self):
+        self.wake.set()
+
+    def run(self):
+        while not self.stopped.is_set():
+            self.wake.clear()
+            if self.connectivity is None or self.connectivity.snapshot().online:
+                self.pull()
+            self.cache.evict_expired()
+            self.wake.wait(self.interval)
+
+    def pull(self):
+        try:
+            response = self.api.fetch_active_otps(self.kiosk_id)
+            if not response.ok:
+                print(f"OTP sync failed: {response.status_code}")
+                REGISTRY.error("otp_sync", f"HTTP{response.status_code}")
+                return
+            assignments = parse_assignments(response.json().get("otps", []))
+        except Exception as e:
+            print(f"OTP sync error: {str(e)}")
+            REGISTRY.error("otp_sync", e)
+            return
+        self.cache.replace_all(assignments)
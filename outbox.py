@@ -0,0 +1,162 @@
+import json
+import random
+import sqlite3
+import threading
+import time
+import uuid
+
+from metrics import REGISTRY
+
+
+class Outbox:
+    """Durable write-behind queue for backend calls that must not be lost
+
+    Events are appended to a SQLite WAL journal before anything touches the
+    network, so callers on the actuation path only pay for a local insert.
+    A background flusher sends due events in batches over the shared API
+    session, retries failures with exponential backoff and keeps delivered
+    idempotency keys for ``retention`` seconds so duplicates are dropped.
+
+    ``senders`` maps an event kind to ``func(payload, key) -> Response``.
+    """
+
+    def __init__(self, path: str, senders: dict, connectivity=None, batch_size: int = 20,
+                 interval: float = 15, base_backoff: float = 2, max_backoff: float = 600,
+                 retention: float = 7 * 24 * 3600):
+        self.senders = senders
+        self.connectivity = connectivity
+        self.batch_size = batch_size
+        self.interval = interval
+        self.base_backoff = base_backoff
+        self.max_backoff = max_backoff
+        self.retention = retention
+
+        self.lock = threading.Lock()
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=FULL")  # an acknowledged event survives power loss
+        self.db.execute(
+            "CREATE TABLE IF NOT EXISTS events ("
+            " id INTEGER PRIMARY KEY AUTOINCREMENT,"
+            " key TEXT NOT NULL UNIQUE,"
+            " kind TEXT NOT NULL,"
+            " payload TEXT NOT NULL,"
+            " created_at REAL NOT NULL,"
+            " attempts INTEGER NOT NULL DEFAULT 0,"
+            " next_attempt REAL NOT NULL,"
+            " delivered_at REAL)"
+        )
+        self.db.execute("CREATE INDEX IF NOT EXISTS events_due ON events (delivered_at, next_attempt)")
+        self.db.commit()
+
+        self.wake = threading.Event()
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self.run, name="outbox-flusher", daemon=True)
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.stopped.set()
+        self.wake.set()
+
+    def enqueue(self, kind: str, payload: dict, key: str = None):
+        """Journal an event; returns False if its key was already queued or delivered"""
+        if kind not in self.senders:
+            raise ValueError(f"Unknown outbox event kind: {kind}")
+        key = key or f"{kind}:{uuid.uuid4()}"
+        now = time.time()
+        with self.lock:
+            cursor = self.db.execute(
+                "INSERT OR IGNORE INTO events (key, kind, payload, created_at, next_attempt)"
+                " VALUES (?, ?, ?, ?, ?)",
+                (key, kind, json.dumps(payload), now, now)
+            )
+            self.db.commit()
+        self.wake.set()
+        return cursor.rowcount == 1
+
+    def flush_now(self):
+        self.wake.set()
+
+    def pending_count(self):
+        with self.lock:
+            return self.db.execute("SELECT COUNT(*) FROM events WHERE delivered_at IS NULL").fetchone()[0]
+
+    def run(self):
+        while not self.stopped.is_set():
+            self.wake.clear()
+            if self.connectivity is None or self.connectivity.snapshot().online:
+                try:
+                    # Keep draining while full batches go through
+                    while self.flush_batch() == self.batch_size and not self.stopped.is_set():
+                        pass
+                except Exception as e:
+                    print(f"Outbox flush error: {str(e)}")
+            self.purge_delivered()
+            self.wake.wait(self.interval)
+
+    def due_events(self):
+        with self.lock:
+            return self.db.execute(
+                "SELECT id, key, kind, payload, attempts FROM events"
+                " WHERE delivered_at IS NULL AND next_attempt <= ?"
+                " ORDER BY id LIMIT ?",
+                (time.time(), self.batch_size)
+            ).fetchall()
+
+    def flush_batch(self):
+        """Send one batch of due events; returns how many were delivered"""
+        delivered = []
+        dropped = []
+        retry = []
+
+        for event_id, key, kind, payload, attempts in self.due_events():
+            try:
+                response = self.senders[kind](json.loads(payload), key)
+            except Exception as e:
+                print(f"Outbox send failed for {kind}: {str(e)}")
+                REGISTRY.error(f"outbox_{kind}", e)
+                retry.append((event_id, attempts))
+                break  # the link is probably down; don't hammer it with the rest
+
+            if response.ok:
+                delivered.append(event_id)
+            elif 400 <= response.status_code < 500 and response.status_code not in (408, 429):
+                # The server rejected the event itself; retrying won't help
+                print(f"Outbox dropping {kind} event: {response.status_code}")
+                REGISTRY.error(f"outbox_{kind}", f"HTTP{response.status_code}")
+                dropped.append(event_id)
+            else:
+                REGISTRY.error(f"outbox_{kind}", f"HTTP{response.status_code}")
+                retry.append((event_id, attempts))
+
+        now = time.time()
+        with self.lock:
+            self.db.executemany(
+                "UPDATE events SET delivered_at = ? WHERE id = ?",
+                [(now, event_id) for event_id in delivered + dropped]
+            )
+            self.db.executemany(
+                "UPDATE events SET attempts = ?, next_attempt = ? WHERE id = ?",
+                [(attempts + 1, now + self.backoff(attempts), event_id) for event_id, attempts in retry]
+            )
+            self.db.commit()
+        return len(delivered)
+
+    def backoff(self, attempts: int):
+        delay = min(self.max_backoff, self.base_backoff * (2 ** attempts))
+        return delay * random.uniform(0.5, 1.0)
+
+    def purge_delivered(self):
+        with self.lock:
+            self.db.execute(
+                "DELETE FROM events WHERE delivered_at IS NOT NULL AND delivered_at < ?",
+                (time.time() - self.retention,)
+            )
+            self.db.commit()
+
+    def close(self):
+        with self.lock:
+            self.db.close()
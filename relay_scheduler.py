@@ -0,0 +1,186 @@
+import heapq
+import itertools
+import threading
+import time
+
+
+class RelayScheduler:
+    """Runs timed relay pulses on a single background thread
+
+    Pulses on different channels overlap freely; pulsing a channel that is
+    already active extends its deadline instead of restarting it. Completion
+    callbacks are handed to ``dispatch`` so the caller decides which thread
+    they run on (the kiosk routes them back onto the Tk mainloop).
+
+    If ``flush`` is given, set_output may just stage a change: flush() is
+    called once after each batch of writes, letting banked drivers send all
+    of a tick's changes in one bus transaction.
+
+    ``observe``, if given, is called with how long each pulse actually kept
+    its relay energized.
+
+    ``on_deadline``, if given, is called with (channel, monotonic deadline)
+    whenever a pulse is scheduled or moved, and with (channel, None) once it
+    has ended, so the intended state can be persisted.
+    """
+
+    def __init__(self, set_output, dispatch=None, flush=None, observe=None, on_deadline=None):
+        # set_output(channel, active) performs (or stages) the actual relay write
+        self.set_output = set_output
+        self.flush = flush
+        self.observe = observe
+        self.on_deadline = on_deadline
+        self.dispatch = dispatch or (lambda func, *args: func(*args))
+
+        self.condition = threading.Condition()
+        self.deadlines = []       # heap of (deadline, seq, channel)
+        self.active = {}          # channel -> {"deadline": float, "callbacks": [...]}
+        self.pending_on = []      # channels waiting to be energized by the worker
+        self.sequence = itertools.count()
+        self.running = True
+        self.energized = {}       # channel -> time it was switched on (worker thread only)
+
+        self.worker = threading.Thread(target=self.run, name="relay-scheduler", daemon=True)
+        self.worker.start()
+
+    def pulse(self, channel, duration: float, on_complete=None, restart: bool = False):
+        """Activate a relay channel for ``duration`` seconds
+
+        If the channel is already active its deadline is extended, or with
+        restart=True reset to exactly ``duration`` from now.
+        """
+        with self.condition:
+            if not self.running:
+                return False
+
+            deadline = time.monotonic() + duration
+            entry = self.active.get(channel)
+            if entry is None:
+                entry = {"deadline": deadline, "callbacks": []}
+                self.active[channel] = entry
+                self.pending_on.append(channel)
+            elif restart:
+                entry["deadline"] = deadline
+            else:
+                entry["deadline"] = max(entry["deadline"], deadline)
+
+            if on_complete:
+                entry["callbacks"].append(on_complete)
+
+            heapq.heappush(self.deadlines, (entry["deadline"], next(self.sequence), channel))
+            self.record_deadline(channel, entry["deadline"])
+            self.condition.notify()
+            return True
+
+    def cancel(self, channel):
+        """End an active pulse early; completion callbacks still fire"""
+        with self.condition:
+            entry = self.active.get(channel)
+            if entry is None:
+                return False
+            entry["deadline"] = time.monotonic()
+            heapq.heappush(self.deadlines, (entry["deadline"], next(self.sequence), channel))
+            self.condition.notify()
+            return True
+
+    def is_active(self, channel):
+        with self.condition:
+            return channel in self.active
+
+    def active_channels(self):
+        """Return a snapshot of active channels and their remaining seconds"""
+        now = time.monotonic()
+        with self.condition:
+            return {
+                channel: max(0.0, entry["deadline"] - now)
+                for channel, entry in self.active.items()
+            }
+
+    def run(self):
+        while True:
+            with self.condition:
+                while self.running and not self.pending_on and not self.has_due_deadline():
+                    timeout = self.deadlines[0][0] - time.monotonic() if self.deadlines else None
+                    self.condition.wait(timeout)
+
+                if not self.running:
+                    return
+
+                turn_on, self.pending_on = self.pending_on, []
+                due = self.pop_due()
+
+            # Relay writes and callbacks happen outside the lock so a slow
+            # driver never blocks callers of pulse()
+            for channel in turn_on:
+                self.write(channel, True)
+
+            for channel, entry in due:
+                self.write(channel, False)
+            self.commit()
+            for channel, entry in due:
+                self.record_deadline(channel, None)
+
+            now = time.monotonic()
+            for channel in turn_on:
+                self.energized[channel] = now
+            for channel, entry in due:
+                started = self.energized.pop(channel, None)
+                if self.observe and started is not None:
+                    self.observe(now - started)
+
+            for channel, entry in due:
+                for callback in entry["callbacks"]:
+                    self.dispatch(callback, channel)
+
+    def has_due_deadline(self):
+        return bool(self.deadlines) and self.deadlines[0][0] <= time.monotonic()
+
+    def pop_due(self):
+        """Pop expired pulses; must be called with the condition held"""
+        now = time.monotonic()
+        due = []
+        while self.deadlines and self.deadlines[0][0] <= now:
+            _, _, channel = heapq.heappop(self.deadlines)
+            entry = self.active.get(channel)
+            # Stale heap entries (from extended pulses) are skipped
+            if entry is not None and entry["deadline"] <= now:
+                del self.active[channel]
+                due.append((channel, entry))
+        return due
+
+    def write(self, channel, active: bool):
+        try:
+            self.set_output(channel, active)
+        except Exception as e:
+            print(f"Relay write error on channel {channel}: {str(e)}")
+
+    def record_deadline(self, channel, deadline):
+        if self.on_deadline:
+            try:
+                self.on_deadline(channel, deadline)
+            except Exception as e:
+                print(f"Relay state record error on channel {channel}: {str(e)}")
+
+    def commit(self):
+        if self.flush:
+            try:
+                self.flush()
+            except Exception as e:
+                print(f"Relay flush error: {str(e)}")
+
+    def shutdown(self):
+        """Stop the worker and force every active channel off"""
+        with self.condition:
+            self.running = False
+            remaining = list(self.active)
+            self.active.clear()
+            self.deadlines.clear()
+            self.pending_on.clear()
+            self.condition.notify()
+
+        self.worker.join(timeout=1)
+        for channel in remaining:
+            self.write(channel, False)
+        self.commit()
+        for channel in remaining:
+            self.record_deadline(channel, None)
@@ -0,0 +1,178 @@
+"""Crash-safe record of intended and actual relay state
+
+Every lock and UV relay channel has a fixed slot in a small memory-mapped
+file, holding:
+- whether a pulse is scheduled on it, and its deadline (wall-clock time)
+- what was last written to it
+
+Slot updates are plain stores into the mapping, with no syscalls. The page
+cache keeps them when the process is killed, so the next start can see
+what was interrupted. A power cut needs no record: the relays drop out
+with the power.
+
+On startup the banks are reset to off as usual. reconcile() then turns
+the previous run's slots into one pass of actions:
+- lock pulses are never resumed; a relay left on is recorded as forced off
+- UV cycles whose deadline is still ahead are resumed for the time left
+- UV cycles whose deadline has passed are recorded as cancelled
+"""
+import hashlib
+import mmap
+import os
+import struct
+import threading
+import time
+
+HEADER = struct.Struct("<4sBBH8s16x")   # magic, version, clean shutdown, slot count, topology fingerprint
+SLOT = struct.Struct("<BBB5x8sdd")      # kind, intended, actual, locker, deadline, updated
+MAGIC = b"SPRS"
+VERSION = 1
+
+LOCK = 1
+UV = 2
+KIND_NAMES = {LOCK: "lock", UV: "uv"}
+
+
+def topology_slots(topology):
+    """(channel, kind, locker number) for every relay, in a stable order"""
+    slots = []
+    for number, address in sorted(topology.lockers.items()):
+        slots.append((address["lock"], LOCK, number))
+        if address["uv"]:
+            slots.append((address["uv"], UV, number))
+    return slots
+
+
+class RelayJournal:
+    """Memory-mapped slots of intended vs actual state, one per relay channel
+
+    Opening the journal reads what the previous run left behind into
+    ``previous`` (and ``was_clean``) and starts this run with every slot idle.
+    A journal written for a different topology is ignored.
+    """
+
+    def __init__(self, path: str, topology):
+        self.path = path
+        self.lock = threading.Lock()
+        self.closed = False
+        slots = topology_slots(topology)
+        self.index = {channel: position for position, (channel, _, _) in enumerate(slots)}
+        fingerprint = hashlib.sha1(repr(slots).encode()).digest()[:8]
+        size = HEADER.size + SLOT.size * len(slots)
+
+        fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            self.previous, self.was_clean = self.read_previous(fd, size, fingerprint)
+            os.ftruncate(fd, size)
+            self.map = mmap.mmap(fd, size)
+        finally:
+            os.close(fd)
+
+        now = time.time()
+        HEADER.pack_into(self.map, 0, MAGIC, VERSION, 0, len(slots), fingerprint)
+        for position, (_, kind, number) in enumerate(slots):
+            SLOT.pack_into(self.map, self.offset(position), kind, 0, 0, number.encode("ascii", "replace")[:8], 0.0, now)
+
+    def read_previous(self, fd: int, size: int, fingerprint: bytes):
+        data = os.pread(fd, size, 0)
+        if len(data) != size:
+            return [], True  # first run, or the topology changed size
+        magic, version, clean, count, stored_fingerprint = HEADER.unpack_from(data)
+        if magic != MAGIC or version != VERSION or stored_fingerprint != fingerprint:
+            if magic == MAGIC:
+                print("Relay state journal is for another topology; ignoring it")
+            return [], True
+
+        previous = []
+        for position in range(count):
+            kind, intended, actual, locker, deadline, updated = SLOT.unpack_from(data, HEADER.size + SLOT.size * position)
+            if intended or actual:
+                previous.append({
+                    "locker": locker.rstrip(b"\0").decode("ascii", "replace"),
+                    "kind": KIND_NAMES.get(kind, "unknown"),
+                    "intended": bool(intended),
+                    "actual": bool(actual),
+                    "deadline": deadline or None,
+                    "updated": updated,
+                })
+        return previous, bool(clean)
+
+    def offset(self, position: int):
+        return HEADER.size + SLOT.size * position
+
+    def set_actual(self, channel, active: bool):
+        position = self.index.get(channel)
+        if position is None:
+            return
+        with self.lock:
+            if self.closed:
+                return
+            offset = self.offset(position)
+            self.map[offset + 2] = 1 if active else 0
+            struct.pack_into("<d", self.map, offset + 24, time.time())
+
+    def set_deadline(self, channel, deadline: float = None):
+        """Record a scheduled pulse (monotonic deadline) or, with None, its end"""
+        position = self.index.get(channel)
+        if position is None:
+            return
+        now = time.time()
+        wall_deadline = now + (deadline - time.monotonic()) if deadline is not None else 0.0
+        with self.lock:
+            if self.closed:
+                return
+            offset = self.offset(position)
+            self.map[offset + 1] = 1 if deadline is not None else 0
+            struct.pack_into("<dd", self.map, offset + 16, wall_deadline, now)
+
+    def close(self, clean: bool = True):
+        """Mark every relay idle and, after a clean shutdown, say so in the header
+
+        Writes after the first close are ignored.
+        """
+        with self.lock:
+            if self.closed:
+                return
+            self.closed = True
+            for position in range(len(self.index)):
+                offset = self.offset(position)
+                self.map[offset + 1] = 0
+                self.map[offset + 2] = 0
+            self.map[5] = 1 if clean else 0
+            self.map.flush()
+            self.map.close()
+
+
+def reconcile(previous, now: float = None, max_uv: float = None):
+    """Actions for the relays an unclean stop left behind
+
+    Returns dicts with "locker", "kind", "action" ("forced_off", "resumed",
+    "cancelled"), "remaining" for resumed UV cycles and a "detail" message.
+    """
+    now = time.time() if now is None else now
+    actions = []
+    for slot in previous:
+        locker, kind = slot["locker"], slot["kind"]
+        state = ("on" if slot["actual"] else "off") + (", pulse scheduled" if slot["intended"] else ", no pulse scheduled")
+        if kind == "lock":
+            overdue = now - slot["deadline"] if slot["deadline"] else None
+            detail = f"lock relay was {state}"
+            if overdue is not None:
+                detail += f", deadline {'passed ' + format(overdue, '.0f') + ' s ago' if overdue >= 0 else 'still ahead'}"
+            actions.append({"locker": locker, "kind": kind, "action": "forced_off", "detail": detail})
+            continue
+
+        remaining = slot["deadline"] - now if slot["deadline"] and slot["intended"] else 0
+        if now < slot["updated"]:
+            # The clock went backwards (no RTC before NTP sync); deadlines can't be trusted
+            actions.append({"locker": locker, "kind": kind, "action": "cancelled",
+                            "detail": f"UV relay was {state}, clock went backwards"})
+        elif remaining > 0:
+            if max_uv:
+                remaining = min(remaining, max_uv)
+            actions.append({"locker": locker, "kind": kind, "action": "resumed", "remaining": remaining,
+                            "detail": f"UV relay was {state}, {remaining:.0f} s left"})
+        else:
+            actions.append({"locker": locker, "kind": kind, "action": "cancelled",
+                            "detail": f"UV relay was {state}, cycle ended while stopped"})
+    return actions
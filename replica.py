@@ -0,0 +1,207 @@
+"""Local replica of this kiosk's lockers, subscriptions and pending OTPs
+
+The replica is kept current by delta sync against
+``GET kiosks/{kioskId}/state``:
+
+- ``since=<cursor>`` asks only for what changed after the last pull.
+- ``If-None-Match`` turns an unchanged state into an empty 304.
+- ``Prefer: wait=N`` lets a backend that supports long-polling hold the
+  request until something changes, so updates arrive without polling.
+
+A response looks like::
+
+    {"cursor": "1042", "full": false,
+     "lockers": [{"id": "...", "number": "3", "size": "small",
+                  "subscription": {"status": "active", "expiresAt": "..."}}],
+     "otps": [{"code": "123456", "locker": {"number": "3"}, "expiresAt": "..."}],
+     "removed": {"lockers": ["..."], "otps": ["654321"]}}
+
+OTPs go into the OtpCache, which the submit path already reads first.
+Lockers and subscriptions are kept here, and owner locker lists are
+refreshed from them. Backends without the endpoint are handled by falling
+back to the full OTP pull of OtpSyncWorker.
+"""
+import json
+import sqlite3
+import threading
+import time
+
+from metrics import REGISTRY
+from otp_cache import OtpSyncWorker, parse_assignments
+
+
+class LockerReplica:
+    def __init__(self, path: str = "replica.db"):
+        self.lock = threading.Lock()
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("CREATE TABLE IF NOT EXISTS lockers (id TEXT PRIMARY KEY, data TEXT NOT NULL)")
+        self.db.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)")
+        self.db.commit()
+
+        self.lockers = {locker_id: json.loads(data) for locker_id, data in self.db.execute("SELECT id, data FROM lockers")}
+        meta = dict(self.db.execute("SELECT key, value FROM meta"))
+        self.cursor = meta.get("cursor")
+        self.etag = meta.get("etag")
+        self.synced_at = float(meta["synced_at"]) if meta.get("synced_at") else None
+
+    def apply(self, lockers, removed=(), full: bool = False, cursor: str = None, etag: str = None):
+        """Apply a full snapshot or a delta of locker objects"""
+        with self.lock:
+            if full:
+                self.lockers = {}
+                self.db.execute("DELETE FROM lockers")
+            for locker in lockers:
+                self.lockers[locker["id"]] = locker
+            for locker_id in removed:
+                self.lockers.pop(locker_id, None)
+            self.db.executemany(
+                "INSERT OR REPLACE INTO lockers (id, data) VALUES (?, ?)",
+                [(locker["id"], json.dumps(locker)) for locker in lockers]
+            )
+            self.db.executemany("DELETE FROM lockers WHERE id = ?", [(locker_id,) for locker_id in removed])
+
+            self.cursor, self.etag, self.synced_at = cursor, etag, time.time()
+            self.db.executemany(
+                "INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)",
+                [("cursor", cursor), ("etag", etag), ("synced_at", str(self.synced_at))]
+            )
+            self.db.commit()
+
+    def reset(self):
+        """Forget the cursor so the next pull is a full snapshot"""
+        with self.lock:
+            self.cursor = self.etag = None
+            self.db.execute("DELETE FROM meta WHERE key IN ('cursor', 'etag')")
+            self.db.commit()
+
+    def locker(self, locker_id: str):
+        with self.lock:
+            return self.lockers.get(locker_id)
+
+    def merge_owner_data(self, user_data: dict):
+        """Owner login data with subscription details taken from the replica
+
+        Lets a cached owner session show current subscription status
+        without asking the backend again.
+        """
+        with self.lock:
+            lockers = [
+                {**locker, "subscription": self.lockers[locker["id"]].get("subscription", locker.get("subscription"))}
+                if locker.get("id") in self.lockers else locker
+                for locker in user_data.get("lockers", [])
+            ]
+        return {**user_data, "lockers": lockers}
+
+    def __len__(self):
+        with self.lock:
+            return len(self.lockers)
+
+    def close(self):
+        with self.lock:
+            self.db.close()
+
+
+class ReplicaSync(OtpSyncWorker):
+    """Keeps the replica and OTP cache current with delta pulls
+
+    With a long-polling backend the next pull starts as soon as the last one
+    returns; otherwise pulls happen every ``interval`` seconds. If the state
+    endpoint is missing, OtpSyncWorker's full OTP pull is used instead and
+    the endpoint is tried again after ``recheck`` seconds.
+    """
+
+    def __init__(self, replica: LockerReplica, cache, api, kiosk_id: str, connectivity=None,
+                 interval: float = 60, long_poll: int = 25, recheck: float = 3600):
+        super().__init__(cache, api, kiosk_id, connectivity, interval)
+        self.replica = replica
+        self.long_poll = long_poll
+        self.recheck = recheck
+        self.fallback_until = 0.0
+        self.restarted = False  # the last round started over (410 or full snapshot)
+
+    def run(self):
+        while not self.stopped.is_set():
+            self.wake.clear()
+            long_polled = False
+            if self.connectivity is None or self.connectivity.snapshot().online:
+                long_polled = self.pull()
+            self.cache.evict_expired()
+            if not long_polled:
+                self.wake.wait(self.interval)
+
+    def pull(self):
+        """One sync round; returns True if the next round should start right away
+
+        That is after a long-polled request, and after a full snapshot that
+        moved the cursor, so a long-polling backend gets its first
+        cursor-based request at once. A backend that answers full snapshots
+        or 410s round after round is only asked again after ``interval``.
+        """
+        if time.monotonic() < self.fallback_until:
+            super().pull()
+            return False
+
+        cursor = self.replica.cursor
+        try:
+            response = self.api.fetch_kiosk_state(
+                self.kiosk_id, since=cursor, etag=self.replica.etag, wait=self.long_poll
+            )
+        except Exception as e:
+            print(f"Replica sync error: {str(e)}")
+            REGISTRY.error("replica_sync", e)
+            return False
+
+        if response.status_code in (404, 405, 501):
+            print("Backend has no kiosk state endpoint; falling back to full OTP sync")
+            self.fallback_until = time.monotonic() + self.recheck
+            super().pull()
+            return False
+
+        long_polled = "wait=" in response.headers.get("Preference-Applied", "")
+        if response.status_code == 304:
+            self.restarted = False  # the cursor is good
+            return long_polled
+        if response.status_code == 410:
+            # Cursor too old for the server's change log; start over
+            self.replica.reset()
+            return self.start_over()
+        if not response.ok:
+            print(f"Replica sync failed: {response.status_code}")
+            REGISTRY.error("replica_sync", f"HTTP{response.status_code}")
+            return False
+
+        try:
+            payload = response.json()
+            self.apply(payload, response.headers.get("ETag"))
+        except (ValueError, KeyError, TypeError) as e:
+            print(f"Replica sync error: invalid state response: {str(e)}")
+            REGISTRY.error("replica_sync", "InvalidResponse")
+            self.replica.reset()
+            return False
+        if not payload.get("full"):
+            self.restarted = False
+            return long_polled
+        return self.start_over() and self.replica.cursor != cursor
+
+    def start_over(self):
+        """True unless the previous round started over as well"""
+        immediate = not self.restarted
+        self.restarted = True
+        return immediate
+
+    def apply(self, payload: dict, etag: str = None):
+        removed = payload.get("removed") or {}
+        full = bool(payload.get("full"))
+        assignments = parse_assignments(payload.get("otps", []))
+        if full:
+            self.cache.replace_all(assignments)
+        else:
+            self.cache.apply_changes(assignments, [str(otp) for otp in removed.get("otps", [])])
+        self.replica.apply(
+            payload.get("lockers", []),
+            removed.get("lockers", []),
+            full=full,
+            cursor=payload.get("cursor"),
+            etag=etag
+        )
@@ -0,0 +1,220 @@
+"""Memory, thread and file-descriptor bounds for long uptimes
+
+A kiosk runs for weeks between restarts, on boards with as little as
+512 MB of RAM (Pi Zero 2). Every pool, cache and queue in the kiosk is
+bounded. The limits come from a resource profile:
+
+    SMARTPALMS_PROFILE=standard|lowmem   (default: lowmem on machines with <= 1 GiB RAM)
+    SMARTPALMS_MEMORY_BUDGET_MB          overrides the profile's memory budget
+
+ResourceGuard samples the process every minute and exports the figures as
+gauges. When the process goes over budget it frees what it can: the
+registered relief callbacks (caches), a GC pass and malloc_trim. It also
+reports too many threads or file descriptors, since those point at a leak
+rather than at load.
+
+WidgetLeakDetector does the same for Tk widgets on the front-end. Screens
+are built once and reused, so the count should stay flat once every
+screen has been shown.
+"""
+import ctypes
+import ctypes.util
+import gc
+import os
+import threading
+from collections import Counter
+from dataclasses import dataclass
+
+from metrics import REGISTRY
+
+RSS_BYTES = REGISTRY.gauge("kiosk_process_rss_bytes", "Resident memory of the kiosk process")
+THREADS = REGISTRY.gauge("kiosk_process_threads", "Threads in the kiosk process")
+OPEN_FDS = REGISTRY.gauge("kiosk_process_open_fds", "Open file descriptors of the kiosk process")
+WIDGETS = REGISTRY.gauge("kiosk_ui_widgets", "Tk widgets in the front-end")
+PRESSURE = REGISTRY.counter(
+    "kiosk_resource_pressure_total", "Times a resource went over its limit", ("resource",)
+)
+
+
+@dataclass(frozen=True)
+class ResourceProfile:
+    name: str
+    memory_budget_mb: int      # RSS above which caches are dropped and memory returned to the OS
+    max_threads: int           # more than this points at a thread leak
+    max_fds: int               # more than this points at a socket/file leak
+    api_pool_size: int         # backend worker threads and pooled connections
+    session_cache_entries: int
+    sqlite_cache_kib: int      # page cache per SQLite connection
+
+
+PROFILES = {
+    "standard": ResourceProfile("standard", memory_budget_mb=400, max_threads=64, max_fds=256,
+                                api_pool_size=4, session_cache_entries=32, sqlite_cache_kib=2048),
+    "lowmem": ResourceProfile("lowmem", memory_budget_mb=160, max_threads=40, max_fds=128,
+                              api_pool_size=3, session_cache_entries=8, sqlite_cache_kib=256),
+}
+
+
+def total_memory():
+    """Physical memory in bytes, or None if it can't be read"""
+    try:
+        return os.sysconf("SC_PAGE_SIZE") * os.sysconf("SC_PHYS_PAGES")
+    except (ValueError, OSError, AttributeError):
+        return None
+
+
+def load_profile():
+    name = os.environ.get("SMARTPALMS_PROFILE")
+    if not name:
+        memory = total_memory()
+        name = "lowmem" if memory and memory <= 1 << 30 else "standard"
+    if name not in PROFILES:
+        print(f"Unknown resource profile {name}; using standard")
+        name = "standard"
+    profile = PROFILES[name]
+    budget = os.environ.get("SMARTPALMS_MEMORY_BUDGET_MB")
+    if budget:
+        profile = ResourceProfile(**{**profile.__dict__, "memory_budget_mb": int(budget)})
+    return profile
+
+
+def process_usage():
+    """RSS in bytes, thread count and open file descriptors of this process
+
+    Read from /proc on Linux; elsewhere RSS is the peak from getrusage and
+    file descriptors are None.
+    """
+    usage = {"rss_bytes": None, "threads": threading.active_count(), "fds": None}
+    try:
+        with open("/proc/self/status", encoding="ascii") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    usage["rss_bytes"] = int(line.split()[1]) * 1024
+                elif line.startswith("Threads:"):
+                    usage["threads"] = int(line.split()[1])
+        usage["fds"] = len(os.listdir("/proc/self/fd"))
+    except OSError:
+        import resource
+        usage["rss_bytes"] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+    return usage
+
+
+def count_widgets(widget):
+    """Number of Tk widgets below (and including) widget; call on the Tk thread"""
+    return 1 + sum(count_widgets(child) for child in widget.winfo_children())
+
+
+def malloc_trim():
+    """Return freed heap pages to the OS (glibc only); True if it released any"""
+    path = ctypes.util.find_library("c")
+    if not path:
+        return False
+    try:
+        return bool(ctypes.CDLL(path).malloc_trim(0))
+    except (OSError, AttributeError):
+        return False
+
+
+class ResourceGuard:
+    """Samples process usage and enforces a profile's limits
+
+    ``relief`` callbacks drop caches when memory goes over budget. Each
+    limit is reported once per crossing, not on every sample.
+    """
+
+    def __init__(self, profile: ResourceProfile, interval: float = 60, relief=()):
+        self.profile = profile
+        self.interval = interval
+        self.relief = list(relief)
+        self.over = set()  # resources currently over their limit
+        self.last = {}
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self.run, name="resource-guard", daemon=True)
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.stopped.set()
+
+    def run(self):
+        while not self.stopped.wait(self.interval):
+            try:
+                self.check()
+            except Exception as e:
+                print(f"Resource guard error: {str(e)}")
+                REGISTRY.error("resources", e)
+
+    def check(self):
+        usage = self.last = process_usage()
+        if usage["rss_bytes"] is not None:
+            RSS_BYTES.set(usage["rss_bytes"])
+        THREADS.set(usage["threads"])
+        if usage["fds"] is not None:
+            OPEN_FDS.set(usage["fds"])
+
+        budget = self.profile.memory_budget_mb << 20
+        if usage["rss_bytes"] is not None and usage["rss_bytes"] > budget:
+            self.relieve(usage["rss_bytes"])
+        else:
+            self.over.discard("memory")
+
+        if self.exceeded("threads", usage["threads"] > self.profile.max_threads):
+            names = Counter(thread.name.split("-")[0].split("_")[0] for thread in threading.enumerate())
+            print(f"Thread count {usage['threads']} over {self.profile.max_threads}: {dict(names.most_common(5))}")
+        if self.exceeded("fds", usage["fds"] is not None and usage["fds"] > self.profile.max_fds):
+            print(f"Open file descriptors {usage['fds']} over {self.profile.max_fds}")
+        return usage
+
+    def exceeded(self, resource: str, over: bool):
+        """True the first time a resource is seen over its limit"""
+        if not over:
+            self.over.discard(resource)
+            return False
+        if resource in self.over:
+            return False
+        self.over.add(resource)
+        PRESSURE.inc(resource=resource)
+        return True
+
+    def relieve(self, rss_bytes: int):
+        for callback in self.relief:
+            try:
+                callback()
+            except Exception as e:
+                print(f"Memory relief error: {str(e)}")
+        gc.collect()
+        malloc_trim()
+        after = process_usage()["rss_bytes"] or rss_bytes
+        if self.exceeded("memory", after > self.profile.memory_budget_mb << 20):
+            print(f"Memory {after >> 20} MB still over the {self.profile.memory_budget_mb} MB budget "
+                  f"after dropping caches (was {rss_bytes >> 20} MB)")
+
+
+class WidgetLeakDetector:
+    """Flags a Tk widget count that keeps setting new highs
+
+    A new owner with more lockers than any before legitimately adds rows
+    once; a leak adds widgets on every check. ``strikes`` consecutive new
+    highs count as a leak.
+    """
+
+    def __init__(self, strikes: int = 5):
+        self.strikes = strikes
+        self.high_water = 0
+        self.rising = 0
+
+    def check(self, count: int):
+        """Record a widget count; returns True when a leak is suspected"""
+        WIDGETS.set(count)
+        if count > self.high_water:
+            self.rising += 1 if self.high_water else 0
+            self.high_water = count
+        else:
+            self.rising = 0
+        if self.rising >= self.strikes:
+            PRESSURE.inc(resource="widgets")
+            self.rising = 0
+            return True
+        return False
@@ -1,13 +1,22 @@
 #!/bin/bash
 
-# Wait for X server and network
-sleep 10
-
 # Export display for GUI
 export DISPLAY=:0
 
+# Wait until the X server accepts connections instead of sleeping a fixed
+# 10 seconds. Network is not waited for: the kiosk starts offline-capable
+# and its connectivity monitor picks up the link when it comes up.
+for attempt in $(seq 1 60); do
+    if command -v xset >/dev/null 2>&1; then
+        xset q >/dev/null 2>&1 && break
+    elif [ -S /tmp/.X11-unix/X0 ]; then
+        break
+    fi
+    sleep 0.5
+done
+
 # Change to script directory
 cd "$(dirname "$0")"
 
 # Run the kiosk application
-/usr/bin/python3 main.py 
\ No newline at end of file
+exec /usr/bin/python3 main.py
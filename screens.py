@@ -0,0 +1,87 @@
+import time
+
+from metrics import REGISTRY
+
+SCREEN_RENDER = REGISTRY.histogram(
+    "kiosk_screen_render_seconds", "Time to show a screen, including its geometry pass", labels=("screen",)
+)
+
+
+class ScreenManager:
+    """Builds each screen once and swaps them instead of destroying widgets
+
+    A screen is registered with a build function (called once, on first
+    show, returning its frame) and a reset function (called on every show
+    with the show() arguments). Hidden screens are only unplaced, so
+    switching back costs a reset and a geometry pass, not a rebuild.
+    Render times go to kiosk_screen_render_seconds, by screen.
+    """
+
+    def __init__(self, root, slow_threshold: float = 0.1):
+        self.root = root
+        self.slow_threshold = slow_threshold
+        self.builders = {}
+        self.frames = {}
+        self.current = None
+
+    def register(self, name: str, build, reset=None):
+        self.builders[name] = (build, reset)
+
+    def show(self, name: str, *args):
+        start = time.perf_counter()
+        build, reset = self.builders[name]
+
+        frame = self.frames.get(name)
+        if frame is None:
+            frame = self.frames[name] = build()
+
+        if self.current != name:
+            if self.current is not None:
+                self.frames[self.current].place_forget()
+            frame.place(relx=0.5, rely=0.5, anchor="center")
+            self.current = name
+
+        # Nothing is drawn until the next idle pass, so resetting after the
+        # swap never shows stale content
+        if reset:
+            reset(*args)
+
+        # Include the geometry pass in the measurement
+        self.root.update_idletasks()
+        elapsed = time.perf_counter() - start
+        SCREEN_RENDER.observe(elapsed, screen=name)
+        if elapsed > self.slow_threshold:
+            print(f"Slow render of {name} screen: {elapsed * 1000:.0f}ms")
+        return frame
+
+
+class RowPool:
+    """Reusable grid rows for tables whose length changes between renders
+
+    Rows are created on demand and kept; rendering fewer items than before
+    hides the surplus rows with grid_remove instead of destroying them.
+    """
+
+    def __init__(self, parent, create_row, first_row: int = 0):
+        self.parent = parent
+        self.create_row = create_row  # create_row(parent) -> list of widgets, one per column
+        self.first_row = first_row
+        self.rows = []
+
+    def render(self, items, update_row):
+        """Show one row per item; update_row(widgets, item) fills a row in"""
+        items = list(items)
+        while len(self.rows) < len(items):
+            self.rows.append(self.create_row(self.parent))
+
+        for index, widgets in enumerate(self.rows):
+            if index < len(items):
+                update_row(widgets, items[index])
+                for column, widget in enumerate(widgets):
+                    widget.grid(row=self.first_row + index, column=column, padx=10, pady=5)
+            else:
+                for widget in widgets:
+                    widget.grid_remove()
+
+        return self.first_row + len(items)
+
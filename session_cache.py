@@ -0,0 +1,74 @@
+import hashlib
+import hmac
+import os
+import threading
+import time
+from collections import OrderedDict
+
+
+class CachedSession:
+    def __init__(self, data: dict, token: str = None):
+        self.data = data
+        self.token = token
+        self.fetched_at = time.monotonic()
+
+    @property
+    def age(self):
+        return time.monotonic() - self.fetched_at
+
+
+class SessionCache:
+    """Short-lived, LRU-bounded cache of owner locker lists
+
+    Entries are keyed by an HMAC of the credentials under a per-process
+    secret, so neither passwords nor reusable hashes are kept. Within
+    ``fresh_ttl`` an entry is served as-is; up to ``max_age`` it is served
+    immediately but should be revalidated in the background
+    (stale-while-revalidate); after that it is dropped.
+    """
+
+    def __init__(self, fresh_ttl: float = 60, max_age: float = 600, max_entries: int = 32):
+        self.fresh_ttl = fresh_ttl
+        self.max_age = max_age
+        self.max_entries = max_entries
+        self.secret = os.urandom(32)
+        self.lock = threading.Lock()
+        self.entries = OrderedDict()
+
+    def key(self, email: str, password: str):
+        message = f"{email.lower()}\0{password}".encode()
+        return hmac.new(self.secret, message, hashlib.sha256).hexdigest()
+
+    def get(self, key: str):
+        """Return (session, stale) or (None, False) if missing or too old"""
+        with self.lock:
+            session = self.entries.get(key)
+            if session is None:
+                return None, False
+            if session.age > self.max_age:
+                del self.entries[key]
+                return None, False
+            self.entries.move_to_end(key)
+            return session, session.age > self.fresh_ttl
+
+    def put(self, key: str, data: dict, token: str = None):
+        with self.lock:
+            previous = self.entries.get(key)
+            # Keep a server-issued token if the refresh response didn't carry a new one
+            token = token or (previous.token if previous else None)
+            self.entries[key] = CachedSession(data, token)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+    def invalidate(self, key: str):
+        with self.lock:
+            self.entries.pop(key, None)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+    def __len__(self):
+        with self.lock:
+            return len(self.entries)
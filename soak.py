@@ -0,0 +1,343 @@
+"""Soak test: a very long run of transactions with resource sampling
+
+Drives a KioskCore with simulated relay banks against the stub API for
+millions of transactions. The mix is valid and invalid OTP submits,
+prefetched submits, owner logins and owner opens; every open also runs a
+UV cycle. RSS, threads, open file descriptors and (with --ui) Tk widgets
+are sampled as it goes:
+
+    python3 soak.py                               # 1,000,000 transactions
+    python3 soak.py --duration 8h --sample-interval 60
+    python3 soak.py --transactions 200000 --tracemalloc
+    python3 soak.py --ui                          # also cycles the Tk screens (needs a display)
+
+Growth is measured from the end of the warm-up (the first 10% by default)
+to the end of the run. The run exits 1 if any of these grew past its
+allowance:
+- memory, beyond --max-rss-growth-mb
+- threads
+- file descriptors
+- widgets
+
+With --tracemalloc, the source lines that allocated the most memory since
+the warm-up are listed as allocation hot spots (tracing makes the run
+several times slower).
+"""
+import argparse
+import contextlib
+import json
+import os
+import random
+import re
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+
+from benchmark import LOCKERS, call, write_topology
+from resources import count_widgets, process_usage
+from stub_server import StubServer
+
+OWNERS = 64
+MIX = (
+    ("submit", 40),
+    ("submit_invalid", 20),
+    ("submit_prefetched", 15),
+    ("login", 15),
+    ("owner_open", 10),
+)
+
+
+def parse_duration(text: str):
+    match = re.fullmatch(r"(\d+(?:\.\d+)?)([smhd]?)", text.strip())
+    if not match:
+        raise argparse.ArgumentTypeError(f"Unrecognized duration: {text}")
+    return float(match[1]) * {"": 1, "s": 1, "m": 60, "h": 3600, "d": 86400}[match[2]]
+
+
+def build_stub_data():
+    """Owners with three lockers each; OTPs are added as the run needs them"""
+    numbers = [str(number) for number in range(1, LOCKERS + 1)]
+    users = {}
+    for i in range(OWNERS):
+        users[f"soak{i}@example.com"] = {
+            "password": "password",
+            "name": f"Soak Owner {i}",
+            "lockers": [{
+                "id": f"locker-{number}",
+                "number": number,
+                "size": "small",
+                "subscription": {"status": "active", "expiresAt": "2030-01-01T00:00:00.000Z"},
+            } for number in (numbers[(i * 3 + k) % LOCKERS] for k in range(3))],
+        }
+    return {"otps": {}, "otp_expiry": "2030-01-01T00:00:00.000Z", "users": users}
+
+
+def slope(points):
+    """Least-squares slope of (x, y) points, or 0 with fewer than two distinct x"""
+    if len(points) < 2:
+        return 0.0
+    mean_x = sum(x for x, _ in points) / len(points)
+    mean_y = sum(y for _, y in points) / len(points)
+    spread = sum((x - mean_x) ** 2 for x, _ in points)
+    if not spread:
+        return 0.0
+    return sum((x - mean_x) * (y - mean_y) for x, y in points) / spread
+
+
+class Soak:
+    def __init__(self, server: StubServer, work_dir: str, ui: bool = False, seed: int = 1):
+        self.server = server
+        self.work_dir = work_dir
+        self.random = random.Random(seed)
+        self.topology_path = os.path.join(work_dir, "topology.toml")
+        write_topology(self.topology_path)
+        self.root = None
+        self.app = None
+        self.core = self.start_ui() if ui else self.start_core()
+        self.next_code = 100000
+        self.outcomes = {}    # (transaction kind, status) -> count
+        self.unexpected = {}  # transaction kind -> count
+        self.samples = []
+
+    def start_core(self):
+        from kiosk_core import KioskCore
+
+        core = KioskCore(base_url=self.server.base_url, data_dir=os.path.join(self.work_dir, "core"),
+                         topology_path=self.topology_path)
+        os.makedirs(core.data_dir, exist_ok=True)
+        ready = threading.Event()
+        core.subscribe(lambda event, data: ready.set() if event in ("ready", "fatal") else None)
+        core.start()
+        if not ready.wait(30) or not core.ready:
+            raise RuntimeError(f"Kiosk core failed to start: {core.error}")
+        return self.tune(core)
+
+    def start_ui(self):
+        import tkinter as tk
+
+        self.root = tk.Tk()
+        os.environ.update({
+            "SMARTPALMS_API_URL": self.server.base_url,
+            "SMARTPALMS_DATA_DIR": os.path.join(self.work_dir, "ui"),
+            "SMARTPALMS_TOPOLOGY": self.topology_path,
+        })
+        os.environ.pop("SMARTPALMS_CORE_SOCKET", None)
+        os.makedirs(os.environ["SMARTPALMS_DATA_DIR"], exist_ok=True)
+        from main import LockerKioskApplication
+
+        self.app = LockerKioskApplication(self.root)
+        deadline = time.monotonic() + 30
+        while not self.app.ready:
+            if time.monotonic() > deadline or self.app.core.error:
+                raise RuntimeError(f"Kiosk core failed to start: {self.app.core.error}")
+            self.root.update()
+            time.sleep(0.01)
+        return self.tune(self.app.core)
+
+    def tune(self, core):
+        # Short pulses so opens never wait on a relay or queue UV cycles
+        core.lock_pulse_duration = 0.001
+        core.uv_light_duration = 0.001
+        core.uv_scheduler.duration = 0.001
+        # The loopback interface stands in for wlan0, so the outbox drains
+        core.connectivity.interface = "lo"
+        core.connectivity.check_now()
+        return core
+
+    def fresh_code(self, locker_number: str):
+        code = str(self.next_code)
+        self.next_code = 100000 + (self.next_code - 99999) % 900000
+        with self.server.lock:
+            self.server.data["otps"][code] = locker_number
+        return code
+
+    def transaction(self, i: int):
+        kind = self.random.choices([name for name, _ in MIX], weights=[weight for _, weight in MIX])[0]
+        locker_number = str(i % LOCKERS + 1)
+        if kind == "submit":
+            _, result = call(self.core.submit_otp, self.fresh_code(locker_number))
+            expected = ("opened", "already_open")
+        elif kind == "submit_invalid":
+            _, result = call(self.core.submit_otp, str(self.random.randrange(1_000_000, 10_000_000)))
+            expected = ("rejected",)
+        elif kind == "submit_prefetched":
+            code = self.fresh_code(locker_number)
+            self.core.prefetch_otp(code)
+            _, result = call(self.core.submit_otp, code)
+            expected = ("opened", "already_open")
+        elif kind == "login":
+            _, result = call(self.core.login, f"soak{self.random.randrange(OWNERS)}@example.com", "password")
+            expected = ("ok",)
+        else:
+            _, result = call(self.core.open_owner_locker, locker_number, f"locker-{locker_number}")
+            expected = ("opened", "already_open")
+
+        status = result.get("status")
+        self.outcomes[(kind, status)] = self.outcomes.get((kind, status), 0) + 1
+        if status not in expected:
+            self.unexpected[kind] = self.unexpected.get(kind, 0) + 1
+
+        if self.app:
+            if i % 50 == 0:
+                self.cycle_screens()
+            self.root.update()
+
+    def cycle_screens(self):
+        owner = self.server.data["users"][f"soak{self.random.randrange(OWNERS)}@example.com"]
+        self.app.show_login_screen()
+        self.app.show_lockers_screen({"user": {"name": owner["name"]}, "lockers": owner["lockers"]})
+        self.app.show_otp_screen()
+
+    def sample(self, transactions: int, started: float):
+        usage = process_usage()
+        # The stub's handler threads and sockets live in this process too
+        stub_threads = sum(1 for thread in threading.enumerate() if "process_request" in thread.name)
+        sample = {
+            "seconds": round(time.monotonic() - started, 1),
+            "transactions": transactions,
+            "rss_mb": round(usage["rss_bytes"] / 2 ** 20, 2) if usage["rss_bytes"] else None,
+            "threads": usage["threads"] - stub_threads,
+            "fds": usage["fds"] - stub_threads if usage["fds"] is not None else None,
+            "widgets": count_widgets(self.root) if self.root else None,
+            "traced_mb": round(tracemalloc.get_traced_memory()[0] / 2 ** 20, 2) if tracemalloc.is_tracing() else None,
+        }
+        self.samples.append(sample)
+        # The stub records every request; the soak only needs it to answer
+        with self.server.lock:
+            self.server.request_log.clear()
+            self.server.access_history.clear()
+            del self.server.changes[:-1000]  # the kiosk's delta cursor is never this far behind
+        return sample
+
+    def shutdown(self):
+        if self.app:
+            self.app.watchdog.stop()
+            self.app.core.shutdown()
+            self.root.destroy()
+        else:
+            self.core.shutdown()
+
+
+def format_sample(sample):
+    parts = [f"{sample['seconds']:>8.0f}s", f"{sample['transactions']:>10,} tx", f"rss {sample['rss_mb']} MB",
+             f"threads {sample['threads']}", f"fds {sample['fds']}"]
+    if sample["widgets"] is not None:
+        parts.append(f"widgets {sample['widgets']}")
+    if sample["traced_mb"] is not None:
+        parts.append(f"traced {sample['traced_mb']} MB")
+    return "  ".join(parts)
+
+
+def growth_report(samples, warmup_transactions: int, limits: dict):
+    """Lines describing growth after the warm-up, and the resources over their allowance"""
+    steady = [sample for sample in samples if sample["transactions"] >= warmup_transactions]
+    if len(steady) < 2:
+        return ["Not enough samples after the warm-up to judge growth; run longer"], []
+    first, last = steady[0], steady[-1]
+    lines, leaks = [], []
+    for key, unit in (("rss_mb", "MB"), ("threads", ""), ("fds", ""), ("widgets", "")):
+        if first[key] is None or last[key] is None:
+            continue
+        growth = last[key] - first[key]
+        per_100k = slope([(s["transactions"], s[key]) for s in steady if s[key] is not None]) * 100_000
+        lines.append(f"  {key:8} {first[key]:>9} -> {last[key]:<9} {growth:+.2f} {unit}"
+                     f"  (trend {per_100k:+.3f} {unit} per 100k transactions)")
+        if growth > limits[key]:
+            leaks.append(key)
+    return lines, leaks
+
+
+def hot_spots(baseline, top: int):
+    snapshot = tracemalloc.take_snapshot().filter_traces((
+        tracemalloc.Filter(False, tracemalloc.__file__),
+        tracemalloc.Filter(False, "<frozen importlib._bootstrap*>"),
+    ))
+    lines = []
+    for stat in snapshot.compare_to(baseline, "lineno")[:top]:
+        frame = stat.traceback[0]
+        lines.append(f"  {stat.size_diff / 1024:+10.1f} KiB {stat.count_diff:+8} blocks  "
+                     f"{frame.filename}:{frame.lineno}")
+    return lines
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Soak-test the kiosk core and watch for resource growth")
+    parser.add_argument("--transactions", type=int, default=1_000_000)
+    parser.add_argument("--duration", type=parse_duration, help="stop after this long instead, e.g. 8h")
+    parser.add_argument("--sample-interval", type=float, default=30, help="seconds between samples")
+    parser.add_argument("--warmup", type=float, default=0.1, help="fraction of the run before growth is measured")
+    parser.add_argument("--latency", type=float, default=0.0, help="stub API latency per request (s)")
+    parser.add_argument("--max-rss-growth-mb", type=float, default=10.0)
+    parser.add_argument("--ui", action="store_true", help="run the Tk front-end and cycle its screens")
+    parser.add_argument("--tracemalloc", action="store_true", help="report allocation hot spots (slow)")
+    parser.add_argument("--top", type=int, default=15, help="hot spots to list")
+    parser.add_argument("--out", default="soak.jsonl", help="samples as JSON lines")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--verbose", action="store_true", help="show the kiosk's own log output")
+    args = parser.parse_args()
+
+    # Local ports would clash with a kiosk running on the same machine
+    os.environ["SMARTPALMS_METRICS_PORT"] = ""
+    os.environ["SMARTPALMS_CONTROL_PORT"] = ""
+    if args.tracemalloc:
+        tracemalloc.start()
+
+    out = sys.stdout  # samples go here while the kiosk's own output is redirected
+    server = StubServer(data=build_stub_data(), latency=args.latency).start()
+    limits = {"rss_mb": args.max_rss_growth_mb, "threads": 2, "fds": 4, "widgets": 0}
+    with tempfile.TemporaryDirectory(prefix="smartpalms-soak-") as work_dir, open(args.out, "w") as samples_file, \
+            open(os.devnull, "w") as devnull:
+        log = contextlib.nullcontext() if args.verbose else contextlib.redirect_stdout(devnull)
+        with log:
+            soak = Soak(server, work_dir, ui=args.ui, seed=args.seed)
+            total = args.transactions if not args.duration else None
+            warmup_transactions = int(args.transactions * args.warmup) if total else None
+            started = time.monotonic()
+            deadline = started + args.duration if args.duration else None
+            next_sample = started
+            baseline = None
+            done = 0
+            try:
+                while (total is None or done < total) and (deadline is None or time.monotonic() < deadline):
+                    soak.transaction(done)
+                    done += 1
+                    if time.monotonic() >= next_sample:
+                        sample = soak.sample(done, started)
+                        samples_file.write(json.dumps(sample) + "\n")
+                        samples_file.flush()
+                        print(format_sample(sample), file=out)
+                        next_sample += args.sample_interval
+                    if warmup_transactions is None and deadline and time.monotonic() >= started + args.duration * args.warmup:
+                        warmup_transactions = done
+                    if args.tracemalloc and baseline is None and warmup_transactions is not None and done >= warmup_transactions:
+                        baseline = tracemalloc.take_snapshot()
+            except KeyboardInterrupt:
+                print("Interrupted; reporting what ran so far", file=out)
+            final = soak.sample(done, started)
+            samples_file.write(json.dumps(final) + "\n")
+            report_lines, leaks = growth_report(soak.samples, warmup_transactions or 0, limits)
+            spots = hot_spots(baseline, args.top) if baseline else []
+            soak.shutdown()
+    server.stop()
+
+    elapsed = time.monotonic() - started
+    print(format_sample(final))
+    print(f"\n{done:,} transactions in {elapsed:.0f}s ({done / max(elapsed, 1e-9):.0f}/s)")
+    for (kind, status), count in sorted(soak.outcomes.items()):
+        print(f"  {kind:18} {str(status):14} {count:>10,}")
+    for kind, count in sorted(soak.unexpected.items()):
+        print(f"{kind}: {count} transactions with an unexpected outcome")
+    print("\nGrowth after warm-up:")
+    print("\n".join(report_lines))
+    if spots:
+        print("\nAllocation hot spots since warm-up:")
+        print("\n".join(spots))
+    if leaks:
+        print(f"\nPossible leaks: {', '.join(leaks)}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,35 @@
+import threading
+import time
+from contextlib import contextmanager
+
+# Captured as early as possible: main.py imports this module first
+PROCESS_START = time.perf_counter()
+
+
+class StartupTimer:
+    """Times startup phases (which may run on different threads) and prints a report"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.phases = []  # (name, duration in seconds, seconds since process start when done)
+
+    @contextmanager
+    def phase(self, name: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            end = time.perf_counter()
+            with self.lock:
+                self.phases.append((name, end - start, end - PROCESS_START))
+
+    def report(self):
+        with self.lock:
+            phases = sorted(self.phases, key=lambda phase: phase[2])
+        total = phases[-1][2] if phases else 0.0
+        summary = ", ".join(
+            f"{name} {duration * 1000:.0f}ms (done at {finished:.2f}s)"
+            for name, duration, finished in phases
+        )
+        print(f"Startup finished in {total:.2f}s: {summary}")
+        return phases
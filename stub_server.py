@@ -0,0 +1,301 @@
+"""Local stand-in for the Smart Palms backend
+
+Serves the endpoints the kiosk uses so the app, load tests and benchmarks
+can run without the real API:
+
+    python stub_server.py --port 8000 --latency 0.05
+    SMARTPALMS_API_URL=http://127.0.0.1:8000/api python main.py
+"""
+import argparse
+import json
+import random
+import secrets
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+
+def default_data():
+    return {
+        "otps": {"123456": "1", "654321": "2"},
+        "otp_expiry": "2030-01-01T00:00:00.000Z",
+        "users": {
+            "owner@example.com": {
+                "password": "password",
+                "name": "Test Owner",
+                "lockers": [
+                    {
+                        "id": "locker-3",
+                        "number": "3",
+                        "size": "small",
+                        "subscription": {"status": "active", "expiresAt": "2030-01-01T00:00:00.000Z"},
+                    },
+                ],
+            },
+        },
+    }
+
+
+class StubRequestHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # keep-alive, like the real backend
+    disable_nagle_algorithm = True  # latency comes from --latency, not delayed ACKs
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+    def simulate_network(self):
+        """Apply configured latency; returns False if the request is 'lost'"""
+        server = self.server
+        if server.latency:
+            time.sleep(server.latency + random.uniform(0, server.jitter))
+        if server.loss and random.random() < server.loss:
+            self.close_connection = True
+            return False
+        return True
+
+    def read_json(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        if not length:
+            return {}
+        try:
+            return json.loads(self.rfile.read(length))
+        except ValueError:
+            return {}
+
+    def send_json(self, status: int, body, headers=None):
+        payload = json.dumps(body).encode() if body is not None else b""
+        self.send_response(status)
+        if body is not None:
+            self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def send_state(self):
+        """Delta sync of kiosk state; called with the server lock held"""
+        server = self.server
+        since = parse_qs(urlsplit(self.path).query).get("since", [None])[0]
+        if since is not None and (not since.isdigit() or int(since) > server.version):
+            return self.send_json(410, {"message": "Unknown cursor"})
+
+        headers = {}
+        prefer = self.headers.get("Prefer", "")
+        if since is not None and prefer.startswith("wait="):
+            # Long-poll: hold the request until something changes
+            wait = min(float(prefer[len("wait="):]), 60)
+            deadline = time.monotonic() + wait
+            while server.version == int(since) and not server.stopped:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                server.changed.wait(remaining)
+            headers["Preference-Applied"] = prefer
+
+        etag = f'"{server.version}"'
+        headers["ETag"] = etag
+        if self.headers.get("If-None-Match") == etag:
+            return self.send_json(304, None, headers)
+
+        data = server.data
+        lockers = {locker["id"]: locker for user in data["users"].values() for locker in user["lockers"]}
+        otps = {
+            code: {"code": code, "locker": {"number": number}, "expiresAt": data["otp_expiry"]}
+            for code, number in data["otps"].items()
+        }
+        if since is None:
+            body = {"full": True, "lockers": list(lockers.values()), "otps": list(otps.values())}
+        else:
+            changed = {(kind, key) for version, kind, key in server.changes if version > int(since)}
+            changed_lockers = {key for kind, key in changed if kind == "locker"}
+            changed_otps = {key for kind, key in changed if kind == "otp"}
+            body = {
+                "full": False,
+                "lockers": [lockers[key] for key in changed_lockers if key in lockers],
+                "otps": [otps[key] for key in changed_otps if key in otps],
+                "removed": {
+                    "lockers": [key for key in changed_lockers if key not in lockers],
+                    "otps": [key for key in changed_otps if key not in otps],
+                },
+            }
+        body["cursor"] = str(server.version)
+        return self.send_json(200, body, headers)
+
+    def route(self, method: str):
+        path = urlsplit(self.path).path
+        prefix = self.server.prefix
+        if not path.startswith(prefix + "/"):
+            return self.send_json(404, {"message": "Not found"})
+        resource = path[len(prefix) + 1:]
+        body = self.read_json() if method in ("POST", "PATCH") else {}
+
+        with self.server.lock:
+            self.server.request_log.append((method, resource))
+            data = self.server.data
+
+            if method in ("GET", "HEAD") and resource == "test":
+                return self.send_json(200, {"ok": True} if method == "GET" else None)
+
+            if method == "POST" and resource == "lockers/external":
+                authorization = self.headers.get("Authorization", "")
+                if authorization.startswith("Bearer "):
+                    email = self.server.tokens.get(authorization[len("Bearer "):])
+                    if email not in data["users"]:
+                        return self.send_json(401, {"message": "Invalid token"})
+                    token = None
+                else:
+                    email = body.get("email")
+                    user = data["users"].get(email)
+                    if not user or user["password"] != body.get("password"):
+                        return self.send_json(401, {"message": "Invalid credentials"})
+                    token = secrets.token_urlsafe(24)
+                    self.server.tokens[token] = email
+                user = data["users"][email]
+                response = {"user": {"name": user["name"]}, "lockers": user["lockers"]}
+                if token:
+                    response["token"] = token
+                return self.send_json(200, response)
+
+            if method == "GET" and resource == "otps/active":
+                return self.send_json(200, {"otps": [
+                    {"code": otp, "locker": {"number": number}, "expiresAt": data["otp_expiry"]}
+                    for otp, number in data["otps"].items()
+                ]})
+
+            if method == "GET" and resource.startswith("kiosks/") and resource.endswith("/state"):
+                return self.send_state()
+
+            if method == "POST" and resource == "access-history":
+                self.server.access_history.append(body)
+                return self.send_json(201, {"success": True})
+
+            if "/" not in resource and resource:
+                otp = resource
+                if otp not in data["otps"]:
+                    return self.send_json(404, {"success": False, "message": "Invalid OTP code"})
+                if method == "GET":
+                    return self.send_json(200, {"success": True, "locker": {"number": data["otps"][otp]}})
+                if method == "PATCH":
+                    del data["otps"][otp]
+                    self.server.record_change("otp", otp)
+                    return self.send_json(200, {"success": True})
+
+        return self.send_json(404, {"message": "Not found"})
+
+    def handle_method(self, method: str):
+        # Keep-alive connections outlive shutdown(); drop them once stopped
+        if self.server.stopped:
+            self.close_connection = True
+            return
+        if not self.simulate_network():
+            return
+        self.route(method)
+
+    def do_GET(self):
+        self.handle_method("GET")
+
+    def do_HEAD(self):
+        self.handle_method("HEAD")
+
+    def do_POST(self):
+        self.handle_method("POST")
+
+    def do_PATCH(self):
+        self.handle_method("PATCH")
+
+
+class StubServer(ThreadingHTTPServer):
+    """Threaded stub API; use start()/stop() from scripts"""
+
+    daemon_threads = True
+    request_queue_size = 128  # load tests open many connections at once
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 0, data=None,
+                 latency: float = 0.0, jitter: float = 0.0, loss: float = 0.0,
+                 prefix: str = "/api", verbose: bool = False):
+        super().__init__((host, port), StubRequestHandler)
+        self.data = data or default_data()
+        self.latency = latency
+        self.jitter = jitter
+        self.loss = loss
+        self.prefix = prefix
+        self.verbose = verbose
+        self.lock = threading.Lock()
+        self.request_log = []
+        self.access_history = []
+        self.tokens = {}  # owner session token -> email
+        self.version = 0   # bumped on every change, used as the delta sync cursor
+        self.changes = []  # (version, "otp" | "locker", key)
+        self.changed = threading.Condition(self.lock)
+        self.stopped = False
+        self.thread = None
+
+    def record_change(self, kind: str, key: str):
+        """Log a change for delta sync; call with the lock held"""
+        self.version += 1
+        self.changes.append((self.version, kind, key))
+        self.changed.notify_all()
+
+    def set_otp(self, code: str, locker_number: str):
+        with self.lock:
+            self.data["otps"][code] = locker_number
+            self.record_change("otp", code)
+
+    def remove_otp(self, code: str):
+        with self.lock:
+            self.data["otps"].pop(code, None)
+            self.record_change("otp", code)
+
+    def set_subscription(self, locker_id: str, status: str, expires_at: str = None):
+        with self.lock:
+            for user in self.data["users"].values():
+                for locker in user["lockers"]:
+                    if locker["id"] == locker_id:
+                        locker["subscription"]["status"] = status
+                        if expires_at:
+                            locker["subscription"]["expiresAt"] = expires_at
+            self.record_change("locker", locker_id)
+
+    @property
+    def base_url(self):
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}{self.prefix}"
+
+    def start(self):
+        self.thread = threading.Thread(target=self.serve_forever, name="stub-api", daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.stopped = True
+        with self.lock:
+            self.changed.notify_all()  # release long-polls
+        self.shutdown()
+        self.server_close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run a local stub of the Smart Palms API")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--latency", type=float, default=0.0, help="added delay per request (s)")
+    parser.add_argument("--jitter", type=float, default=0.0, help="random extra delay (s)")
+    parser.add_argument("--loss", type=float, default=0.0, help="fraction of requests dropped")
+    args = parser.parse_args()
+
+    server = StubServer(args.host, args.port, latency=args.latency, jitter=args.jitter,
+                        loss=args.loss, verbose=True)
+    print(f"Stub API listening on {server.base_url}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
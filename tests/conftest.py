@@ -0,0 +1,74 @@
+"""Shared fixtures: a stub backend and kiosk cores on simulated relays"""
+import os
+import sys
+import threading
+import time
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmark import write_topology  # noqa: E402
+from stub_server import StubServer  # noqa: E402
+
+
+@pytest.fixture
+def server():
+    server = StubServer().start()
+    yield server
+    server.stop()
+
+
+@pytest.fixture
+def start_core(server, tmp_path, monkeypatch):
+    """start_core(online=True, control=False) -> a ready KioskCore against the stub
+
+    Cores share one data directory per test, so a second core started in
+    the same test picks up what the first left behind. With control=True
+    the control API listens on a free port with the token "secret".
+    """
+    from kiosk_core import KioskCore
+
+    monkeypatch.setenv("SMARTPALMS_METRICS_PORT", "")
+    monkeypatch.setenv("SMARTPALMS_KEEP_WARM", "0")
+    monkeypatch.setenv("SMARTPALMS_CONTROL_TOKEN", "secret")
+    topology_path = str(tmp_path / "topology.toml")
+    write_topology(topology_path)
+    cores = []
+
+    def start(online: bool = True, control: bool = False):
+        monkeypatch.setenv("SMARTPALMS_CONTROL_PORT", "0" if control else "")
+        core = KioskCore(base_url=server.base_url, data_dir=str(tmp_path / "core"), topology_path=topology_path)
+        os.makedirs(core.data_dir, exist_ok=True)
+        cores.append(core)
+        # Short pulses so opens never wait on a relay
+        core.lock_pulse_duration = 0.05
+        core.uv_light_duration = 0.05
+        core.uv_scheduler.duration = 0.05
+
+        ready = threading.Event()
+        core.subscribe(lambda event, data: ready.set() if event in ("ready", "fatal") else None)
+        core.start()
+        assert ready.wait(30) and core.ready, core.error
+        if online:
+            # The loopback interface stands in for wlan0
+            core.connectivity.interface = "lo"
+            core.connectivity.check_now()
+        return core
+
+    yield start
+    for core in cores:
+        core.shutdown()
+
+
+def poll(condition, timeout: float = 10):
+    """Call condition() until it is true or timeout passes; returns its last value"""
+    deadline = time.monotonic() + timeout
+    while not (result := condition()) and time.monotonic() < deadline:
+        time.sleep(0.02)
+    return result
+
+
+@pytest.fixture
+def wait_for():
+    return poll
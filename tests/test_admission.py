@@ -0,0 +1,87 @@
+"""Admission: coalescing repeated work, the pending limit, and the core's use of it"""
+import threading
+import time
+
+from admission import Admission
+from benchmark import call
+
+
+def test_work_in_flight_is_not_admitted_twice():
+    admission = Admission()
+
+    assert admission.begin(("otp", "1"), "Verifying code") == ("admitted", None)
+    assert admission.begin(("otp", "1"), "Verifying code") == ("in_flight", None)
+    admission.end(("otp", "1"))
+    assert admission.begin(("otp", "1"), "Verifying code") == ("admitted", None)
+
+
+def test_remembered_outcome_answers_repeats_until_it_expires():
+    admission = Admission(recent_ttl=0.1)
+    admission.begin(("otp", "1"), "Verifying code")
+    admission.end(("otp", "1"), {"status": "opened"}, remember=True)
+
+    assert admission.begin(("otp", "1"), "Verifying code") == ("recent", {"status": "opened"})
+    time.sleep(0.15)
+    assert admission.begin(("otp", "1"), "Verifying code") == ("admitted", None)
+
+
+def test_work_past_the_limit_is_turned_away():
+    admission = Admission(max_pending=2)
+    admission.begin(("otp", "1"), "Verifying code")
+    admission.begin(("otp", "2"), "Verifying code")
+
+    assert admission.begin(("otp", "3"), "Verifying code") == ("full", None)
+    assert admission.state() == {"pending": 2, "limit": 2, "items": ["Verifying code", "Verifying code"]}
+
+
+def test_state_and_changes_are_per_origin():
+    changes = []
+    admission = Admission(on_change=changes.append)
+    admission.begin(("otp", "1"), "Verifying code", origin="a")
+    admission.begin(("locker", "3"), "Opening locker", origin="b")
+    admission.end(("otp", "1"))
+    admission.end(("otp", "1"))  # already ended: no change
+
+    assert changes == ["a", "b", "a"]
+    assert admission.state("a")["items"] == []
+    assert admission.state("b")["items"] == ["Opening locker"]
+    assert admission.state()["pending"] == 1
+
+
+def test_duplicate_submits_share_one_lookup(server, start_core):
+    core = start_core()
+    # Lookups go to the backend rather than the synced cache: stop the sync
+    # worker, and end its long-poll with an unrelated change
+    core.replica_sync.stop()
+    server.remove_otp("999999")
+    core.replica_sync.thread.join(10)
+    server.latency = 0.2
+    server.set_otp("222222", "2")
+
+    # submit_otp marks the code in flight before it returns
+    first = []
+    done = threading.Event()
+    core.submit_otp("222222", on_done=lambda result: (first.append(result), done.set()))
+    _, repeat = call(core.submit_otp, "222222")
+    assert done.wait(10)
+    _, after = call(core.submit_otp, "222222")
+
+    assert repeat["status"] == "in_progress"
+    assert first[0]["status"] == "opened"
+    assert after["status"] == "already_open"
+    with server.lock:
+        assert server.request_log.count(("GET", "222222")) == 1
+
+
+def test_locker_is_not_pulsed_again_while_open(start_core):
+    core = start_core()
+    core.lock_pulse_duration = 5
+    opens = []
+    core.subscribe(lambda event, data: opens.append(data) if event == "locker" and data["lock"] == "open" else None)
+
+    _, first = call(core.open_owner_locker, "3", "locker-3")
+    _, repeat = call(core.open_owner_locker, "3", "locker-3")
+
+    assert first["status"] == "opened"
+    assert repeat["status"] == "already_open"
+    assert len(opens) == 1
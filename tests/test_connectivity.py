@@ -0,0 +1,90 @@
+"""ConnectivityMonitor: adaptive probe interval and passive health signals"""
+import time
+
+import pytest
+
+from api_client import KioskApiClient
+from connectivity import ConnectivityMonitor, HealthSnapshot
+
+ONLINE = HealthSnapshot()
+OFFLINE = HealthSnapshot(backend_ok=False)
+
+
+@pytest.fixture
+def monitor():
+    # Never started: the tests drive adapt(), observe() and probe() directly
+    changes = []
+    monitor = ConnectivityMonitor(None, min_interval=5, max_interval=40, outage_interval=20,
+                                  on_change=changes.append)
+    monitor.changes = changes
+    return monitor
+
+
+def intervals(monitor, snapshots):
+    result = []
+    for snapshot in snapshots:
+        monitor.adapt(snapshot)
+        monitor.update(snapshot)
+        result.append(monitor.interval)
+    return result
+
+
+def test_interval_backs_off_while_healthy_and_resets_on_failure(monitor):
+    assert intervals(monitor, [ONLINE] * 5) == [10, 20, 40, 40, 40]
+    assert intervals(monitor, [OFFLINE, OFFLINE, OFFLINE, OFFLINE]) == [5, 10, 20, 20]
+    assert intervals(monitor, [ONLINE, ONLINE]) == [5, 10]
+
+
+def test_next_probe_follows_the_interval(monitor):
+    monitor.adapt(ONLINE)
+
+    assert monitor.next_probe - time.monotonic() == pytest.approx(10, abs=0.5)
+
+
+def test_successful_request_postpones_the_probe(monitor):
+    monitor.interval = 40
+    monitor.observe("otp_lookup", True, 0.05)
+
+    assert monitor.next_probe - time.monotonic() == pytest.approx(40, abs=0.5)
+    assert not monitor.wake.is_set()
+
+
+def test_failed_request_probes_at_once(monitor):
+    monitor.interval = 40
+    monitor.observe("otp_lookup", False, 5.0)
+
+    assert monitor.interval == 5
+    assert monitor.wake.is_set()
+
+
+def test_successful_request_ends_an_outage(monitor):
+    monitor.update(OFFLINE)
+    monitor.changes.clear()
+
+    monitor.observe("login", True, 0.05)
+
+    assert monitor.snapshot().online
+    assert monitor.snapshot().last_backend_ok is not None
+    assert [snapshot.online for snapshot in monitor.changes] == [True]
+
+
+def test_own_probes_are_not_signals(monitor):
+    monitor.update(OFFLINE)
+    monitor.observe("test", True, 0.01)
+    monitor.observe("probe", False, 0.01)
+
+    assert not monitor.snapshot().online
+    assert not monitor.wake.is_set()
+
+
+def test_probe_reaches_the_backend(server):
+    api = KioskApiClient(server.base_url)
+    try:
+        monitor = ConnectivityMonitor(api, interface="lo")
+        snapshot = monitor.probe()
+        assert snapshot.online and snapshot.rtt is not None
+
+        monitor.interface = "missing0"
+        assert not monitor.probe().link_up
+    finally:
+        api.close()
@@ -0,0 +1,54 @@
+"""Control API authentication and the WebSocket event stream"""
+import queue
+import socket
+import threading
+
+import pytest
+
+from control_api import ControlClient
+
+
+def test_requests_without_token_are_refused(start_core):
+    core = start_core(control=True)
+    port = core.control_api.port
+
+    assert ControlClient("", port=port).request("GET", "/state")[0] == 401
+    assert ControlClient("wrong", port=port).request("GET", "/state")[0] == 401
+    assert ControlClient("secret", port=port).request("GET", "/state?token=secret")[0] == 200
+    assert ControlClient("", port=port).request("GET", "/state?token=secret")[0] == 401
+
+
+def test_event_stream_sends_state_then_changes(start_core):
+    core = start_core(control=True)
+    client = ControlClient("secret", port=core.control_api.port)
+    messages = queue.Queue()
+
+    def watch():
+        for message in client.watch():
+            messages.put(message)
+
+    threading.Thread(target=watch, daemon=True).start()
+    first = messages.get(timeout=10)
+    assert first["event"] == "state"
+
+    status, result = client.request("POST", "/lockers/3/open")
+    assert status == 200 and result["status"] == "opened"
+
+    while True:
+        message = messages.get(timeout=10)
+        if message["event"] == "locker":
+            break
+    assert message["data"] == {"locker": "3", "lock": "open"}
+
+
+@pytest.mark.parametrize("length", ["abc", "-1"])
+def test_invalid_content_length_is_a_bad_request(start_core, length):
+    core = start_core(control=True)
+
+    with socket.create_connection(("127.0.0.1", core.control_api.port), timeout=10) as sock:
+        sock.sendall(f"POST /lockers/3/open HTTP/1.1\r\nAuthorization: Bearer secret\r\n"
+                     f"Content-Length: {length}\r\n\r\n".encode())
+        response = sock.makefile("rb").read()
+
+    assert response.startswith(b"HTTP/1.1 400 ")
+    assert b"Invalid Content-Length" in response
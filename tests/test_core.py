@@ -0,0 +1,26 @@
+"""KioskCore against the stub backend and simulated relays"""
+from benchmark import call
+
+
+def patches(server, otp):
+    with server.lock:
+        return [entry for entry in server.request_log if entry == ("PATCH", otp)]
+
+
+def test_valid_otp_opens_locker_and_clears_code(server, start_core, wait_for):
+    core = start_core()
+
+    _, result = call(core.submit_otp, "123456")
+
+    assert result["status"] == "opened"
+    assert result["locker"] == "1"
+    assert wait_for(lambda: patches(server, "123456"))
+
+
+def test_unknown_otp_is_rejected(server, start_core):
+    core = start_core()
+
+    _, result = call(core.submit_otp, "000000")
+
+    assert result["status"] == "rejected"
+    assert not patches(server, "000000")
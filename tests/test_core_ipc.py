@@ -0,0 +1,73 @@
+"""CoreServer and CoreClient: front-ends driving one core over the socket"""
+import threading
+
+import pytest
+
+from benchmark import call
+from core_ipc import CoreClient, CoreServer
+
+
+@pytest.fixture
+def connect(start_core, tmp_path, wait_for):
+    core = start_core()
+    server = CoreServer(core, str(tmp_path / "core.sock")).start()
+    clients = []
+
+    def connect():
+        client = CoreClient(server.path, retry_interval=0.1).start()
+        clients.append(client)
+        assert wait_for(lambda: client.ready)
+        return client
+
+    yield core, connect
+    for client in clients:
+        client.shutdown()
+    server.stop()
+
+
+def events(client, name):
+    seen = []
+    lock = threading.Lock()
+
+    def listener(event, data):
+        if event == name:
+            with lock:
+                seen.append(data)
+
+    client.subscribe(listener)
+    return seen
+
+
+def test_submit_goes_through_the_core(connect):
+    _, connect_client = connect
+
+    _, result = call(connect_client().submit_otp, "123456")
+
+    assert result["status"] == "opened"
+    assert result["locker"] == "1"
+
+
+def test_admission_events_only_reach_the_submitting_front_end(connect, wait_for):
+    _, connect_client = connect
+    submitter, other = connect_client(), connect_client()
+    mine, theirs = events(submitter, "admission"), events(other, "admission")
+
+    _, result = call(submitter.submit_otp, "123456")
+
+    assert result["status"] == "opened"
+    assert wait_for(lambda: len(mine) == 2)
+    assert mine[0]["items"] == ["Verifying code"]
+    assert mine[1]["pending"] == 0
+    assert "origin" not in mine[0]
+    assert not theirs
+
+
+def test_uv_state_is_fetched_on_connect_and_kept_current(connect, wait_for):
+    core, connect_client = connect
+    core.start_uv_light("1", duration=30)
+
+    client = connect_client()
+    assert wait_for(lambda: client.uv_state().get("1", {}).get("state") == "on")
+
+    core.stop_uv_light("1")
+    assert wait_for(lambda: "1" not in client.uv_state())
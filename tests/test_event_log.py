@@ -0,0 +1,83 @@
+"""EventLog: binary segments, queries, torn records and rotation"""
+import os
+import time
+
+import pytest
+
+from event_log import HEADER, RECORD, EventLog, list_segments, parse_time, query
+
+DAY = 86400
+START = 1_760_659_200  # a bucket boundary
+
+
+@pytest.fixture
+def log(tmp_path):
+    log = EventLog(str(tmp_path / "events"))
+    os.makedirs(log.directory)
+    return log
+
+
+def record_at(log, monkeypatch, at: float, *args, **kwargs):
+    with monkeypatch.context() as patch:
+        patch.setattr(time, "time", lambda: at)
+        log.record(*args, **kwargs)
+
+
+def test_query_filters_by_kind_outcome_and_locker(log):
+    log.record("otp", "opened", "3", value=42, source="cache")
+    log.record("otp", "rejected")
+    log.record("open", "opened", "12", source="owner")
+    log.record("uv", "on", "3")
+    log.flush()
+
+    assert [event["kind"] for event in query(log.directory, locker="3")] == ["otp", "uv"]
+    assert [event["locker"] for event in query(log.directory, outcome="opened")] == ["3", "12"]
+    [rejected] = query(log.directory, kind="otp", outcome="rejected")
+    assert rejected["locker"] is None and rejected["source"] is None
+    [cached] = query(log.directory, locker="3", kind="otp")
+    assert cached["value"] == 42 and cached["source"] == "cache"
+
+
+def test_records_go_to_the_segment_of_their_day(log, monkeypatch):
+    record_at(log, monkeypatch, START + 10, "otp", "opened", "1")
+    record_at(log, monkeypatch, START + DAY + 10, "otp", "opened", "2")
+    record_at(log, monkeypatch, START + 2 * DAY + 10, "otp", "opened", "3")
+    log.flush()
+
+    assert [bucket for bucket, _, _ in list_segments(log.directory)] == [START, START + DAY, START + 2 * DAY]
+    lockers = [event["locker"] for event in query(log.directory, since=START + DAY, until=START + DAY + 60)]
+    assert lockers == ["2"]
+    assert [event["locker"] for event in query(log.directory, since=START + 100)] == ["2", "3"]
+
+
+def test_a_torn_record_is_skipped_and_overwritten(log):
+    log.record("otp", "opened", "1")
+    log.flush()
+    [(_, _, path)] = list_segments(log.directory)
+    with open(path, "ab") as f:
+        f.write(b"\x01" * (RECORD.size // 2))  # power cut mid-append
+
+    assert len(list(query(log.directory))) == 1
+    log.record("otp", "opened", "2")
+    log.flush()
+    assert [event["locker"] for event in query(log.directory)] == ["1", "2"]
+    assert os.path.getsize(path) == HEADER.size + 2 * RECORD.size
+
+
+def test_oldest_segments_are_deleted_over_the_limit(log, monkeypatch):
+    log.max_bytes = HEADER.size + 3 * RECORD.size
+    for day in range(3):
+        for _ in range(2):
+            record_at(log, monkeypatch, START + day * DAY, "uv", "off", str(day))
+        log.flush()
+
+    assert [bucket for bucket, _, _ in list_segments(log.directory)] == [START + 2 * DAY]
+    assert {event["locker"] for event in query(log.directory)} == {"2"}
+
+
+def test_parse_time():
+    assert parse_time("90s", now=1000) == 910
+    assert parse_time("2h", now=10_000) == 2800
+    assert parse_time("2026-10-17") == time.mktime((2026, 10, 17, 0, 0, 0, 0, 0, -1))
+    with pytest.raises(ValueError):
+        parse_time("yesterday")
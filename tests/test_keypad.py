@@ -0,0 +1,65 @@
+"""OTP format rules and the Luhn check digit"""
+import pytest
+
+from keypad import OtpFormat, luhn_valid
+
+
+@pytest.mark.parametrize("code, valid", [
+    ("79927398713", True),
+    ("79927398710", False),
+    ("0", True),
+    ("18", True),
+    ("17", False),
+])
+def test_luhn_valid(code, valid):
+    assert luhn_valid(code) is valid
+
+
+def test_without_rules_every_code_is_accepted_but_never_complete():
+    otp_format = OtpFormat()
+
+    assert otp_format.check("12a") is None
+    assert not otp_format.complete("123456")
+
+
+def test_length_and_digits():
+    otp_format = OtpFormat(length=6)
+
+    assert otp_format.check("123456") is None
+    assert otp_format.check("12345") == "OTP codes are 6 digits long"
+    assert otp_format.check("12345a") == "OTP codes contain digits only"
+    assert otp_format.complete("123456")
+    assert not otp_format.complete("12345")
+
+
+def test_luhn_checksum():
+    otp_format = OtpFormat(length=6, checksum="luhn")
+
+    assert otp_format.check("123455") is None
+    assert otp_format.check("123456") == "Invalid OTP code. Please check the digits."
+    assert not otp_format.complete("123456")
+
+
+def test_checksum_without_length():
+    otp_format = OtpFormat(checksum="luhn")
+
+    assert otp_format.check("18") is None
+    assert otp_format.check("17") is not None
+    assert not otp_format.complete("18")
+
+
+def test_from_env(monkeypatch):
+    monkeypatch.setenv("SMARTPALMS_OTP_LENGTH", "8")
+    monkeypatch.setenv("SMARTPALMS_OTP_CHECKSUM", "luhn")
+    otp_format = OtpFormat.from_env()
+    assert (otp_format.length, otp_format.checksum) == (8, "luhn")
+
+    monkeypatch.delenv("SMARTPALMS_OTP_LENGTH")
+    monkeypatch.setenv("SMARTPALMS_OTP_CHECKSUM", "")
+    otp_format = OtpFormat.from_env()
+    assert (otp_format.length, otp_format.checksum) == (None, None)
+
+
+def test_unknown_checksum_is_rejected():
+    with pytest.raises(ValueError):
+        OtpFormat(checksum="crc")
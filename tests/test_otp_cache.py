@@ -0,0 +1,90 @@
+"""OtpCache: lookups, expiry, tombstones and syncing from the stub backend"""
+import time
+
+import pytest
+
+from api_client import KioskApiClient
+from benchmark import call
+from otp_cache import OtpCache, OtpSyncWorker
+
+
+@pytest.fixture
+def cache(tmp_path):
+    cache = OtpCache(str(tmp_path / "otp_cache.db"))
+    yield cache
+    cache.close()
+
+
+def test_lookup_returns_the_locker_until_the_code_expires(cache):
+    now = time.time()
+    cache.replace_all([("111111", "1", now + 60), ("222222", "2", None)])
+    cache.apply_changes([("333333", "3", now + 0.1)], [])
+
+    assert cache.lookup("111111") == "1"
+    assert cache.lookup("222222") == "2"
+    assert cache.lookup("333333") == "3"
+    time.sleep(0.15)
+    assert cache.lookup("333333") is None
+    assert cache.lookup("444444") is None
+
+
+def test_expired_codes_are_never_cached(cache):
+    cache.replace_all([("111111", "1", time.time() - 1)])
+
+    assert cache.lookup("111111") is None
+    assert len(cache) == 0
+
+
+def test_consumed_code_is_not_brought_back_by_a_sync(cache):
+    cache.replace_all([("111111", "1", None)])
+    assert cache.consume("111111")
+
+    # The backend hasn't processed the clear yet and still lists the code
+    cache.replace_all([("111111", "1", None)])
+    assert cache.lookup("111111") is None
+    cache.apply_changes([("111111", "1", None)], [])
+    assert cache.lookup("111111") is None
+
+    # Once the backend has dropped it, the tombstone goes and a reissue works
+    cache.replace_all([])
+    cache.replace_all([("111111", "4", None)])
+    assert cache.lookup("111111") == "4"
+
+
+def test_cache_survives_a_restart(tmp_path):
+    path = str(tmp_path / "otp_cache.db")
+    cache = OtpCache(path)
+    cache.replace_all([("111111", "1", None)])
+    cache.consume("111111")
+    cache.apply_changes([("222222", "2", None)], [])
+    cache.close()
+
+    reopened = OtpCache(path)
+    try:
+        assert reopened.lookup("222222") == "2"
+        reopened.replace_all([("111111", "1", None), ("222222", "2", None)])
+        assert reopened.lookup("111111") is None
+    finally:
+        reopened.close()
+
+
+def test_sync_worker_pulls_active_codes(server, cache):
+    api = KioskApiClient(server.base_url)
+    try:
+        OtpSyncWorker(cache, api, "kiosk-1").pull()
+    finally:
+        api.close()
+
+    assert cache.lookup("123456") == "1"
+    assert cache.lookup("654321") == "2"
+
+
+def test_synced_code_opens_while_the_backend_is_down(server, start_core, wait_for):
+    core = start_core()
+    assert wait_for(lambda: core.otp_cache.lookup("123456") == "1")
+    server.stop()
+
+    _, result = call(core.submit_otp, "123456")
+
+    assert result["status"] == "opened"
+    assert result["locker"] == "1"
@@ -0,0 +1,79 @@
+"""Outbox delivery, retries and replay across restarts"""
+import time
+
+from benchmark import call
+from outbox import Outbox
+
+
+class Response:
+    def __init__(self, status_code: int):
+        self.status_code = status_code
+        self.ok = status_code < 400
+
+
+def patches(server, otp):
+    with server.lock:
+        return [entry for entry in server.request_log if entry == ("PATCH", otp)]
+
+
+def test_duplicate_keys_are_dropped(tmp_path):
+    sent = []
+    outbox = Outbox(str(tmp_path / "outbox.db"), {"event": lambda payload, key: sent.append(key) or Response(200)})
+
+    assert outbox.enqueue("event", {"n": 1}, key="event:1")
+    assert not outbox.enqueue("event", {"n": 1}, key="event:1")
+    assert outbox.flush_batch() == 1
+    assert not outbox.enqueue("event", {"n": 1}, key="event:1")  # delivered keys are kept too
+
+    assert sent == ["event:1"]
+
+
+def test_failed_sends_are_retried_with_backoff(tmp_path):
+    responses = [Response(503), Response(200)]
+    outbox = Outbox(str(tmp_path / "outbox.db"), {"event": lambda payload, key: responses.pop(0)},
+                    base_backoff=0.1)
+    outbox.enqueue("event", {})
+
+    assert outbox.flush_batch() == 0
+    assert outbox.pending_count() == 1
+    assert outbox.flush_batch() == 0  # not due yet
+    time.sleep(0.15)
+    assert outbox.flush_batch() == 1
+    assert outbox.pending_count() == 0
+
+
+def test_rejected_events_are_dropped(tmp_path):
+    outbox = Outbox(str(tmp_path / "outbox.db"), {"event": lambda payload, key: Response(400)})
+    outbox.enqueue("event", {})
+
+    outbox.flush_batch()
+
+    assert outbox.pending_count() == 0
+
+
+def test_outbox_replays_after_restart(server, start_core, wait_for):
+    core = start_core()
+    core.outbox.stop()  # journal the clear without delivering it
+
+    _, result = call(core.submit_otp, "654321")
+    assert result["status"] == "opened"
+    assert core.outbox.pending_count() == 1
+    core.shutdown()
+    assert not patches(server, "654321")
+
+    restarted = start_core()
+
+    assert wait_for(lambda: patches(server, "654321"))
+    assert wait_for(lambda: restarted.outbox.pending_count() == 0)
+
+
+def test_reissued_code_is_cleared_again(server, start_core, wait_for):
+    core = start_core()
+    _, result = call(core.submit_otp, "123456")
+    assert result["status"] == "opened"
+    assert wait_for(lambda: len(patches(server, "123456")) == 1)
+
+    server.set_otp("123456", "1")
+    assert wait_for(lambda: call(core.submit_otp, "123456")[1]["status"] == "opened")
+
+    assert wait_for(lambda: len(patches(server, "123456")) == 2)
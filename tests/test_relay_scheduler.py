@@ -0,0 +1,99 @@
+"""RelayScheduler: overlapping, extended and cancelled pulses"""
+import threading
+import time
+
+import pytest
+
+from relay_scheduler import RelayScheduler
+
+
+class Relays:
+    """Records relay writes with the time they happened"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.writes = []  # (monotonic time, channel, active)
+
+    def __call__(self, channel, active):
+        with self.lock:
+            self.writes.append((time.monotonic(), channel, active))
+
+    def times(self, channel, active):
+        with self.lock:
+            return [at for at, written, state in self.writes if written == channel and state == active]
+
+
+@pytest.fixture
+def relays():
+    return Relays()
+
+
+@pytest.fixture
+def scheduler(relays):
+    scheduler = RelayScheduler(relays)
+    yield scheduler
+    scheduler.shutdown()
+
+
+def completion():
+    done = threading.Event()
+    return done, lambda channel: done.set()
+
+
+def test_pulses_on_different_channels_overlap(scheduler, relays):
+    first_done, first = completion()
+    second_done, second = completion()
+
+    scheduler.pulse(1, 0.2, on_complete=first)
+    scheduler.pulse(2, 0.2, on_complete=second)
+    assert first_done.wait(2) and second_done.wait(2)
+
+    # Both were on before either went off
+    assert max(relays.times(1, True) + relays.times(2, True)) < min(relays.times(1, False) + relays.times(2, False))
+
+
+def test_pulsing_an_active_channel_extends_it(scheduler, relays):
+    done, on_complete = completion()
+
+    scheduler.pulse(1, 0.1)
+    scheduler.pulse(1, 0.4, on_complete=on_complete)
+    assert done.wait(2)
+
+    assert len(relays.times(1, True)) == 1
+    assert len(relays.times(1, False)) == 1
+    assert relays.times(1, False)[0] - relays.times(1, True)[0] >= 0.35
+
+
+def test_restart_resets_the_deadline(scheduler, relays):
+    done, on_complete = completion()
+
+    scheduler.pulse(1, 1.0)
+    scheduler.pulse(1, 0.1, on_complete=on_complete, restart=True)
+    assert done.wait(2)
+
+    assert relays.times(1, False)[0] - relays.times(1, True)[0] < 0.5
+
+
+def test_cancel_ends_a_pulse_and_runs_its_callbacks(scheduler, relays):
+    done, on_complete = completion()
+
+    scheduler.pulse(1, 30, on_complete=on_complete)
+    assert scheduler.is_active(1)
+    assert scheduler.cancel(1)
+    assert done.wait(2)
+
+    assert not scheduler.is_active(1)
+    assert relays.times(1, False)
+    assert not scheduler.cancel(1)
+
+
+def test_shutdown_forces_active_channels_off(relays):
+    scheduler = RelayScheduler(relays)
+    scheduler.pulse(1, 30)
+    scheduler.pulse(2, 30)
+    time.sleep(0.1)
+
+    scheduler.shutdown()
+
+    assert relays.times(1, False) and relays.times(2, False)
+    assert not scheduler.pulse(3, 1)
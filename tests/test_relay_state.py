@@ -0,0 +1,99 @@
+"""RelayJournal slots across restarts, and reconcile()'s actions"""
+import time
+
+import pytest
+
+from relay_state import RelayJournal, reconcile
+from topology import parse_topology
+
+
+def make_topology(count: int = 2):
+    return parse_topology({"bank": [
+        {"name": "bank", "driver": "sim", "channels": count * 2, "first_locker": 1, "count": count},
+    ]})
+
+
+@pytest.fixture
+def journal_path(tmp_path):
+    return str(tmp_path / "relay_state.bin")
+
+
+def test_unclean_stop_leaves_the_slots_behind(journal_path):
+    topology = make_topology()
+    journal = RelayJournal(journal_path, topology)
+    journal.set_actual(topology.lock_channel("1"), True)
+    journal.set_deadline(topology.uv_channel("2"), time.monotonic() + 60)
+    journal.set_actual(topology.uv_channel("2"), True)
+    journal.map.flush()  # killed here: no close()
+
+    reopened = RelayJournal(journal_path, topology)
+    try:
+        assert not reopened.was_clean
+        slots = {(slot["locker"], slot["kind"]): slot for slot in reopened.previous}
+        assert set(slots) == {("1", "lock"), ("2", "uv")}
+        assert slots["1", "lock"]["actual"] and not slots["1", "lock"]["intended"]
+        assert slots["2", "uv"]["deadline"] == pytest.approx(time.time() + 60, abs=2)
+    finally:
+        reopened.close()
+
+
+def test_clean_close_leaves_nothing_to_reconcile(journal_path):
+    topology = make_topology()
+    journal = RelayJournal(journal_path, topology)
+    journal.set_actual(topology.lock_channel("1"), True)
+    journal.close()
+    journal.close()  # a second shutdown is harmless
+    journal.set_actual(topology.lock_channel("1"), True)  # and so is a late write
+
+    reopened = RelayJournal(journal_path, topology)
+    try:
+        assert reopened.was_clean
+        assert reopened.previous == []
+    finally:
+        reopened.close()
+
+
+def test_journal_for_another_topology_is_ignored(journal_path):
+    journal = RelayJournal(journal_path, make_topology(2))
+    journal.set_actual(make_topology(2).lock_channel("1"), True)
+    journal.map.flush()
+
+    other = RelayJournal(journal_path, make_topology(3))
+    try:
+        assert other.previous == [] and other.was_clean
+    finally:
+        other.close()
+
+
+def slot(kind, intended=False, actual=False, deadline=None, updated=1000.0, locker="1"):
+    return {"locker": locker, "kind": kind, "intended": intended, "actual": actual,
+            "deadline": deadline, "updated": updated}
+
+
+def test_lock_relays_are_never_resumed():
+    [action] = reconcile([slot("lock", intended=True, actual=True, deadline=1005.0)], now=1010.0)
+
+    assert action["action"] == "forced_off"
+    assert "passed 5 s ago" in action["detail"]
+
+
+def test_uv_cycle_with_time_left_is_resumed_up_to_the_limit():
+    uv = slot("uv", intended=True, actual=True, deadline=1300.0)
+
+    assert reconcile([uv], now=1100.0)[0]["remaining"] == pytest.approx(200)
+    [action] = reconcile([uv], now=1100.0, max_uv=60)
+    assert action["action"] == "resumed" and action["remaining"] == 60
+
+
+def test_finished_uv_cycle_is_cancelled():
+    [action] = reconcile([slot("uv", intended=True, actual=True, deadline=1050.0)], now=1100.0)
+
+    assert action["action"] == "cancelled"
+    assert "ended while stopped" in action["detail"]
+
+
+def test_uv_deadline_is_not_trusted_after_the_clock_went_back():
+    [action] = reconcile([slot("uv", intended=True, actual=True, deadline=1300.0, updated=1000.0)], now=500.0)
+
+    assert action["action"] == "cancelled"
+    assert "clock went backwards" in action["detail"]
@@ -0,0 +1,71 @@
+"""ReplicaSync against the stub's delta sync endpoint: full, delta, 304 and 410"""
+import pytest
+
+from api_client import KioskApiClient
+from otp_cache import OtpCache
+from replica import LockerReplica, ReplicaSync
+
+
+@pytest.fixture
+def sync(server, tmp_path):
+    cache = OtpCache(str(tmp_path / "otp_cache.db"))
+    replica = LockerReplica(str(tmp_path / "replica.db"))
+    api = KioskApiClient(server.base_url)
+    # long_poll=0: every pull returns at once
+    yield ReplicaSync(replica, cache, api, "kiosk-1", long_poll=0)
+    api.close()
+    replica.close()
+    cache.close()
+
+
+def test_first_pull_is_a_full_snapshot(sync):
+    assert sync.pull()  # the cursor moved: go on to a delta pull at once
+
+    assert sync.cache.lookup("123456") == "1"
+    assert sync.replica.locker("locker-3")["subscription"]["status"] == "active"
+    assert sync.replica.cursor == "0"
+
+
+def test_delta_pull_applies_changes_and_removals(server, sync):
+    sync.pull()
+    server.remove_otp("123456")
+    server.set_otp("222222", "2")
+    server.set_subscription("locker-3", "expired")
+
+    assert not sync.pull()
+
+    assert sync.cache.lookup("123456") is None
+    assert sync.cache.lookup("222222") == "2"
+    assert sync.cache.lookup("654321") == "2"
+    assert sync.replica.locker("locker-3")["subscription"]["status"] == "expired"
+    assert sync.replica.cursor == "3"
+
+
+def test_unchanged_state_is_a_304(sync):
+    sync.pull()
+    synced_at = sync.replica.synced_at
+
+    assert not sync.pull()
+
+    assert sync.replica.synced_at == synced_at
+    assert sync.replica.cursor == "0"
+
+
+def test_unknown_cursor_starts_over_with_a_full_snapshot(server, sync):
+    sync.pull()
+    sync.pull()  # a 304 for the new cursor, so the 410 below is not a back-to-back restart
+    sync.replica.cursor = "99"  # ahead of the server: answered with 410
+    server.remove_otp("123456")
+
+    assert sync.pull()
+    assert sync.replica.cursor is None
+
+    # Back-to-back restarts wait for the interval instead of looping
+    assert not sync.pull()
+    assert sync.replica.cursor == "1"
+    assert sync.cache.lookup("123456") is None
+    assert sync.cache.lookup("654321") == "2"
+
+    # A round on the new cursor clears the restart
+    assert not sync.pull()
+    assert not sync.restarted
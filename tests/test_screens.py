@@ -0,0 +1,46 @@
+"""ScreenManager: screens are built once and render times are recorded"""
+from screens import SCREEN_RENDER, ScreenManager
+
+
+class Root:
+    def update_idletasks(self):
+        pass
+
+
+class Frame:
+    def __init__(self):
+        self.placed = False
+
+    def place(self, **kwargs):
+        self.placed = True
+
+    def place_forget(self):
+        self.placed = False
+
+
+def test_screens_are_built_once_and_swapped():
+    builds = []
+    resets = []
+    manager = ScreenManager(Root())
+    manager.register("otp", lambda: builds.append("otp") or Frame(), reset=resets.append)
+    manager.register("login", lambda: builds.append("login") or Frame())
+
+    otp = manager.show("otp", "first")
+    login = manager.show("login")
+    assert manager.show("otp", "again") is otp
+
+    assert builds == ["otp", "login"]
+    assert resets == ["first", "again"]
+    assert otp.placed and not login.placed
+
+
+def test_render_times_are_recorded_per_screen():
+    before = SCREEN_RENDER.snapshot().get("lockers", {}).get("count", 0)
+    manager = ScreenManager(Root())
+    manager.register("lockers", Frame)
+
+    manager.show("lockers")
+    manager.show("lockers")
+
+    assert SCREEN_RENDER.snapshot()["lockers"]["count"] == before + 2
+    assert 'kiosk_screen_render_seconds_count{screen="lockers"}' in "\n".join(SCREEN_RENDER.collect())
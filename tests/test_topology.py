@@ -0,0 +1,94 @@
+"""Topology parsing and the bank wire formats"""
+import pytest
+
+from topology import Mcp23017Bank, ShiftRegisterBank, parse_topology
+
+
+class Bus:
+    def __init__(self):
+        self.writes = []
+
+    def write_i2c_block_data(self, address, register, data):
+        self.writes.append((address, register, data))
+
+
+class Spi:
+    def __init__(self):
+        self.frames = []
+
+    def xfer2(self, data):
+        self.frames.append(data)
+
+
+def test_explicit_and_split_layouts():
+    topology = parse_topology({"bank": [
+        {"name": "gpio", "driver": "gpio", "backend": "sim",
+         "lockers": {"1": {"lock": 17, "uv": 5}, "2": {"lock": 27}}},
+        {"name": "east", "driver": "sim", "channels": 8, "wall": "east", "first_locker": 3, "count": 4},
+    ]})
+
+    assert topology.lock_channel("1") == ("gpio", 17)
+    assert topology.uv_channel("1") == ("gpio", 5)
+    assert topology.uv_channel("2") is None
+    assert topology.lock_channel("3") == ("east", 0)
+    assert topology.uv_channel("6") == ("east", 7)
+    assert topology.banks["gpio"].pins == [5, 17, 27]
+    assert topology.walls() == ["east"]
+    assert topology.on_wall("4", "east") and not topology.on_wall("1", "east")
+
+
+def test_split_layout_without_uv():
+    topology = parse_topology({"bank": [
+        {"name": "locks", "driver": "sim", "channels": 4, "first_locker": 1, "count": 4, "uv": False},
+    ]})
+
+    assert topology.lock_channel("4") == ("locks", 3)
+    assert topology.uv_channels() == {}
+
+
+@pytest.mark.parametrize("banks, message", [
+    ([{"name": "a", "driver": "sim", "first_locker": 1, "count": 1},
+      {"name": "a", "driver": "sim", "first_locker": 2, "count": 1}], "Duplicate bank name"),
+    ([{"name": "a", "driver": "sim", "first_locker": 1, "count": 2},
+      {"name": "b", "driver": "sim", "first_locker": 2, "count": 2}], "defined twice"),
+    ([{"name": "a", "driver": "sim", "channels": 8, "first_locker": 1, "count": 5}], "not enough"),
+    ([{"name": "a", "driver": "gpio", "first_locker": 1, "count": 2}], "BCM pins"),
+    ([{"name": "a", "driver": "relaybox", "first_locker": 1, "count": 2}], "Unknown bank driver"),
+])
+def test_invalid_topologies_are_rejected(banks, message):
+    with pytest.raises(ValueError, match=message):
+        parse_topology({"bank": banks})
+
+
+def test_shift_register_frame_is_active_low_last_chip_first():
+    bank = ShiftRegisterBank("chain", chips=2)
+    bank.stage(0, True)   # QA of the first chip
+    bank.stage(9, True)   # QB of the second chip
+
+    assert bank.frame() == [0xFD, 0xFE]
+
+
+def test_shift_register_flush_sends_one_frame_per_batch():
+    bank = ShiftRegisterBank("chain", chips=1)
+    bank.spi = Spi()
+    bank.stage(1, True)
+    bank.stage(2, True)
+    bank.flush()
+    bank.flush()  # nothing staged since
+
+    assert bank.spi.frames == [[0xF9]]
+
+
+def test_mcp23017_writes_both_ports_in_one_block():
+    bank = Mcp23017Bank("expander", address=0x21)
+    bank.bus = Bus()
+    bank.stage(0, True)    # GPA0
+    bank.stage(15, True)   # GPB7
+    bank.flush()
+
+    assert bank.bus.writes == [(0x21, Mcp23017Bank.OLATA, [0xFE, 0x7F])]
+
+
+def test_staging_an_unknown_channel_fails():
+    with pytest.raises(ValueError):
+        Mcp23017Bank("expander").stage(16, True)
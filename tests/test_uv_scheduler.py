@@ -0,0 +1,101 @@
+"""UVScheduler: concurrency limit, queueing and re-opens"""
+import threading
+
+import pytest
+
+from uv_scheduler import UVScheduler
+
+CHANNELS = {str(number): 100 + number for number in range(1, 6)}
+
+
+class Lamps:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.on = set()
+        self.most_on = 0
+
+    def __call__(self, channel, active):
+        with self.lock:
+            if active:
+                self.on.add(channel)
+            else:
+                self.on.discard(channel)
+            self.most_on = max(self.most_on, len(self.on))
+
+
+@pytest.fixture
+def lamps():
+    return Lamps()
+
+
+@pytest.fixture
+def make_scheduler(lamps):
+    schedulers = []
+
+    def make(**kwargs):
+        scheduler = UVScheduler(lamps, CHANNELS, 0.2, **kwargs)
+        schedulers.append(scheduler)
+        return scheduler
+
+    yield make
+    for scheduler in schedulers:
+        scheduler.shutdown()
+
+
+def idle(scheduler):
+    return not scheduler.state()
+
+
+def test_lamps_over_the_limit_queue_in_order(make_scheduler, lamps, wait_for):
+    scheduler = make_scheduler(max_concurrent=2)
+
+    assert [scheduler.start(number) for number in ("1", "2", "3", "4")] == ["started", "started", "queued", "queued"]
+    state = scheduler.state()
+    assert state["1"]["state"] == "on"
+    assert state["3"] == {"state": "queued", "position": 1}
+    assert state["4"] == {"state": "queued", "position": 2}
+
+    assert wait_for(lambda: idle(scheduler), timeout=5)
+    assert lamps.most_on == 2
+    assert not lamps.on
+
+
+def test_queued_locker_is_not_queued_twice(make_scheduler):
+    scheduler = make_scheduler(max_concurrent=1)
+    scheduler.start("1")
+    scheduler.start("2")
+
+    assert scheduler.start("2") == "queued"
+    assert list(scheduler.waiting) == ["2"]
+
+
+def test_reopen_restarts_the_cycle(make_scheduler, wait_for):
+    scheduler = make_scheduler()
+    scheduler.start("1", duration=5)
+
+    assert scheduler.start("1", duration=0.1) == "restarted"
+    assert scheduler.state()["1"]["remaining"] <= 0.1
+    assert wait_for(lambda: idle(scheduler), timeout=2)
+
+
+def test_reopen_extends_the_cycle(make_scheduler):
+    scheduler = make_scheduler(reopen_mode="extend")
+    scheduler.start("1", duration=5)
+
+    assert scheduler.start("1", duration=5) == "extended"
+    assert scheduler.state()["1"]["remaining"] > 9
+
+
+def test_cancel_frees_the_slot_for_a_queued_cycle(make_scheduler, wait_for):
+    scheduler = make_scheduler(max_concurrent=1)
+    scheduler.start("1", duration=30)
+    scheduler.start("2", duration=30)
+
+    assert scheduler.cancel("1")
+
+    assert wait_for(lambda: scheduler.state().get("2", {}).get("state") == "on", timeout=2)
+    assert scheduler.cancel("2")
+
+
+def test_unknown_locker_has_no_lamp(make_scheduler):
+    assert make_scheduler().start("99") is None
@@ -0,0 +1,109 @@
+"""Warmup: server errors, backoff, and the shared TLS context adapter"""
+import shutil
+import ssl
+import time
+from types import SimpleNamespace
+
+import certifi
+import pytest
+import requests
+
+from api_client import PreloadedTlsAdapter
+from warmup import Warmup
+
+
+class Backend:
+    """Stands in for KioskApiClient: answers HEAD /test with a fixed status"""
+
+    def __init__(self, status: int):
+        self.status = status
+        self.base_url = "http://backend.test/api"
+        self.verify = True
+        self.last_success = None
+        self.heads = 0
+
+    def head_check(self):
+        self.heads += 1
+        return SimpleNamespace(status_code=self.status)
+
+
+def test_warm_up_counts_the_connection_saving():
+    warmup = Warmup(Backend(200))
+
+    assert warmup.warm_up()
+    assert set(warmup.saved) == {"connection"}
+
+
+@pytest.mark.parametrize("status", [405, 501])
+def test_backend_without_head_support_is_warm(status):
+    assert Warmup(Backend(status)).warm_up()
+
+
+def test_server_error_is_a_failed_warm_up():
+    backend = Backend(503)
+    warmup = Warmup(backend)
+
+    assert not warmup.warm_up()
+    assert backend.heads == 1  # no warm request after a failed cold one
+    assert warmup.saved == {}
+    assert not warmup.ping()
+
+
+def test_failures_back_off():
+    warmup = Warmup(Backend(503), retry_interval=30, max_retry_interval=100)
+
+    delays = []
+    for _ in range(4):
+        warmup.attempt(warmup.warm_up())
+        delays.append(round(warmup.retry_at - time.monotonic()))
+    assert delays == [30, 60, 100, 100]
+
+    warmup.api.status = 200
+    assert warmup.attempt(warmup.warm_up())
+    assert warmup.failures == 0 and warmup.retry_at == 0.0
+
+
+def test_unreachable_backend_is_not_hammered():
+    backend = Backend(503)
+    warmup = Warmup(backend, retry_interval=30).start()
+    try:
+        time.sleep(1.5)
+    finally:
+        warmup.stop()
+
+    assert not warmup.warmed
+    assert backend.heads == 1
+
+
+def pool_kwargs(adapter, verify):
+    request = requests.Request("GET", "https://backend.test/api/test").prepare()
+    return adapter.build_connection_pool_key_attributes(request, verify)[1]
+
+
+def test_tls_adapter_only_uses_the_context_for_its_bundle(tmp_path):
+    context = ssl.create_default_context(cafile=certifi.where())
+    adapter = PreloadedTlsAdapter(context, certifi.where())
+    other_bundle = tmp_path / "other.pem"
+    shutil.copy(certifi.where(), other_bundle)
+
+    shared = pool_kwargs(adapter, certifi.where())
+    assert shared["ssl_context"] is context and "ca_certs" not in shared
+
+    other = pool_kwargs(adapter, str(other_bundle))
+    assert "ssl_context" not in other and other["ca_certs"] == str(other_bundle)
+
+
+def test_tls_adapter_keeps_ca_certs_on_pools_without_the_context():
+    context = ssl.create_default_context(cafile=certifi.where())
+    adapter = PreloadedTlsAdapter(context, certifi.where())
+    url = "https://backend.test/api/test"
+
+    with_context = adapter.poolmanager.connection_from_host(
+        "backend.test", 443, "https", pool_kwargs(adapter, certifi.where())
+    )
+    adapter.cert_verify(with_context, url, certifi.where(), None)
+    assert with_context.ca_certs is None
+
+    without_context = adapter.poolmanager.connection_from_host("other.test", 443, "https")
+    adapter.cert_verify(without_context, url, certifi.where(), None)
+    assert without_context.ca_certs == certifi.where()
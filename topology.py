@@ -0,0 +1,352 @@
+"""Locker wall topology: which relay bank and channel drives each locker
+
+A wall is made of banks. Each bank is one piece of relay hardware, written
+as a unit: the Pi's own GPIO header, an MCP23017 I2C expander, a chain of
+74HC595 shift registers, or a simulator. Relay writes are staged per bank
+and flushed once per scheduler tick, so an expander bank costs one bus
+transaction per tick no matter how many of its relays changed.
+
+Channels are addressed as (bank name, channel index) tuples. See
+topology.toml for the file format.
+
+A site with several walls can run them all from one kiosk core; each bank
+may name the wall its lockers belong to, so a front-end attached to one
+wall only opens that wall's lockers.
+"""
+import os
+import threading
+from collections import deque
+
+try:
+    import tomllib
+except ImportError:  # Python < 3.11
+    import tomli as tomllib
+
+from hardware import create_driver
+
+
+class RelayBank:
+    """A group of relay outputs that is written in one transaction"""
+
+    kind = "base"
+
+    def __init__(self, name: str, channels: int):
+        self.name = name
+        self.channels = channels
+        self.lock = threading.Lock()
+        self.state = [False] * channels   # desired (staged) state, True = relay active
+        self.dirty = False
+
+    def setup(self):
+        raise NotImplementedError
+
+    def stage(self, channel: int, active: bool):
+        if not 0 <= channel < self.channels:
+            raise ValueError(f"Bank {self.name} has no channel {channel}")
+        with self.lock:
+            if self.state[channel] != active:
+                self.state[channel] = active
+                self.dirty = True
+                self.mark(channel)
+
+    def mark(self, channel: int):
+        """Hook for banks that track individual changed channels"""
+
+    def flush(self):
+        with self.lock:
+            if not self.dirty:
+                return
+            self.transmit()
+            self.dirty = False
+
+    def transmit(self):
+        """Write the staged state to hardware; called with the lock held"""
+        raise NotImplementedError
+
+    def all_off(self):
+        with self.lock:
+            self.state = [False] * self.channels
+            self.dirty = True
+            for channel in range(self.channels):
+                self.mark(channel)
+        self.flush()
+
+    def cleanup(self):
+        pass
+
+
+class GpioBank(RelayBank):
+    """Relays wired straight to Pi GPIO pins, through a hardware.RelayDriver
+
+    Channel numbers are BCM pin numbers. GPIO pins have no bulk write, so a
+    flush writes only the pins that changed since the last one.
+    """
+
+    kind = "gpio"
+
+    def __init__(self, name: str, pins, backend: str = None):
+        super().__init__(name, max(pins) + 1)
+        self.pins = sorted(set(pins))
+        self.backend = backend
+        self.changed = set()
+        self.driver = None
+
+    def setup(self):
+        driver = create_driver(self.backend or os.environ.get("SMARTPALMS_GPIO_BACKEND", "rpi"))
+        driver.setup(self.pins)
+        self.driver = driver
+
+    def mark(self, channel: int):
+        self.changed.add(channel)
+
+    def transmit(self):
+        for pin in sorted(self.changed):
+            if pin in self.pins:
+                self.driver.write(pin, self.state[pin])
+        self.changed.clear()
+
+    def cleanup(self):
+        if self.driver:
+            self.driver.cleanup()
+
+
+class Mcp23017Bank(RelayBank):
+    """16 relays on an MCP23017 I2C expander (active LOW outputs)
+
+    Channels 0-7 are GPA0-7 and 8-15 are GPB0-7. Both output latches are
+    written with a single 2-byte I2C block write.
+    """
+
+    kind = "mcp23017"
+
+    IODIRA = 0x00
+    OLATA = 0x14
+
+    def __init__(self, name: str, bus: int = 1, address: int = 0x20):
+        super().__init__(name, 16)
+        self.bus_number = bus
+        self.address = address
+        self.bus = None
+
+    def setup(self):
+        from smbus2 import SMBus
+        self.bus = SMBus(self.bus_number)
+        # Latch everything HIGH (inactive) before switching the pins to outputs
+        self.bus.write_i2c_block_data(self.address, self.OLATA, [0xFF, 0xFF])
+        self.bus.write_i2c_block_data(self.address, self.IODIRA, [0x00, 0x00])
+
+    def transmit(self):
+        # Active LOW: a set bit in the latch keeps the relay off
+        word = 0xFFFF
+        for channel, active in enumerate(self.state):
+            if active:
+                word &= ~(1 << channel)
+        self.bus.write_i2c_block_data(self.address, self.OLATA, [word & 0xFF, word >> 8])
+
+    def cleanup(self):
+        if self.bus:
+            self.bus.close()
+
+
+class ShiftRegisterBank(RelayBank):
+    """Daisy-chained 74HC595 shift registers on SPI (active LOW outputs)
+
+    The chip-select line drives the registers' latch clock, so one SPI
+    transfer updates the whole chain. Channel 0 is QA of the first chip.
+    """
+
+    kind = "shift_register"
+
+    def __init__(self, name: str, chips: int, spi_bus: int = 0, spi_device: int = 0,
+                 speed_hz: int = 1000000):
+        super().__init__(name, chips * 8)
+        self.chips = chips
+        self.spi_bus = spi_bus
+        self.spi_device = spi_device
+        self.speed_hz = speed_hz
+        self.spi = None
+
+    def setup(self):
+        import spidev
+        self.spi = spidev.SpiDev()
+        self.spi.open(self.spi_bus, self.spi_device)
+        self.spi.max_speed_hz = self.speed_hz
+        self.spi.xfer2([0xFF] * self.chips)
+
+    def frame(self):
+        data = []
+        for chip in range(self.chips):
+            byte = 0xFF
+            for bit in range(8):
+                if self.state[chip * 8 + bit]:
+                    byte &= ~(1 << bit)
+            data.append(byte)
+        # The first byte shifted out ends up in the last chip of the chain
+        return list(reversed(data))
+
+    def transmit(self):
+        self.spi.xfer2(self.frame())
+
+    def cleanup(self):
+        if self.spi:
+            self.spi.close()
+
+
+class SimulatedBank(RelayBank):
+    """In-memory bank that records its last ``history`` transactions"""
+
+    kind = "sim"
+
+    def __init__(self, name: str, channels: int = 16, history: int = 1_000):
+        super().__init__(name, channels)
+        self.transactions = deque(maxlen=history)   # state tuples, one per flush
+
+    def setup(self):
+        self.transactions.append(tuple(self.state))
+
+    def transmit(self):
+        self.transactions.append(tuple(self.state))
+
+
+class LockerTopology:
+    """Maps locker numbers to lock and UV relay channels across banks"""
+
+    def __init__(self, banks: dict, lockers: dict):
+        self.banks = banks
+        # locker number -> {"lock": (bank, channel), "uv": (bank, channel) or None, "wall": name or None}
+        self.lockers = lockers
+
+    def __contains__(self, locker_number):
+        return locker_number in self.lockers
+
+    def on_wall(self, locker_number: str, wall: str = None):
+        """True if the locker exists and, when a wall is given, belongs to it"""
+        address = self.lockers.get(locker_number)
+        if address is None:
+            return False
+        return wall is None or address.get("wall") == wall
+
+    def walls(self):
+        return sorted({address["wall"] for address in self.lockers.values() if address.get("wall")})
+
+    def lock_channel(self, locker_number: str):
+        return self.lockers[locker_number]["lock"]
+
+    def uv_channel(self, locker_number: str):
+        return self.lockers[locker_number]["uv"]
+
+    def lock_channels(self):
+        return {number: address["lock"] for number, address in self.lockers.items()}
+
+    def uv_channels(self):
+        return {number: address["uv"] for number, address in self.lockers.items() if address["uv"]}
+
+    def relay_states(self):
+        """Staged state of every locker's relays: {"3": {"lock": False, "uv": True}}"""
+        def read(channel):
+            if channel is None:
+                return None
+            bank_name, index = channel
+            return self.banks[bank_name].state[index]
+
+        return {number: {"lock": read(address["lock"]), "uv": read(address["uv"])}
+                for number, address in self.lockers.items()}
+
+    def setup(self):
+        for bank in self.banks.values():
+            bank.setup()
+
+    def write(self, channel, active: bool):
+        """Stage a relay change; it reaches hardware on the next flush()"""
+        bank_name, index = channel
+        self.banks[bank_name].stage(index, active)
+
+    def flush(self):
+        # One failing bus must not hold back the other banks; a failed bank
+        # stays dirty and is retried on the next flush
+        for bank in self.banks.values():
+            try:
+                bank.flush()
+            except Exception as e:
+                print(f"Relay bank {bank.name} write error: {str(e)}")
+
+    def all_off(self):
+        for bank in self.banks.values():
+            try:
+                bank.all_off()
+            except Exception as e:
+                print(f"Failed to reset bank {bank.name}: {str(e)}")
+
+    def cleanup(self):
+        for bank in self.banks.values():
+            bank.cleanup()
+
+
+def build_bank(config: dict):
+    kind = config.get("driver", "gpio")
+    name = config["name"]
+    if kind == "gpio":
+        if "lockers" not in config:
+            # The split layout would map lockers to pins 0, 1, 2...
+            raise ValueError(f"GPIO bank {name} needs a [bank.lockers] table of BCM pins; "
+                             "first_locker/count is only for expander and simulated banks")
+        pins = [address[key] for address in config["lockers"].values() for key in ("lock", "uv") if key in address]
+        return GpioBank(name, pins, backend=config.get("backend"))
+    if kind == "mcp23017":
+        return Mcp23017Bank(name, bus=config.get("bus", 1), address=config.get("address", 0x20))
+    if kind == "shift_register":
+        return ShiftRegisterBank(name, chips=config["chips"], spi_bus=config.get("spi_bus", 0),
+                                 spi_device=config.get("spi_device", 0))
+    if kind == "sim":
+        return SimulatedBank(name, channels=config.get("channels", 16))
+    raise ValueError(f"Unknown bank driver '{kind}' in bank {name}")
+
+
+def bank_lockers(config: dict, bank: RelayBank):
+    """Locker addresses for one bank, from an explicit table or the split layout
+
+    The split layout gives ``count`` lockers starting at ``first_locker``
+    the first ``count`` channels for locks and the next ``count`` for UV.
+    """
+    if "lockers" in config:
+        return {
+            str(number): {
+                "lock": (bank.name, address["lock"]),
+                "uv": (bank.name, address["uv"]) if "uv" in address else None,
+            }
+            for number, address in config["lockers"].items()
+        }
+
+    first, count = config["first_locker"], config["count"]
+    uv = config.get("uv", True)
+    if count * (2 if uv else 1) > bank.channels:
+        raise ValueError(f"Bank {bank.name} has {bank.channels} channels, not enough for {count} lockers")
+    return {
+        str(first + i): {
+            "lock": (bank.name, i),
+            "uv": (bank.name, count + i) if uv else None,
+        }
+        for i in range(count)
+    }
+
+
+def parse_topology(data: dict):
+    banks = {}
+    lockers = {}
+    for config in data.get("bank", []):
+        bank = build_bank(config)
+        if bank.name in banks:
+            raise ValueError(f"Duplicate bank name: {bank.name}")
+        banks[bank.name] = bank
+        for number, address in bank_lockers(config, bank).items():
+            if number in lockers:
+                raise ValueError(f"Locker {number} is defined twice")
+            address["wall"] = config.get("wall")
+            lockers[number] = address
+    return LockerTopology(banks, lockers)
+
+
+def load_topology(path: str):
+    with open(path, "rb") as f:
+        return parse_topology(tomllib.load(f))
+
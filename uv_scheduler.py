@@ -0,0 +1,139 @@
+import threading
+from collections import OrderedDict
+
+from relay_scheduler import RelayScheduler
+
+
+class UVScheduler:
+    """Runs UV sterilization cycles on one deadline-driven worker
+
+    Cycles are relay pulses on a dedicated RelayScheduler, so there is one
+    thread for all lamps instead of one sleeping thread per locker. At most
+    ``max_concurrent`` lamps are on at once (0 means no limit); further
+    requests wait in FIFO order and start as running cycles finish. Re-opening
+    a locker while its lamp is on either restarts the cycle or extends it by
+    another ``duration``, depending on ``reopen_mode``.
+    """
+
+    def __init__(self, set_output, channels: dict, duration: float, max_concurrent: int = 0,
+                 reopen_mode: str = "restart", on_change=None, flush=None, on_deadline=None):
+        if reopen_mode not in ("restart", "extend"):
+            raise ValueError(f"Unknown UV reopen mode: {reopen_mode}")
+        self.channels = channels  # locker number -> relay channel of its lamp
+        self.duration = duration
+        self.max_concurrent = max_concurrent
+        self.reopen_mode = reopen_mode
+        self.on_change = on_change
+
+        # Completion callbacks run directly on the relay worker thread
+        self.relays = RelayScheduler(set_output, flush=flush, on_deadline=on_deadline)
+        self.lock = threading.Lock()
+        self.running = {}            # locker -> generation of its current cycle
+        self.waiting = OrderedDict()  # locker -> requested duration
+        self.generations = {}
+
+    def start(self, locker_number: str, duration: float = None):
+        """Request a UV cycle; returns "started", "restarted", "extended", "queued" or None"""
+        if locker_number not in self.channels:
+            return None
+        duration = duration or self.duration
+        channel = self.channels[locker_number]
+
+        with self.lock:
+            if locker_number in self.running:
+                if self.reopen_mode == "extend":
+                    remaining = self.relays.active_channels().get(channel, 0.0)
+                    self.begin(locker_number, remaining + duration, restart=True)
+                    result = "extended"
+                else:
+                    self.begin(locker_number, duration, restart=True)
+                    result = "restarted"
+            elif locker_number in self.waiting:
+                self.waiting[locker_number] = max(self.waiting[locker_number], duration)
+                result = "queued"
+            elif self.max_concurrent and len(self.running) >= self.max_concurrent:
+                self.waiting[locker_number] = duration
+                result = "queued"
+            else:
+                self.begin(locker_number, duration)
+                result = "started"
+
+        print(f"UV light {locker_number}: {result}")
+        self.notify()
+        return result
+
+    def begin(self, locker_number: str, duration: float, restart: bool = False):
+        """Start or re-time a cycle; must be called with the lock held"""
+        generation = self.generations.get(locker_number, 0) + 1
+        self.generations[locker_number] = generation
+        self.running[locker_number] = generation
+        self.relays.pulse(
+            self.channels[locker_number],
+            duration,
+            on_complete=lambda _channel: self.finished(locker_number, generation),
+            restart=restart
+        )
+
+    def finished(self, locker_number: str, generation: int):
+        with self.lock:
+            # Callbacks from superseded cycles (restart/extend) are ignored
+            if self.running.get(locker_number) != generation:
+                return
+            del self.running[locker_number]
+            print(f"UV light {locker_number} OFF")
+            self.start_waiting()
+        self.notify()
+
+    def start_waiting(self):
+        """Promote queued cycles into free slots; must be called with the lock held"""
+        while self.waiting and (not self.max_concurrent or len(self.running) < self.max_concurrent):
+            locker_number, duration = self.waiting.popitem(last=False)
+            self.begin(locker_number, duration)
+            print(f"UV light {locker_number}: started from queue")
+
+    def cancel(self, locker_number: str):
+        """Stop a running cycle or drop a queued one"""
+        with self.lock:
+            if self.waiting.pop(locker_number, None) is not None:
+                cancelled = True
+            elif locker_number in self.running:
+                # finished() frees the slot once the relay is off
+                cancelled = self.relays.cancel(self.channels[locker_number])
+            else:
+                cancelled = False
+        if cancelled:
+            self.notify()
+        return cancelled
+
+    def cancel_all(self):
+        with self.lock:
+            self.waiting.clear()
+            lockers = list(self.running)
+        for locker_number in lockers:
+            self.relays.cancel(self.channels[locker_number])
+
+    def state(self):
+        """Lamp state per locker: {"3": {"state": "on", "remaining": 12.5}, "5": {"state": "queued"}}"""
+        active = self.relays.active_channels()
+        with self.lock:
+            lamps = {
+                locker_number: {"state": "on", "remaining": round(active.get(self.channels[locker_number], 0.0), 1)}
+                for locker_number in self.running
+            }
+            for position, locker_number in enumerate(self.waiting):
+                lamps[locker_number] = {"state": "queued", "position": position + 1}
+        return lamps
+
+    def notify(self):
+        if self.on_change:
+            try:
+                self.on_change(self.state())
+            except Exception as e:
+                print(f"UV state callback error: {str(e)}")
+
+    def shutdown(self):
+        """Turn every lamp off and stop the worker"""
+        with self.lock:
+            self.waiting.clear()
+            self.running.clear()
+        self.relays.shutdown()
@@ -0,0 +1,292 @@
+"""Background warm-up of DNS, TLS and the backend before the first customer
+
+Without warm-up, the first OTP submit after boot pays for four things on
+the customer's time:
+- resolving the backend's hostname
+- reading the CA bundle
+- the TCP and TLS handshakes
+- waking the serverless backend from a cold start
+
+Warmup does all of these on its own thread once the services are up,
+one request at a time so it never takes the client's workers from
+customer lookups:
+- the hostname is resolved into a DnsCache that honours record TTLs and
+  is refreshed in the background before entries expire
+- the CA bundle is loaded once into a shared SSLContext
+- a pooled keep-alive connection is opened with HEAD /test
+- while no request has reached the backend for ``keep_warm_interval``
+  seconds, it is pinged again, which keeps the serverless function from
+  idling out and the pooled connections open
+- failed attempts are retried after ``retry_interval`` seconds, doubling
+  up to ``max_retry_interval`` while the backend stays unreachable
+
+The time each step took is the latency it saves the first request. It is
+counted in kiosk_warmup_saved_seconds_total and written as a "warmup"
+trace to metrics.jsonl.
+"""
+import socket
+import threading
+import time
+from urllib.parse import urlsplit
+
+from metrics import REGISTRY
+
+WARMUP_SAVED = REGISTRY.counter(
+    "kiosk_warmup_saved_seconds_total", "First-request latency taken off the customer path by warm-up", ("step",)
+)
+KEEP_WARM_PINGS = REGISTRY.counter(
+    "kiosk_keep_warm_pings_total", "Backend keep-warm pings by result", ("result",)
+)
+DNS_LOOKUPS = REGISTRY.counter(
+    "kiosk_dns_cache_lookups_total", "Lookups of cached hostnames by result", ("result",)
+)
+
+
+def lookup_ttl(host: str):
+    """TTL of the host's A record, or None if it can't be read
+
+    The system resolver doesn't expose TTLs; they are read with dnspython
+    when it is installed.
+    """
+    try:
+        import dns.resolver
+    except ImportError:
+        return None
+    try:
+        return dns.resolver.resolve(host, "A").rrset.ttl
+    except Exception:
+        return None
+
+
+def load_tls_context(cafile: str):
+    """SSLContext for urllib3 with the CA bundle loaded once"""
+    from urllib3.util.ssl_ import create_urllib3_context
+
+    context = create_urllib3_context()
+    context.load_verify_locations(cafile)
+    return context
+
+
+class DnsCache:
+    """getaddrinfo results for the backend's hostname, kept for their TTL
+
+    Once installed it answers socket.getaddrinfo for the hosts added to it,
+    so both requests and plain sockets use it. Other hosts go to the system
+    resolver as before. If a refresh fails (DNS down while the link is
+    up), the last answer keeps being served for up to ``max_stale`` seconds.
+    """
+
+    def __init__(self, default_ttl: float = 60, min_ttl: float = 10, max_stale: float = 3600):
+        self.default_ttl = default_ttl
+        self.min_ttl = min_ttl
+        self.max_stale = max_stale
+        self.system_getaddrinfo = socket.getaddrinfo
+        self.lock = threading.Lock()
+        self.hosts = set()
+        self.entries = {}  # getaddrinfo args -> {"results", "expires", "resolved_at"} (monotonic)
+
+    def add(self, host: str):
+        with self.lock:
+            self.hosts.add(host)
+
+    def install(self):
+        socket.getaddrinfo = self.getaddrinfo
+        return self
+
+    def uninstall(self):
+        if socket.getaddrinfo == self.getaddrinfo:
+            socket.getaddrinfo = self.system_getaddrinfo
+
+    def getaddrinfo(self, host, port, family=0, type=0, proto=0, flags=0):
+        if host not in self.hosts:
+            return self.system_getaddrinfo(host, port, family, type, proto, flags)
+        key = (host, port, family, type, proto, flags)
+        with self.lock:
+            entry = self.entries.get(key)
+        now = time.monotonic()
+        if entry and now < entry["expires"]:
+            DNS_LOOKUPS.inc(result="hit")
+            return list(entry["results"])
+        try:
+            DNS_LOOKUPS.inc(result="miss")
+            return self.resolve(key)
+        except OSError:
+            if entry and now < entry["resolved_at"] + self.max_stale:
+                DNS_LOOKUPS.inc(result="stale")
+                return list(entry["results"])
+            raise
+
+    def resolve(self, key):
+        results = self.system_getaddrinfo(*key)
+        ttl = max(self.min_ttl, lookup_ttl(key[0]) or self.default_ttl)
+        now = time.monotonic()
+        with self.lock:
+            self.entries[key] = {"results": results, "expires": now + ttl, "resolved_at": now}
+        return list(results)
+
+    def refresh_due(self, ahead: float = 5):
+        """Re-resolve entries expiring within ``ahead`` seconds; returns the next expiry"""
+        with self.lock:
+            entries = list(self.entries.items())
+        for key, entry in entries:
+            now = time.monotonic()
+            if entry["expires"] - ahead <= now:
+                try:
+                    self.resolve(key)
+                except OSError as e:
+                    print(f"DNS refresh error for {key[0]}: {str(e)}")
+                    with self.lock:
+                        if now < entry["resolved_at"] + self.max_stale:
+                            entry["expires"] = now + self.min_ttl  # serve the last answer, retry later
+                        else:
+                            self.entries.pop(key, None)
+        with self.lock:
+            return min((entry["expires"] for entry in self.entries.values()), default=None)
+
+
+class Warmup:
+    """Warms DNS, TLS and backend connections, then keeps them warm"""
+
+    def __init__(self, api, dns: DnsCache = None, keep_warm_interval: float = 240,
+                 retry_interval: float = 30, max_retry_interval: float = 1800):
+        self.api = api
+        self.dns = dns
+        self.keep_warm_interval = keep_warm_interval
+        self.retry_interval = retry_interval
+        self.max_retry_interval = max_retry_interval
+        self.failures = 0       # consecutive failed warm-ups or pings
+        self.retry_at = 0.0     # monotonic; no attempt before this
+        self.parts = urlsplit(api.base_url)
+        self.warmed = False
+        self.saved = {}  # step -> seconds
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self.run, name="warmup", daemon=True)
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.stopped.set()
+        if self.dns:
+            self.dns.uninstall()
+
+    def run(self):
+        self.warm_tls()
+        next_dns_refresh = None
+        while not self.stopped.is_set():
+            if time.monotonic() >= self.retry_at:
+                if not self.warmed:
+                    self.warmed = self.attempt(self.warm_up())
+                elif self.keep_warm_interval and self.backend_idle_for() >= self.keep_warm_interval:
+                    self.attempt(self.ping())
+            if self.dns:
+                next_dns_refresh = self.dns.refresh_due()
+            self.stopped.wait(self.next_wake(next_dns_refresh))
+
+    def attempt(self, ok: bool):
+        """Back off exponentially after a failure; returns ok"""
+        if ok:
+            self.failures = 0
+            self.retry_at = 0.0
+        else:
+            self.failures += 1
+            backoff = min(self.max_retry_interval, self.retry_interval * 2 ** (self.failures - 1))
+            self.retry_at = time.monotonic() + backoff
+        return ok
+
+    def next_wake(self, next_dns_refresh):
+        now = time.monotonic()
+        if not self.warmed:
+            wait = self.retry_at - now
+        elif self.keep_warm_interval:
+            # A real request answered meanwhile resets the idle time
+            wait = max(self.keep_warm_interval - self.backend_idle_for(), self.retry_at - now)
+        else:
+            wait = 3600
+        if next_dns_refresh is not None:
+            wait = min(wait, next_dns_refresh - 5 - now)
+        return max(1.0, wait)
+
+    def backend_idle_for(self):
+        last_success = self.api.last_success
+        return float("inf") if last_success is None else time.monotonic() - last_success
+
+    def warm_tls(self):
+        if self.parts.scheme != "https" or not isinstance(self.api.verify, str):
+            return
+        start = time.perf_counter()
+        try:
+            self.api.use_tls_context(load_tls_context(self.api.verify))
+        except Exception as e:
+            print(f"Warm-up TLS context error: {str(e)}")
+            REGISTRY.error("warmup", e)
+            return
+        self.record("tls_context", time.perf_counter() - start)
+
+    def warm_up(self):
+        """Resolve, connect and wake the backend once; False if it can't be reached yet"""
+        trace = REGISTRY.trace("warmup")
+        try:
+            if self.dns:
+                from urllib3.util.connection import allowed_gai_family
+
+                port = self.parts.port or (443 if self.parts.scheme == "https" else 80)
+                self.dns.add(self.parts.hostname)
+                self.dns.install()
+                start = time.perf_counter()
+                with trace.span("dns"):
+                    socket.getaddrinfo(self.parts.hostname, port, allowed_gai_family(), socket.SOCK_STREAM)
+                self.record("dns", time.perf_counter() - start)
+
+            # The first request opens the connection (TCP, TLS, serverless
+            # cold start); the second shows what a warm request costs
+            with trace.span("connect"):
+                cold = self.timed_head()
+            with trace.span("warm_request"):
+                warm = self.timed_head() if cold is not None else None
+        except Exception as e:
+            print(f"Warm-up error: {str(e)}")
+            REGISTRY.error("warmup", e)
+            trace.finish("error", error=type(e).__name__)
+            return False
+        if warm is None:
+            # A 5xx warms nothing worth counting, and isn't a live backend
+            print("Warm-up error: backend answered with a server error")
+            REGISTRY.error("warmup", "ServerError")
+            trace.finish("error", error="ServerError")
+            return False
+
+        self.record("connection", max(0.0, cold - warm))
+        saved_ms = round(sum(self.saved.values()) * 1000, 1)
+        trace.finish("ok", saved_ms=saved_ms)
+        steps = ", ".join(f"{step} {seconds * 1000:.0f}ms" for step, seconds in self.saved.items())
+        print(f"Warm-up saved ~{saved_ms:.0f}ms on the first request ({steps})")
+        return True
+
+    def timed_head(self):
+        """HEAD /test on this thread; returns the round trip, or None on a 5xx
+
+        405 and 501 are fine: a backend without HEAD support still answered.
+        """
+        start = time.perf_counter()
+        status = self.api.head_check().status_code
+        elapsed = time.perf_counter() - start
+        return None if status >= 500 and status != 501 else elapsed
+
+    def ping(self):
+        """Keep-warm ping; False if the backend didn't answer or answered with a 5xx"""
+        try:
+            ok = self.timed_head() is not None
+        except Exception as e:
+            KEEP_WARM_PINGS.inc(result="failed")
+            print(f"Keep-warm ping error: {str(e)}")
+            return False
+        KEEP_WARM_PINGS.inc(result="ok" if ok else "failed")
+        if not ok:
+            print("Keep-warm ping error: backend answered with a server error")
+        return ok
+
+    def record(self, step: str, seconds: float):
+        self.saved[step] = seconds
+        WARMUP_SAVED.inc(seconds, step=step)
@@ -0,0 +1,176 @@
+"""Tk event-loop watchdog
+
+A heartbeat scheduled with root.after records when the mainloop last got
+round to it; a side thread compares that against the clock. When the loop
+falls more than ``threshold`` behind, the watchdog grabs the main thread's
+stack with sys._current_frames and keeps sampling it until the loop
+recovers, then files a stall report: how long it lasted, which handler
+was running and where it spent its time.
+
+Reports are kept in a ring buffer and mirrored to a JSON-lines file so
+they can be pulled from a device:
+
+    python3 watchdog.py stalls.jsonl
+"""
+import json
+import os
+import sys
+import threading
+import time
+import traceback
+from collections import Counter, deque
+
+from metrics import REGISTRY
+
+UI_STALLS = REGISTRY.counter("kiosk_ui_stalls_total", "Tk event-loop stalls over the watchdog threshold", ("handler",))
+UI_STALL_SECONDS = REGISTRY.histogram("kiosk_ui_stall_seconds", "Duration of Tk event-loop stalls")
+
+# Frames that only forward to the real handler
+PASSTHROUGH = {"<lambda>", "process_ui_queue", "call_on_ui", "traced"}
+
+
+def describe_frame(frame):
+    return f"{os.path.basename(frame.filename)}:{frame.lineno} {frame.name}"
+
+
+def find_handler(stack):
+    """The application function Tk called into, and the deepest app frame
+
+    Tk invokes callbacks through tkinter's CallWrapper, so the first frame
+    after the last tkinter frame is the handler; lambdas and the UI queue
+    pump are skipped so queued callbacks are attributed to their target.
+    """
+    tk_index = None
+    for index, frame in enumerate(stack):
+        if os.path.join("tkinter", "__init__.py") in frame.filename:
+            tk_index = index
+    app_frames = stack[tk_index + 1:] if tk_index is not None else stack
+    app_frames = [frame for frame in app_frames if "tkinter" not in frame.filename]
+    handler = next((frame.name for frame in app_frames if frame.name not in PASSTHROUGH), None)
+    return handler, describe_frame(stack[-1]) if stack else None
+
+
+class UIWatchdog:
+    def __init__(self, root, interval: float = 0.1, threshold: float = 0.5, history: int = 50,
+                 report_path: str = None, max_stack: int = 40):
+        self.root = root
+        self.interval = interval
+        self.threshold = threshold
+        self.report_path = report_path
+        self.max_stack = max_stack
+        self.lock = threading.Lock()
+        self.reports = deque(maxlen=history)
+        self.last_beat = time.monotonic()
+        self.main_thread_id = threading.main_thread().ident
+        self.stall = None
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self.run, name="ui-watchdog", daemon=True)
+
+    def start(self):
+        self.beat()
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.stopped.set()
+
+    def beat(self):
+        self.last_beat = time.monotonic()
+        if not self.stopped.is_set():
+            self.root.after(int(self.interval * 1000), self.beat)
+
+    def run(self):
+        while not self.stopped.wait(self.interval / 2):
+            lag = time.monotonic() - self.last_beat - self.interval
+            try:
+                if lag > self.threshold:
+                    self.sample(lag)
+                elif self.stall is not None:
+                    self.finish()
+            except Exception as e:
+                print(f"Watchdog error: {str(e)}")
+
+    def capture(self):
+        frame = sys._current_frames().get(self.main_thread_id)
+        if frame is None:
+            return []
+        return traceback.extract_stack(frame)[-self.max_stack:]
+
+    def sample(self, lag: float):
+        stack = self.capture()
+        handler, location = find_handler(stack)
+        if self.stall is None:
+            self.stall = {
+                "started_at": time.time() - lag,
+                "handler": handler,
+                "stack": [describe_frame(frame) for frame in stack],
+                "locations": Counter(),
+            }
+            print(f"UI stall detected: {lag * 1000:.0f}ms in {handler or 'unknown handler'} at {location}")
+        self.stall["lag"] = lag
+        if location:
+            self.stall["locations"][location] += 1
+
+    def finish(self):
+        stall, self.stall = self.stall, None
+        report = {
+            "type": "stall",
+            "at": round(stall["started_at"], 3),
+            "ms": round(stall["lag"] * 1000, 1),
+            "handler": stall["handler"],
+            # Where the main thread was seen during the stall, most frequent first
+            "hot_spots": [{"at": location, "samples": count}
+                          for location, count in stall["locations"].most_common(5)],
+            "stack": stall["stack"],
+        }
+        print(f"UI stall over after {report['ms']:.0f}ms in {report['handler'] or 'unknown handler'}")
+        UI_STALLS.inc(handler=report["handler"] or "unknown")
+        UI_STALL_SECONDS.observe(stall["lag"])
+        REGISTRY.emit(report)
+        with self.lock:
+            self.reports.append(report)
+            reports = list(self.reports)
+        if self.report_path:
+            self.save(reports)
+
+    def save(self, reports):
+        # Stalls are rare, so rewriting the whole ring keeps the file bounded cheaply
+        temp_path = self.report_path + ".tmp"
+        try:
+            with open(temp_path, "w", encoding="utf-8") as f:
+                for report in reports:
+                    f.write(json.dumps(report, separators=(",", ":")) + "\n")
+            os.replace(temp_path, self.report_path)
+        except OSError as e:
+            print(f"Failed to save stall reports: {str(e)}")
+
+    def recent(self):
+        with self.lock:
+            return list(self.reports)
+
+
+def load_reports(path: str):
+    with open(path, encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Print stall reports pulled from a kiosk")
+    parser.add_argument("path", nargs="?", default="stalls.jsonl")
+    parser.add_argument("--stacks", action="store_true", help="include the main thread stack of each stall")
+    args = parser.parse_args()
+
+    for report in load_reports(args.path):
+        started = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(report["at"]))
+        print(f"{started}  {report['ms']:>8.0f}ms  {report['handler'] or 'unknown'}")
+        for spot in report["hot_spots"]:
+            print(f"    {spot['samples']:>4} x {spot['at']}")
+        if args.stacks:
+            for line in report["stack"]:
+                print(f"        {line}")
+
+
+if __name__ == "__main__":
+    main()